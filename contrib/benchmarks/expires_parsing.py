@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# Measures the per-response cost of parsing the Expires header in the API
+# cache, comparing the old approach (switching the global locale to C under a
+# lock and calling strptime) with the locale-independent HTTP date parser.
+#
+# With --threads, the responses are split between several threads, which
+# shows the cost of serializing every response on the locale lock.
+#
+# Usage: expires_parsing.py [--responses N] [--threads N]
+#
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import datetime
+import locale
+import os
+import sys
+import threading
+import time
+from email.utils import formatdate
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from rbtools.api.cache import APICache, parse_http_date
+
+
+_locale_lock = threading.Lock()
+
+
+def parse_with_locale(value):
+    """Return the max-age for an Expires value the way the cache used to."""
+    with _locale_lock:
+        old_locale = locale.setlocale(locale.LC_TIME)
+
+        try:
+            locale.setlocale(locale.LC_TIME, str('C'))
+            expires = datetime.datetime.strptime(value,
+                                                 APICache.EXPIRES_FORMAT)
+            now = datetime.datetime.now()
+
+            if expires < now:
+                return 0
+            else:
+                return (expires - now).seconds
+        finally:
+            locale.setlocale(locale.LC_TIME, old_locale)
+
+
+def parse_http(value):
+    """Return the max-age for an Expires value the way the cache does now."""
+    return max(0, int(parse_http_date(value) - time.time()))
+
+
+def run(parse, value, responses, threads):
+    """Parse the value the given number of times and return the time taken."""
+    def _worker(count):
+        for i in range(count):
+            parse(value)
+
+    workers = [
+        threading.Thread(target=_worker, args=(responses // threads,))
+        for i in range(threads)
+    ]
+
+    start = time.time()
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measures the per-response overhead of parsing the '
+                    'Expires header, before and after removing the locale '
+                    'switching.')
+    parser.add_argument('--responses', type=int, default=100000,
+                        help='The number of responses to parse.')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='The number of threads parsing responses.')
+    options = parser.parse_args()
+
+    value = formatdate(time.time() + 3600, usegmt=True)
+
+    print('Expires: %s' % value)
+    print()
+    print('%-14s %12s' % ('Parser', 'Time (us)'))
+
+    for name, parse in (('locale', parse_with_locale),
+                        ('http-date', parse_http)):
+        elapsed = run(parse, value, options.responses, options.threads)
+
+        print('%-14s %12.2f' % (name, elapsed * 1e6 / options.responses))
+
+
+if __name__ == '__main__':
+    main()
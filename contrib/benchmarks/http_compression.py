@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+#
+# Measures the bytes transferred and the time taken to fetch a large diff
+# the way `rbt patch` does, with and without compressed responses.
+#
+# This runs a local stand-in for a Review Board server (or a compressing
+# proxy in front of one) which gzip-compresses responses when the client
+# accepts them.
+#
+# Usage: http_compression.py [--files N] [--lines N] [--runs N]
+#
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from rbtools.api.client import RBClient
+
+
+def make_diff(num_files, num_lines):
+    """Return a synthetic git-style diff as bytes."""
+    rand = random.Random(0)
+    words = ['self', 'return', 'value', 'request', 'response', 'def',
+             'import', 'if', 'else', 'for', 'in', 'None', 'True', 'result']
+    lines = []
+
+    for i in range(num_files):
+        lines += [
+            'diff --git a/src/module%d.py b/src/module%d.py' % (i, i),
+            'index 1234567..89abcde 100644',
+            '--- a/src/module%d.py' % i,
+            '+++ b/src/module%d.py' % i,
+            '@@ -1,%d +1,%d @@' % (num_lines, num_lines),
+        ]
+
+        for j in range(num_lines):
+            prefix = rand.choice(' +-')
+            lines.append('%s    %s' % (prefix, ' '.join(
+                rand.choice(words) for k in range(8))))
+
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class BenchmarkServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class BenchmarkRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        api_url = 'http://%s:%d/api/' % self.server.server_address
+        diffs_url = api_url + 'review-requests/1/diffs/'
+        path = self.path.split('?', 1)[0]
+
+        if path == '/api/':
+            self._send_json('root', {
+                'uri_templates': {
+                    'diffs': (api_url +
+                              'review-requests/{review_request_id}/diffs/'),
+                },
+                'links': {},
+                'stat': 'ok',
+            })
+        elif path == '/api/review-requests/1/diffs/':
+            self._send_json('diffs', {
+                'diffs': [],
+                'links': {},
+                'total_results': 1,
+                'stat': 'ok',
+            })
+        elif path == '/api/review-requests/1/diffs/1/':
+            if 'text/x-patch' in self.headers.get('Accept', ''):
+                self._send('text/x-patch', self.server.diff)
+            else:
+                self._send_json('diff', {
+                    'diff': {
+                        'id': 1,
+                        'revision': 1,
+                        'links': {
+                            'self': {
+                                'href': diffs_url + '1/',
+                                'method': 'GET',
+                            },
+                        },
+                    },
+                    'stat': 'ok',
+                })
+        else:
+            self._send('application/json', b'{"stat": "fail"}', status=404)
+
+    def _send_json(self, name, payload):
+        self._send('application/vnd.reviewboard.org.%s+json' % name,
+                   json.dumps(payload).encode('utf-8'))
+
+    def _send(self, mime_type, body, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', mime_type)
+
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            self.send_header('Content-Encoding', 'gzip')
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.bytes_sent += len(body)
+
+    def log_message(self, *args, **kwargs):
+        pass
+
+
+def fetch_patch(url, cookie_file, compress_responses):
+    """Fetch the diff the same way as `rbt patch`."""
+    client = RBClient(url, cookie_file=cookie_file, keep_alive=True,
+                      compress_responses=compress_responses)
+
+    try:
+        api_root = client.get_root()
+        diffs = api_root.get_diffs(review_request_id=1)
+        diff = diffs.get_item(diffs.total_results)
+
+        return diff.get_patch().data
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measures the bytes transferred when fetching a large '
+                    'diff, with and without compressed responses.')
+    parser.add_argument('--files', type=int, default=200,
+                        help='The number of files in the diff.')
+    parser.add_argument('--lines', type=int, default=1000,
+                        help='The number of lines per file in the diff.')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='The number of times to fetch the diff.')
+    options = parser.parse_args()
+
+    server = BenchmarkServer(('127.0.0.1', 0), BenchmarkRequestHandler)
+    server.diff = make_diff(options.files, options.lines)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    url = 'http://127.0.0.1:%d/' % server.server_port
+    tempdir = tempfile.mkdtemp()
+    cookie_file = os.path.join(tempdir, 'cookies')
+
+    print('Diff size: %d bytes' % len(server.diff))
+    print()
+    print('%-14s %16s %12s' % ('Mode', 'Bytes on wire', 'Time (ms)'))
+
+    try:
+        for compress_responses in (False, True):
+            server.bytes_sent = 0
+            start = time.time()
+
+            for i in range(options.runs):
+                data = fetch_patch(url, cookie_file, compress_responses)
+                assert data == server.diff
+
+            elapsed = (time.time() - start) / options.runs
+
+            print('%-14s %16d %12.1f' % (
+                compress_responses and 'compressed' or 'uncompressed',
+                server.bytes_sent // options.runs,
+                elapsed * 1000))
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()
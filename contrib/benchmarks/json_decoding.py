@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+#
+# Measures the time taken to decode large API payloads with each installed
+# JSON backend (see rbtools.api.decode.register_json_backend).
+#
+# By default, this decodes generated payloads shaped like a page of review
+# requests (with expand=draft), a page of diff files and the diff_data of a
+# large file. Payloads recorded from a server (e.g. with `curl -H 'Accept:
+# application/json'`) can be decoded instead by passing a directory of
+# *.json files.
+#
+# Usage: json_decoding.py [--payload-dir DIR] [--runs N]
+#
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from rbtools.api.decode import (JSON_BACKENDS, decode_response,
+                                set_json_backend)
+
+
+API_URL = 'http://localhost/api/'
+
+
+def make_links(url, names):
+    """Return the links of a resource at a URL."""
+    links = dict(
+        (name, {
+            'href': '%s%s/' % (url, name.replace('_', '-')),
+            'method': 'GET',
+        })
+        for name in names
+    )
+    links['self'] = {
+        'href': url,
+        'method': 'GET',
+    }
+
+    return links
+
+
+def make_review_request(pk):
+    """Return the payload for a review request, with its draft expanded."""
+    url = '%sreview-requests/%d/' % (API_URL, pk)
+    review_request = {
+        'id': pk,
+        'summary': 'Fix the frobnicator for case %d' % pk,
+        'description': 'This changes how the frobnicator works.\n' * 20,
+        'testing_done': 'Ran the unit tests.\n' * 5,
+        'status': 'pending',
+        'public': True,
+        'branch': 'release-%d.x' % (pk % 5),
+        'bugs_closed': [str(pk * 10 + i) for i in range(3)],
+        'commit_id': '%040x' % pk,
+        'last_updated': '2020-01-01T12:00:00Z',
+        'time_added': '2019-12-31T12:00:00Z',
+        'ship_it_count': pk % 3,
+        'issue_open_count': pk % 2,
+        'text_type': 'markdown',
+        'extra_data': {},
+        'target_people': [
+            {
+                'href': '%susers/user%d/' % (API_URL, i),
+                'method': 'GET',
+                'title': 'user%d' % i,
+            }
+            for i in range(3)
+        ],
+        'links': make_links(url, (
+            'changes', 'diffs', 'draft', 'file_attachments', 'last_update',
+            'latest_diff', 'repository', 'reviews', 'screenshots',
+            'status_updates', 'submitter', 'update', 'delete')),
+    }
+    review_request['draft'] = dict(review_request,
+                                   id=pk + 100000,
+                                   links=make_links(url + 'draft/', (
+                                       'diff_commits', 'draft_diffs',
+                                       'update', 'delete')))
+
+    return review_request
+
+
+def make_file_diff(pk):
+    """Return the payload for a diff file."""
+    url = '%sreview-requests/1/diffs/1/files/%d/' % (API_URL, pk)
+
+    return {
+        'id': pk,
+        'source_file': 'src/module%d/file%d.py' % (pk // 10, pk),
+        'dest_file': 'src/module%d/file%d.py' % (pk // 10, pk),
+        'source_revision': '%040x' % pk,
+        'dest_detail': '%040x' % (pk + 1),
+        'status': 'modified',
+        'extra_data': {
+            'raw_insert_count': pk % 50,
+            'raw_delete_count': pk % 20,
+            'insert_count': pk % 50,
+            'delete_count': pk % 20,
+            'replace_count': pk % 10,
+            'equal_count': 500,
+            'is_symlink': False,
+        },
+        'links': make_links(url, (
+            'dest_attachment', 'diff_comments', 'original_file',
+            'patched_file', 'source_file')),
+    }
+
+
+def make_diff_data(num_lines):
+    """Return the payload for the diff_data of a large file."""
+    chunks = []
+    line = 1
+
+    while line < num_lines:
+        lines = []
+
+        for i in range(100):
+            lines.append([
+                line, line, '    value = compute(%d)' % line, [],
+                line, line, '    value = compute(%d)' % (line + 1),
+                [[19, 24]], False,
+            ])
+            line += 1
+
+        chunks.append({
+            'change': 'replace' if len(chunks) % 2 else 'equal',
+            'collapsable': len(chunks) % 2 == 0,
+            'index': len(chunks),
+            'lines': lines,
+            'meta': {
+                'whitespace_chunk': False,
+                'whitespace_lines': [],
+            },
+            'numlines': len(lines),
+        })
+
+    return {
+        'diff_data': {
+            'binary': False,
+            'changed_chunk_indexes': list(range(1, len(chunks), 2)),
+            'chunks': chunks,
+            'new_file': False,
+            'num_changes': len(chunks) // 2,
+        },
+        'stat': 'ok',
+    }
+
+
+def make_list(name, items):
+    """Return the payload for a page of a list resource."""
+    return {
+        name: items,
+        'links': make_links('%s%s/' % (API_URL, name), ('create',)),
+        'total_results': len(items) * 10,
+        'stat': 'ok',
+    }
+
+
+def get_generated_payloads():
+    """Return the generated payloads, as (name, bytes) tuples."""
+    payloads = [
+        ('review-requests', make_list('review_requests', [
+            make_review_request(pk)
+            for pk in range(1, 201)
+        ])),
+        ('diff-files', make_list('files', [
+            make_file_diff(pk)
+            for pk in range(1, 201)
+        ])),
+        ('diff-data', make_diff_data(20000)),
+    ]
+
+    return [
+        (name, json.dumps(payload).encode('utf-8'))
+        for name, payload in payloads
+    ]
+
+
+def get_recorded_payloads(payload_dir):
+    """Return the recorded payloads in a directory, as (name, bytes)."""
+    payloads = []
+
+    for path in sorted(glob.glob(os.path.join(payload_dir, '*.json'))):
+        with open(path, 'rb') as f:
+            payloads.append((os.path.basename(path), f.read()))
+
+    return payloads
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measures the time taken to decode large API payloads '
+                    'with each installed JSON backend.')
+    parser.add_argument('--payload-dir',
+                        help='A directory of recorded JSON payloads to '
+                             'decode, rather than the generated ones.')
+    parser.add_argument('--runs', type=int, default=10,
+                        help='The number of times to decode each payload.')
+    options = parser.parse_args()
+
+    if options.payload_dir:
+        payloads = get_recorded_payloads(options.payload_dir)
+    else:
+        payloads = get_generated_payloads()
+
+    backends = []
+
+    for name in JSON_BACKENDS:
+        try:
+            set_json_backend(name)
+        except ImportError:
+            print('%s is not installed' % name)
+            continue
+
+        backends.append(name)
+
+    print()
+    print('%-20s %10s %s' % (
+        'Payload', 'Size (KB)',
+        ''.join('%12s' % ('%s (ms)' % name) for name in backends)))
+
+    for payload_name, payload in payloads:
+        timings = []
+
+        for backend in backends:
+            set_json_backend(backend)
+            start = time.time()
+
+            for i in range(options.runs):
+                decode_response(payload, 'application/json')
+
+            timings.append((time.time() - start) / options.runs)
+
+        print('%-20s %10.1f %s' % (
+            payload_name, len(payload) / 1024.0,
+            ''.join('%12.2f' % (timing * 1000) for timing in timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+#
+# Measures the time and memory taken to construct the item resources of a
+# large list resource, the way `for item in review_requests.all_items` does.
+#
+# Each item has the links of a review request item payload, so this shows
+# the cost of the methods generated for those links. The read-only records
+# returned by `all_records` are measured as well.
+#
+# Usage: resource_construction.py [--items N] [--runs N]
+#
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from rbtools.api.factory import create_resource
+from rbtools.api.transport import Transport
+
+
+ITEM_LINKS = (
+    'changes', 'diff_context', 'diffs', 'draft', 'file_attachments',
+    'last_update', 'latest_diff', 'repository', 'reviews', 'screenshots',
+    'status_updates', 'submitter', 'target_groups', 'target_people',
+)
+
+
+class BenchmarkTransport(Transport):
+    """A transport which never makes requests."""
+
+    def __init__(self):
+        super(BenchmarkTransport, self).__init__(None)
+
+
+def make_item(url, pk):
+    """Return the payload for a review request in a list."""
+    item_url = '%s%d/' % (url, pk)
+    links = dict(
+        (name, {
+            'href': '%s%s/' % (item_url, name),
+            'method': 'GET',
+        })
+        for name in ITEM_LINKS
+    )
+    links.update({
+        'self': {
+            'href': item_url,
+            'method': 'GET',
+        },
+        'update': {
+            'href': item_url,
+            'method': 'PUT',
+        },
+        'delete': {
+            'href': item_url,
+            'method': 'DELETE',
+        },
+    })
+
+    return {
+        'id': pk,
+        'summary': 'Review request %d' % pk,
+        'status': 'pending',
+        'public': True,
+        'links': links,
+    }
+
+
+def make_payload(num_items):
+    """Return the payload for a list of review requests."""
+    url = 'http://localhost/api/review-requests/'
+
+    return {
+        'review_requests': [
+            make_item(url, pk)
+            for pk in range(1, num_items + 1)
+        ],
+        'links': {
+            'self': {
+                'href': url,
+                'method': 'GET',
+            },
+        },
+        'total_results': num_items,
+        'stat': 'ok',
+    }
+
+
+def get_list_resource(transport, payload):
+    """Return the list resource for the payload."""
+    return create_resource(
+        transport, payload, payload['links']['self']['href'],
+        mime_type='application/vnd.reviewboard.org.review-requests+json',
+        item_mime_type='application/vnd.reviewboard.org.review-request+json')
+
+
+def construct_items(transport, payload):
+    """Construct every item resource in the list and return them."""
+    return list(get_list_resource(transport, payload))
+
+
+def construct_records(transport, payload):
+    """Construct a record for every item in the list and return them."""
+    return list(get_list_resource(transport, payload).records)
+
+
+def measure(func, transport, payload, runs):
+    """Return the average time taken by a function, and its memory usage."""
+    start = time.time()
+
+    for i in range(runs):
+        func(transport, payload)
+
+    elapsed = (time.time() - start) / runs
+
+    tracemalloc.start()
+    result = func(transport, payload)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return result, elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measures the time and memory taken to construct the '
+                    'item resources of a large list resource.')
+    parser.add_argument('--items', type=int, default=10000,
+                        help='The number of items in the list.')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='The number of times to construct the items.')
+    options = parser.parse_args()
+
+    transport = BenchmarkTransport()
+    payload = make_payload(options.items)
+
+    items, elapsed, size = measure(construct_items, transport, payload,
+                                   options.runs)
+    records, records_elapsed, records_size = measure(
+        construct_records, transport, payload, options.runs)
+
+    start = time.time()
+
+    for item in items:
+        item.get_reviews(internal=True)
+
+    link_elapsed = time.time() - start
+
+    print('Items: %d' % options.items)
+    print()
+    print('Construction time:  %10.1f ms' % (elapsed * 1000))
+    print('Memory for items:   %10.1f KB' % (size / 1024.0))
+    print('Calling a link:     %10.1f ms' % (link_elapsed * 1000))
+    print()
+    print('Record time:        %10.1f ms' % (records_elapsed * 1000))
+    print('Memory for records: %10.1f KB' % (records_size / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
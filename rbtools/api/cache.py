@@ -1,25 +1,36 @@
 from __future__ import print_function, unicode_literals
 
+import atexit
+import calendar
 import contextlib
+import copy
 import datetime
+import hashlib
 import json
-import locale
 import logging
 import os
+import shutil
 import sqlite3
+import tempfile
 import threading
+import time
+import weakref
+from collections import OrderedDict
+from email.utils import parsedate_tz
+from io import BytesIO
 
 import six
+from six.moves.urllib.error import HTTPError, URLError
+from six.moves.urllib.parse import urlparse, urlunparse
 from six.moves.urllib.request import urlopen
 
+from rbtools.api.instrumentation import get_current_timing
 from rbtools.utils.appdirs import user_cache_dir
 from rbtools.utils.process import die
 
 
 MINIMUM_VERSION = '2.0.14'  # Minimum server version to enable the API cache.
 
-_locale_lock = threading.Lock()  # Lock for getting / setting locale.
-
 
 class CacheEntry(object):
     """An entry in the API Cache."""
@@ -27,8 +38,17 @@ class CacheEntry(object):
     DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'  # ISO Date format
 
     def __init__(self, url, vary_headers, max_age, etag, local_date,
-                 last_modified, mime_type, item_mime_type, response_body):
-        """Create a new cache entry."""
+                 last_modified, mime_type, item_mime_type, response_body,
+                 load_response_body=None, status=200):
+        """Create a new cache entry.
+
+        If response_body is None, load_response_body may be a function that
+        loads it when it's first accessed. It returns None if the body is no
+        longer available.
+
+        The status is the HTTP status of the response. Entries for error
+        responses (see APICache.NEGATIVE_TTL) have an error status.
+        """
         self.url = url
         self.vary_headers = vary_headers
         self.max_age = max_age
@@ -37,7 +57,23 @@ class CacheEntry(object):
         self.last_modified = last_modified
         self.mime_type = mime_type
         self.item_mime_type = item_mime_type
-        self.response_body = response_body
+        self._response_body = response_body
+        self._load_response_body = load_response_body
+        self.status = status
+
+    @property
+    def response_body(self):
+        """The body of the cached response."""
+        if self._load_response_body is not None:
+            self._response_body = self._load_response_body()
+            self._load_response_body = None
+
+        return self._response_body
+
+    @response_body.setter
+    def response_body(self, response_body):
+        self._response_body = response_body
+        self._load_response_body = None
 
     def matches_request(self, request):
         """Determine if the cache entry matches the given request.
@@ -52,10 +88,14 @@ class CacheEntry(object):
 
         return True
 
-    def up_to_date(self):
-        """Determine if the cache entry is up to date."""
+    def up_to_date(self, max_stale=0):
+        """Determine if the cache entry is up to date.
+
+        If max_stale is given, the entry is also considered up to date if it
+        expired less than that many seconds ago.
+        """
         if self.max_age is not None:
-            max_age = datetime.timedelta(seconds=self.max_age)
+            max_age = datetime.timedelta(seconds=self.max_age + max_stale)
             return self.local_date + max_age > datetime.datetime.now()
 
         return True
@@ -117,74 +157,72 @@ class CachedHTTPResponse(object):
         return 200
 
 
-class APICache(object):
-    """An API cache backed by a SQLite database."""
-    # The format for the Expires: header. Requires an English locale.
+class BaseAPICache(object):
+    """The base class for HTTP caches for the API.
+
+    This implements the HTTP caching rules: which responses are cached,
+    when they're used, and how they're revalidated (see
+    :ref:`python-api-overview`). Subclasses store the entries, by
+    implementing _is_available, _get_entry, _save_entry, _delete_entry,
+    invalidate, _clear_negative_entries and flush.
+    """
+    # The format for the Expires: header, as produced by Review Board.
+    # Parsing accepts any RFC 7231 date format (see parse_http_date).
     EXPIRES_FORMAT = '%a, %d %b %Y %H:%M:%S %Z'
 
-    CACHE_DIR = user_cache_dir('rbtools')
-    CACHE_PATH = os.path.join(CACHE_DIR, 'apicache.db')
+    # The number of seconds to wait for background revalidations when the
+    # cache is closed.
+    REVALIDATE_TIMEOUT = 10
 
-    # The API Cache's schema version. If the schema is updated, update this
-    # value.
-    SCHEMA_VERSION = 2
+    # The number of seconds error responses are cached for, and the API
+    # error codes of the error responses to cache: "Object does not exist"
+    # and "Repository information could not be retrieved".
+    NEGATIVE_TTL = 60
+    NEGATIVE_ERROR_CODES = set([100, 210])
 
-    def __init__(self, create_db_in_memory=False, urlopen=urlopen):
-        """Create a new instance of the APICache
+    def __init__(self, urlopen=urlopen, stale_while_revalidate=0,
+                 offline=False):
+        """Initialize the cache.
 
-        If the db_path is provided, it will be used as the path to the SQLite
-        database; otherwise, the default cache (in the CACHE_DIR) will be used.
-        The urlopen parameter determines the method that is used to open URLs.
+        The urlopen parameter determines the method that is used to open
+        URLs. The stale_while_revalidate and offline parameters control
+        when expired entries are used.
         """
         self.urlopen = urlopen
+        self.stale_while_revalidate = stale_while_revalidate
+        self.offline = offline
 
-        if create_db_in_memory:
-            self.db = sqlite3.connect(':memory:')
-            self._create_schema()
-        else:
-            try:
-                cache_exists = os.path.exists(self.CACHE_PATH)
-                create_schema = True
+        # The cache may be shared by several threads (for instance, by the
+        # worker threads of an asynchronous transport), so access to the
+        # stored entries is serialized through this lock.
+        self._lock = threading.RLock()
 
-                if not cache_exists:
-                    if not os.path.exists(self.CACHE_DIR):
-                        logging.debug("Cache directory '%s' does not exist; "
-                                      "creating.",
-                                      self.CACHE_DIR)
-                        os.makedirs(self.CACHE_DIR)
+        # The background revalidations in progress. This maps (url,
+        # vary_key) keys to their threads.
+        self._revalidations = {}
 
-                    logging.debug("API cache '%s' does not exist; creating.",
-                                  self.CACHE_PATH)
+    def flush(self):
+        """Commit all buffered writes to the storage."""
+        raise NotImplementedError
 
-                self.db = sqlite3.connect(self.CACHE_PATH)
+    def close(self):
+        """Close the cache.
 
-                if cache_exists:
-                    try:
-                        with contextlib.closing(self.db.cursor()) as c:
-                            c.execute('SELECT version FROM cache_info')
-                            row = c.fetchone()
+        Background revalidations still in progress are given up to
+        REVALIDATE_TIMEOUT seconds to finish first. Subclasses then commit
+        their writes and release their storage.
+        """
+        with self._lock:
+            threads = list(six.itervalues(self._revalidations))
 
-                            if row and row[0] == self.SCHEMA_VERSION:
-                                create_schema = False
-                    except sqlite3.Error as e:
-                        self._die('Could not get the HTTP cache schema '
-                                  'version', e)
+        deadline = time.time() + self.REVALIDATE_TIMEOUT
 
-                if create_schema:
-                    self._create_schema()
-            except (OSError, sqlite3.Error) as e:
-                # OSError will be thrown if we cannot create the directory or
-                # file for the API cache. sqlite3.Error will be thrown if
-                # connect fails. In either case, HTTP requests can still be
-                # made, they will just passed through to the URL opener without
-                # attempting to interact with the API cache.
-                logging.warn("Could not create or access API cache '%s'. Try "
-                             "running 'rbt clear-cache' to clear the HTTP "
-                             "cache for the API.",
-                             self.CACHE_PATH)
+        for thread in threads:
+            thread.join(max(deadline - time.time(), 0))
 
-        if self.db is not None:
-            self.db.row_factory = APICache._row_factory
+    def invalidate(self, url):
+        """Invalidate the entries for a URL and the lists containing it."""
+        raise NotImplementedError
 
     def make_request(self, request):
         """Perform the specified request.
@@ -194,71 +232,57 @@ class APICache(object):
         execute the request and a CachedResponse (if our entry is still up to
         date) or a Response (if it is not) will be returned.
         """
-        if self.db is None or request.method != 'GET':
-            # We can only cache HTTP GET requests and only if we were able to
-            # access the API cache database.
+        if self.offline:
+            return self._make_offline_request(request)
+
+        if not self._is_available():
+            # We can only use the cache if we were able to access the API
+            # cache database.
             return self.urlopen(request)
 
+        if request.method != 'GET':
+            # We can only cache HTTP GET requests. If a request changing
+            # data succeeds, the cached errors and the entries for what it
+            # changed are no longer valid.
+            response = self.urlopen(request)
+            self._clear_negative_entries()
+            self.invalidate(request.get_full_url())
+
+            return response
+
         entry = self._get_entry(request)
 
+        if entry and entry.status != 200:
+            if entry.up_to_date():
+                logging.debug('Cached error response for HTTP GET %s up to '
+                              'date',
+                              request.get_full_url())
+                self._record_outcome('negative')
+                raise self._make_http_error(request, entry)
+
+            # Expired errors can't be revalidated, so they're requested
+            # again from scratch.
+            entry = None
+
         if entry:
             if entry.up_to_date():
                 logging.debug('Cached response for HTTP GET %s up to date',
                               request.get_full_url())
+                self._record_outcome('hit')
+                response = CachedHTTPResponse(entry)
+            elif (self.stale_while_revalidate and
+                  entry.up_to_date(self.stale_while_revalidate) and
+                  entry.response_body is not None):
+                logging.debug('Cached response for HTTP GET %s expired; '
+                              'revalidating in the background',
+                              request.get_full_url())
+                self._record_outcome('stale')
+                self._revalidate_in_background(request, entry)
                 response = CachedHTTPResponse(entry)
             else:
-                if entry.etag:
-                    request.add_header(b'If-None-Match', entry.etag)
-
-                if entry.last_modified:
-                    request.add_header(b'If-Modified-Since',
-                                       entry.last_modified)
-
-                response = HTTPResponse(self.urlopen(request))
-
-                if response.getcode() == 304:
-                    logging.debug('Cached response for HTTP GET %s expired '
-                                  'and was not modified',
-                                  request.get_full_url())
-                    entry.local_date = datetime.datetime.now()
-                    self._save_entry(entry)
-                    response = CachedHTTPResponse(entry)
-                elif 200 <= response.getcode() < 300:
-                    logging.debug('Cached response for HTTP GET %s expired '
-                                  'and was modified',
-                                  request.get_full_url())
-                    response_headers = response.info()
-                    cache_info = self._get_caching_info(request.headers,
-                                                        response_headers)
-
-                    if cache_info:
-                        entry.max_age = cache_info['max_age']
-                        entry.etag = cache_info['etag']
-                        entry.local_date = datetime.datetime.now()
-                        entry.last_modified = cache_info['last_modified']
-
-                        entry.mime_type = response_headers['Content-Type']
-                        entry.item_mime_type = \
-                            response_headers.get('Item-Content-Type')
-                        entry.response_body = response.read()
-
-                        if entry.vary_headers != cache_info['vary_headers']:
-                            # The Vary: header has changed since the last time
-                            # we retrieved the resource so we need to remove
-                            # the old cache entry and save the new one.
-                            self._delete_entry(entry)
-                            entry.vary_headers = cache_info['vary_headers']
-
-                        self._save_entry(entry)
-                    else:
-                        # This resource is no longer cache-able so we should
-                        # delete our cached version.
-                        logging.debug('Cached response for HTTP GET request '
-                                      'to %s is no longer cacheable',
-                                      request.get_full_url())
-                        self._delete_entry(entry)
+                response = self._revalidate(request, entry)
         else:
-            response = HTTPResponse(self.urlopen(request))
+            response = HTTPResponse(self._urlopen_caching_errors(request))
             response_headers = response.info()
 
             cache_info = self._get_caching_info(request.headers,
@@ -278,13 +302,282 @@ class APICache(object):
 
                 logging.debug('Added cache entry for HTTP GET request to %s',
                               request.get_full_url())
-
+                self._record_outcome('miss')
             else:
                 logging.debug('HTTP GET request to %s cannot be cached',
                               request.get_full_url())
+                self._record_outcome('uncacheable')
+
+        return response
+
+    def save_response(self, request, response):
+        """Store a response to a request made without the cache.
+
+        This keeps responses fetched before the cache is enabled (such as
+        the root resource) available in offline mode. The entry is stored as
+        already expired, so it's revalidated before being used online.
+        Responses which can't be cached are skipped.
+
+        This returns a response which can still be read.
+        """
+        response = HTTPResponse(response)
+        response_headers = response.info()
+        cache_info = self._get_caching_info(request.headers,
+                                            response_headers)
+
+        if (cache_info is not None and
+            request.get_method() == 'GET' and
+            self._is_available()):
+            self._save_entry(CacheEntry(
+                request.get_full_url(),
+                cache_info['vary_headers'],
+                0,
+                cache_info['etag'],
+                datetime.datetime.now(),
+                cache_info['last_modified'],
+                response_headers.get('Content-Type'),
+                response_headers.get('Item-Content-Type'),
+                response.read()))
+
+            logging.debug('Stored the response to HTTP GET request to %s '
+                          'for offline mode',
+                          request.get_full_url())
+
+        return response
+
+    def _revalidate(self, request, entry):
+        """Revalidate an expired entry with the server.
+
+        A conditional request is made, and the entry is updated (or
+        deleted, if the response can no longer be cached) according to the
+        response, which is returned.
+        """
+        if entry.etag:
+            request.add_header(str('If-None-Match'), entry.etag)
+
+        if entry.last_modified:
+            request.add_header(str('If-Modified-Since'), entry.last_modified)
+
+        response = HTTPResponse(self._urlopen_caching_errors(request))
+
+        if response.getcode() == 304 and entry.response_body is None:
+            # The entry was removed from the database (probably by another
+            # process) before its body was loaded, so the full response has
+            # to be requested again.
+            logging.debug('Cached response for HTTP GET %s is no longer '
+                          'available',
+                          request.get_full_url())
+            self._delete_entry(entry)
+
+            request.headers.pop(str('If-none-match'), None)
+            request.headers.pop(str('If-modified-since'), None)
+
+            return self.make_request(request)
+        elif response.getcode() == 304:
+            logging.debug('Cached response for HTTP GET %s expired and was '
+                          'not modified',
+                          request.get_full_url())
+            self._update_entry_metadata(request, entry, response.info())
+            entry.local_date = datetime.datetime.now()
+            self._save_entry(entry)
+            self._record_outcome('revalidated')
+            response = CachedHTTPResponse(entry)
+        elif 200 <= response.getcode() < 300:
+            logging.debug('Cached response for HTTP GET %s expired and was '
+                          'modified',
+                          request.get_full_url())
+            response_headers = response.info()
+            cache_info = self._get_caching_info(request.headers,
+                                                response_headers)
+
+            if cache_info:
+                entry.max_age = cache_info['max_age']
+                entry.etag = cache_info['etag']
+                entry.local_date = datetime.datetime.now()
+                entry.last_modified = cache_info['last_modified']
+
+                entry.mime_type = response_headers['Content-Type']
+                entry.item_mime_type = \
+                    response_headers.get('Item-Content-Type')
+                entry.response_body = response.read()
+
+                if entry.vary_headers != cache_info['vary_headers']:
+                    # The Vary: header has changed since the last time we
+                    # retrieved the resource so we need to remove the old
+                    # cache entry and save the new one.
+                    self._delete_entry(entry)
+                    entry.vary_headers = cache_info['vary_headers']
+
+                self._save_entry(entry)
+                self._record_outcome('updated')
+            else:
+                # This resource is no longer cache-able so we should delete
+                # our cached version.
+                logging.debug('Cached response for HTTP GET request to %s '
+                              'is no longer cacheable',
+                              request.get_full_url())
+                self._delete_entry(entry)
+                self._record_outcome('uncacheable')
 
         return response
 
+    def _update_entry_metadata(self, request, entry, response_headers):
+        """Update an entry with the headers of a 304 Not Modified response.
+
+        The server may send new caching headers with a 304 response, which
+        replace the ones stored for the entry. Headers it leaves out are
+        kept as they were.
+        """
+        if (response_headers.get('Cache-Control') or
+            response_headers.get('Expires') or
+            response_headers.get('Pragma')):
+            cache_info = self._get_caching_info(request.headers,
+                                                response_headers)
+
+            if cache_info:
+                entry.max_age = cache_info['max_age']
+
+        if response_headers.get('ETag'):
+            entry.etag = response_headers['ETag']
+
+        if response_headers.get('Last-Modified'):
+            entry.last_modified = response_headers['Last-Modified']
+
+    def _urlopen_caching_errors(self, request):
+        """Open a URL, caching the error response if it's a cacheable one.
+
+        Error responses are raised as an HTTPError, as usual. If the error
+        can be cached, it's saved as an entry that expires in NEGATIVE_TTL
+        seconds, or sooner if the response's max-age is shorter. Errors sent
+        with no-store or no-cache are never cached.
+        """
+        try:
+            return self.urlopen(request)
+        except HTTPError as e:
+            body = e.read()
+            error_code = None
+
+            try:
+                error_code = json.loads(body.decode('utf-8'))['err']['code']
+            except (AttributeError, KeyError, TypeError, ValueError):
+                # This isn't an API error.
+                pass
+
+            headers = e.info()
+
+            if e.code == 404 or error_code in self.NEGATIVE_ERROR_CODES:
+                caching_info = self._get_caching_info(request.headers,
+                                                      headers)
+            else:
+                caching_info = None
+
+            # Negative entries can't be revalidated, so responses which must
+            # be (with no-cache) are skipped along with no-store ones.
+            if caching_info is not None and caching_info['max_age'] != 0:
+                max_age = self.NEGATIVE_TTL
+
+                if caching_info['max_age'] is not None:
+                    max_age = min(max_age, caching_info['max_age'])
+
+                logging.debug('Added cache entry for the HTTP %d error '
+                              'response to HTTP GET request to %s',
+                              e.code, request.get_full_url())
+                self._save_entry(CacheEntry(
+                    url=request.get_full_url(),
+                    vary_headers=caching_info['vary_headers'],
+                    max_age=max_age,
+                    etag=None,
+                    local_date=datetime.datetime.now(),
+                    last_modified=None,
+                    mime_type=headers.get('Content-Type'),
+                    item_mime_type=None,
+                    response_body=body,
+                    status=e.code))
+
+            # The body of the original error has been read, so a new one
+            # is raised with the body that was read.
+            raise HTTPError(request.get_full_url(), e.code, e.msg, headers,
+                            BytesIO(body))
+
+    def _make_http_error(self, request, entry):
+        """Return an HTTPError for an entry for an error response."""
+        return HTTPError(request.get_full_url(), entry.status,
+                         'HTTP error %d' % entry.status,
+                         {'Content-Type': entry.mime_type},
+                         BytesIO(entry.response_body or b''))
+
+    def _revalidate_in_background(self, request, entry):
+        """Revalidate an expired entry with the server in a new thread.
+
+        Nothing is done if the entry is already being revalidated.
+        """
+        key = (entry.url, self._make_vary_key(entry.vary_headers))
+
+        # The caller keeps using the request and the entry, so the
+        # revalidation works on copies of them.
+        request = copy.copy(request)
+        request.headers = dict(request.headers)
+        request.unredirected_hdrs = dict(request.unredirected_hdrs)
+        entry = copy.copy(entry)
+
+        def _revalidate():
+            try:
+                self._revalidate(request, entry)
+            except Exception as e:
+                logging.debug('Could not revalidate the cached response for '
+                              'HTTP GET %s: %s',
+                              request.get_full_url(), e)
+            finally:
+                with self._lock:
+                    del self._revalidations[key]
+
+        with self._lock:
+            if key in self._revalidations:
+                return
+
+            thread = threading.Thread(target=_revalidate)
+            thread.daemon = True
+            self._revalidations[key] = thread
+
+        thread.start()
+
+    def _make_offline_request(self, request):
+        """Answer a request from the cache, without contacting the server.
+
+        Cached entries are used no matter how old they are. If there's no
+        entry for the request, or it isn't a GET request, a URLError is
+        raised.
+        """
+        if request.method != 'GET':
+            raise URLError('HTTP %s requests cannot be made in offline mode'
+                           % request.method)
+
+        entry = None
+
+        if self._is_available():
+            entry = self._get_entry(request)
+
+        if entry is None or entry.response_body is None:
+            raise URLError('%s is not in the cache (offline mode)'
+                           % request.get_full_url())
+
+        if entry.status != 200:
+            self._record_outcome('offline')
+            raise self._make_http_error(request, entry)
+
+        logging.debug('Cached response for HTTP GET %s used in offline mode',
+                      request.get_full_url())
+        self._record_outcome('offline')
+
+        return CachedHTTPResponse(entry)
+
+    def _record_outcome(self, outcome):
+        """Record the cache outcome in the timing of the current request."""
+        timing = get_current_timing()
+
+        if timing is not None:
+            timing.cache_outcome = outcome
+
     def _get_caching_info(self, request_headers, response_headers):
         """Get the caching info for the response to the given request.
 
@@ -297,42 +590,20 @@ class APICache(object):
         expires = response_headers.get('Expires')
 
         if expires:
-            # We switch to the C locale to parse the 'Expires' header because
-            # the formatting specifiers are locale specific and the header
-            # *must* be provided in English. After parsing the header, we
-            # restore the locale to the user's previous locale.
-            #
-            # We also note that changing the locale is not thread-safe so we
-            # use a lock around this.
-            with _locale_lock:
-                old_locale = locale.setlocale(locale.LC_TIME)
-
-                try:
-                    # 'setlocale' requires the second parameter to be a 'str'
-                    # in both Python 2.x and Python 3+.
-                    locale.setlocale(locale.LC_TIME, str('C'))
-                    expires = datetime.datetime.strptime(expires,
-                                                         self.EXPIRES_FORMAT)
-
-                    # We assign to max_age because the value of max-age in the
-                    # Cache-Control header overrides the behaviour of the
-                    # 'Expires' header.
-                    now = datetime.datetime.now()
-
-                    if expires < now:
-                        max_age = 0
-                    else:
-                        max_age = (expires - now).seconds
-                except ValueError:
-                    logging.error("The format of the 'Expires' header (value "
-                                  "%s) does not match the expected format.",
-                                  expires)
-                except locale.Error:
-                    logging.error("The C locale is unavailable on this "
-                                  "system. The 'Expires' header cannot be "
-                                  "parsed.")
-                finally:
-                    locale.setlocale(locale.LC_TIME, old_locale)
+            # We assign to max_age because the value of max-age in the
+            # Cache-Control header overrides the behaviour of the 'Expires'
+            # header.
+            expires = parse_http_date(expires)
+
+            if expires is None:
+                # RFC 7234 requires an invalid Expires date (such as "0") to
+                # be treated as already expired.
+                logging.debug("The 'Expires' header (value %s) is not a "
+                              "valid HTTP date.",
+                              response_headers.get('Expires'))
+                max_age = 0
+            else:
+                max_age = max(0, int(expires - time.time()))
 
         # The value of the Cache-Control header is a list of comma separated
         # values. We only care about some of them, notably max-age, no-cache,
@@ -364,18 +635,8 @@ class APICache(object):
 
         etag = response_headers.get('ETag')
         last_modified = response_headers.get('Last-Modified')
-        vary_headers = response_headers.get('Vary')
-
-        # The Vary header specifies a list of headers that *may* alter the
-        # returned response. The cached response can only be used when these
-        # headers have the same value as those provided in the request.
-        if vary_headers:
-            vary_headers = dict(
-                (header, request_headers.get(header))
-                for header in self._split_csv(vary_headers)
-            )
-        else:
-            vary_headers = {}
+        vary_headers = self._get_vary_headers(request_headers,
+                                              response_headers)
 
         if no_cache:
             # If no-cache is specified, the resource must always be requested,
@@ -395,160 +656,864 @@ class APICache(object):
             'vary_headers': vary_headers
         }
 
-    def _create_schema(self):
-        """Create the schema for the API cache database."""
+    def _get_vary_headers(self, request_headers, response_headers):
+        """Return the request headers the response varies on.
+
+        The Vary header specifies a list of headers that *may* alter the
+        returned response. The cached response can only be used when these
+        headers have the same value as those provided in the request.
+        """
+        vary_headers = response_headers.get('Vary')
+
+        if not vary_headers:
+            return {}
+
+        return dict(
+            (header, request_headers.get(header))
+            for header in self._split_csv(vary_headers)
+        )
+
+    def _is_available(self):
+        """Return whether entries can be stored and looked up."""
+        raise NotImplementedError
+
+    def _get_entry(self, request):
+        """Return the stored entry matching a request, or None."""
+        raise NotImplementedError
+
+    def _save_entry(self, entry):
+        """Store an entry, replacing the one for the same request."""
+        raise NotImplementedError
+
+    def _delete_entry(self, entry):
+        """Delete a stored entry."""
+        raise NotImplementedError
+
+    def _clear_negative_entries(self):
+        """Remove all entries for error responses."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _make_vary_key(vary_headers):
+        """Return the vary key for a dictionary of Vary headers.
+
+        The key is the same for equal dictionaries, regardless of the order
+        of their headers.
+        """
+        return json.dumps(vary_headers, sort_keys=True)
+
+    def _split_csv(self, csvline):
+        """Split a line of comma-separated values into a list."""
+        return [
+            s.strip()
+            for s in csvline.split(',')
+        ]
+
+
+class APICache(BaseAPICache):
+    """An API cache backed by a SQLite database.
+
+    Writes are buffered and committed together when the cache is flushed or
+    closed. The least recently used entries are evicted once the cache is
+    larger than max_size bytes or max_entries entries.
+    """
+    CACHE_DIR = user_cache_dir('rbtools')
+    CACHE_PATH = os.path.join(CACHE_DIR, 'apicache.db')
+
+    # The API Cache's schema version. If the schema is updated, update this
+    # value.
+    SCHEMA_VERSION = 5
+
+    # The number of seconds to wait for another process to release its lock
+    # on the database.
+    BUSY_TIMEOUT = 30
+
+    # The number of buffered writes that causes them to be committed before
+    # the cache is closed.
+    MAX_PENDING_WRITES = 100
+
+    # The default limits on the size of the cache.
+    DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+    DEFAULT_MAX_ENTRIES = 10000
+
+    # The fraction of the limits the cache is reduced to when evicting.
+    EVICTION_TARGET = 0.9
+
+    # The limits on the entries kept in memory.
+    MEMORY_MAX_ENTRIES = 256
+    MEMORY_MAX_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, create_db_in_memory=False, urlopen=urlopen,
+                 db_path=None, max_size=DEFAULT_MAX_SIZE,
+                 max_entries=DEFAULT_MAX_ENTRIES, stale_while_revalidate=0,
+                 offline=False):
+        """Create a new instance of the APICache
+
+        If the db_path is provided, it will be used as the path to the SQLite
+        database; otherwise, the default cache (in the CACHE_DIR) will be used.
+        The urlopen parameter determines the method that is used to open URLs.
+        The max_size and max_entries parameters limit the size of the cache.
+        Either can be None for no limit. The stale_while_revalidate and
+        offline parameters control when expired entries are used.
+        """
+        super(APICache, self).__init__(
+            urlopen=urlopen,
+            stale_while_revalidate=stale_while_revalidate,
+            offline=offline)
+
+        self.db = None
+        self.db_path = db_path or self.CACHE_PATH
+        self.max_size = max_size
+        self.max_entries = max_entries
+
+        # Writes which haven't been committed yet, as a dictionary mapping
+        # each URL to a dictionary of the vary keys and the entries to save
+        # (or None, for entries to delete).
+        self._pending = {}
+        self._pending_count = 0
+
+        # Whether the error responses in the database should be deleted on
+        # the next flush.
+        self._clear_negative = False
+
+        # The URLs (without query strings) whose entries in the database
+        # should be deleted on the next flush.
+        self._invalidated = set()
+
+        # The times that entries in the database were last used, which
+        # haven't been committed yet. This maps (url, vary_key) keys to
+        # timestamps.
+        self._accessed = {}
+
+        # The in-memory tier. This maps each URL to a dictionary mapping the
+        # vary keys to a tuple of the entry and its size. The most recently
+        # used URLs are last.
+        self._memory = OrderedDict()
+        self._memory_size = 0
+
+        # The sets of Vary header names used by the entries in the database,
+        # as sorted tuples.
+        self._vary_names = set()
+
+        if create_db_in_memory:
+            self.db = sqlite3.connect(':memory:', check_same_thread=False,
+                                      isolation_level=None)
+            self._init_schema()
+        else:
+            try:
+                cache_dir = os.path.dirname(self.db_path)
+
+                if not os.path.exists(self.db_path):
+                    if not os.path.exists(cache_dir):
+                        logging.debug("Cache directory '%s' does not exist; "
+                                      "creating.",
+                                      cache_dir)
+                        os.makedirs(cache_dir)
+
+                    logging.debug("API cache '%s' does not exist; creating.",
+                                  self.db_path)
+
+                # Transactions are managed explicitly (see _transaction), so
+                # that they're only held open while writing.
+                self.db = sqlite3.connect(self.db_path,
+                                          timeout=self.BUSY_TIMEOUT,
+                                          check_same_thread=False,
+                                          isolation_level=None)
+
+                with contextlib.closing(self.db.cursor()) as c:
+                    c.execute('PRAGMA journal_mode=WAL')
+
+                    if c.fetchone()[0].lower() != 'wal':
+                        # This happens on filesystems without the shared
+                        # memory support that WAL needs. The default
+                        # journal still works, with less concurrency.
+                        logging.debug('Could not enable WAL mode for the '
+                                      'API cache')
+
+                    # In WAL mode, this only syncs the log at checkpoints.
+                    # A power loss may lose the last writes, but can't
+                    # corrupt the database, which is fine for a cache.
+                    c.execute('PRAGMA synchronous=NORMAL')
+
+                self._init_schema()
+            except (OSError, sqlite3.Error) as e:
+                # OSError will be thrown if we cannot create the directory or
+                # file for the API cache. sqlite3.Error will be thrown if
+                # connect fails. In either case, HTTP requests can still be
+                # made, they will just passed through to the URL opener without
+                # attempting to interact with the API cache.
+                logging.warn("Could not create or access API cache '%s'. Try "
+                             "running 'rbt clear-cache' to clear the HTTP "
+                             "cache for the API.",
+                             self.db_path)
+                self.db = None
+
+        if self.db is not None:
+            self._load_vary_names()
+
+            # Make sure buffered writes are committed even if the cache is
+            # never explicitly closed.
+            atexit.register(_flush_cache, weakref.ref(self))
+
+    def flush(self):
+        """Commit all buffered writes to the database.
+
+        This is done in a single transaction. If the database can't be
+        written to (for instance, because another process held a lock on
+        it for longer than BUSY_TIMEOUT), the buffered writes are dropped,
+        since the cache will simply be filled again later.
+        """
+        with self._lock:
+            pending = self._pending
+            accessed = self._accessed
+            clear_negative = self._clear_negative
+            invalidated = self._invalidated
+            self._pending = {}
+            self._pending_count = 0
+            self._accessed = {}
+            self._clear_negative = False
+            self._invalidated = set()
+
+            if ((not pending and not accessed and not clear_negative and
+                 not invalidated) or
+                self.db is None):
+                return
+
+            now = time.time()
+
+            try:
+                with self._transaction() as c:
+                    if clear_negative:
+                        c.execute('DELETE FROM api_cache WHERE status <> 200')
+
+                    # This deletes the entries for each URL, and for the URL
+                    # followed by any query string (that is, between
+                    # "<url>?" and "<url>@" in sort order).
+                    c.executemany(
+                        'DELETE FROM api_cache '
+                        'WHERE url=? OR (url >= ? AND url < ?)',
+                        [
+                            (url, url + '?', url + '@')
+                            for url in invalidated
+                        ])
+
+                    c.executemany(
+                        'UPDATE api_cache SET last_access=? '
+                        'WHERE url=? AND vary_key=?',
+                        [
+                            (last_access, url, vary_key)
+                            for (url, vary_key), last_access
+                            in six.iteritems(accessed)
+                        ])
+
+                    for url, entries in six.iteritems(pending):
+                        for vary_key, entry in six.iteritems(entries):
+                            if entry is None:
+                                c.execute('DELETE FROM api_cache '
+                                          'WHERE url=? AND vary_key=?',
+                                          (url, vary_key))
+                            else:
+                                self._write_entry(c, entry, vary_key, now)
+
+                    if pending:
+                        self._evict(c)
+            except sqlite3.Error as e:
+                logging.warning('Could not write to the HTTP cache for the '
+                                'API: %s', e)
+
+    def close(self):
+        """Commit all buffered writes and close the database.
+
+        Background revalidations still in progress are given up to
+        REVALIDATE_TIMEOUT seconds to finish first.
+        """
+        super(APICache, self).close()
+
+        with self._lock:
+            if self.db is not None:
+                self.flush()
+                self.db.close()
+                self.db = None
+
+    def invalidate(self, url):
+        """Invalidate the entries for a URL and the lists containing it.
+
+        The entries are removed from memory and from the buffered writes
+        right away, and deleted from the database on the next flush.
+        """
+        urls = self._get_invalidated_urls(url)
+
+        logging.debug('Invalidating cache entries for %s',
+                      ', '.join(sorted(urls)))
+
+        with self._lock:
+            for cached_url in list(self._memory.keys()):
+                if cached_url.split('?', 1)[0] in urls:
+                    for vary_key in list(self._memory[cached_url].keys()):
+                        self._remove_from_memory(cached_url, vary_key)
+
+            for cached_url in list(self._pending.keys()):
+                if cached_url.split('?', 1)[0] in urls:
+                    del self._pending[cached_url]
+
+            self._invalidated.update(urls)
+
+    def _get_invalidated_urls(self, url):
+        """Return the URLs to invalidate after a change to a URL.
+
+        This is the URL without its query string, and each of its parent
+        URLs below the API root.
+        """
+        url_parts = urlparse(url)
+        path = url_parts.path
+        urls = set()
+
+        while path.strip('/') and not path.endswith('/api/'):
+            urls.add(urlunparse(url_parts[:2] + (path, '', '', '')))
+            path = path.rstrip('/').rsplit('/', 1)[0] + '/'
+
+        return urls
+
+    def _clear_negative_entries(self):
+        """Remove all entries for error responses.
+
+        They're removed from memory and from the buffered writes right
+        away, and deleted from the database on the next flush.
+        """
+        with self._lock:
+            for url, entries in list(six.iteritems(self._memory)):
+                for vary_key, (entry, size) in list(six.iteritems(entries)):
+                    if entry.status != 200:
+                        self._remove_from_memory(url, vary_key)
+
+            for url, entries in six.iteritems(self._pending):
+                for vary_key, entry in list(six.iteritems(entries)):
+                    if entry is not None and entry.status != 200:
+                        del entries[vary_key]
+
+            self._clear_negative = True
+
+    def _is_available(self):
+        """Return whether entries can be stored and looked up."""
+        return self.db is not None
+
+    def _init_schema(self):
+        """Create the schema for the API cache database, if needed.
+
+        The schema is (re)created if the database is new or was created for
+        a different SCHEMA_VERSION. This happens in a single transaction, so
+        that other processes opening the cache at the same time never see a
+        partially-created schema.
+
+        The version is checked without a write transaction first, so that
+        opening a cache with a current schema never waits for the write
+        lock. It's checked again once the lock is held, in case another
+        process created the schema in the meantime.
+        """
         try:
-            with contextlib.closing(self.db.cursor()) as c:
-                c.execute('DROP TABLE IF EXISTS api_cache')
-                c.execute('DROP TABLE IF EXISTS cache_info')
-
-                c.execute('''CREATE TABLE api_cache(
-                                 url            TEXT,
-                                 vary_headers   TEXT,
-                                 max_age        INTEGER,
-                                 etag           TEXT,
-                                 local_date     TEXT,
-                                 last_modified  TEXT,
-                                 mime_type      TEXT,
-                                 item_mime_type TEXT,
-                                 response_body  BLOB,
-                                 PRIMARY KEY(url, vary_headers)
-                             )''')
-
-                c.execute('CREATE TABLE cache_info(version INTEGER)')
-
-                c.execute('INSERT INTO cache_info(version) VALUES(?)',
-                          (self.SCHEMA_VERSION,))
-
-            self._write_db()
+            with self._lock:
+                with contextlib.closing(self.db.cursor()) as c:
+                    if self._has_current_schema(c):
+                        return
+
+            with self._transaction() as c:
+                if not self._has_current_schema(c):
+                    self._create_schema(c)
         except sqlite3.Error as e:
             self._die('Could not create database schema for the HTTP cache', e)
 
+    def _has_current_schema(self, c):
+        """Return whether the database has the schema for SCHEMA_VERSION."""
+        try:
+            c.execute('SELECT version FROM cache_info')
+            row = c.fetchone()
+        except sqlite3.OperationalError:
+            # The cache_info table doesn't exist yet.
+            return False
+
+        return bool(row) and row[0] == self.SCHEMA_VERSION
+
+    def _create_schema(self, c):
+        """Create the schema for the API cache database."""
+        c.execute('DROP TABLE IF EXISTS api_cache')
+        c.execute('DROP TABLE IF EXISTS cache_info')
+
+        c.execute('''CREATE TABLE api_cache(
+                         url            TEXT,
+                         vary_names     TEXT,
+                         vary_key       TEXT,
+                         max_age        INTEGER,
+                         etag           TEXT,
+                         local_date     REAL,
+                         last_modified  TEXT,
+                         mime_type      TEXT,
+                         item_mime_type TEXT,
+                         response_body  BLOB,
+                         last_access    REAL,
+                         size           INTEGER,
+                         status         INTEGER,
+                         PRIMARY KEY(url, vary_key)
+                     )''')
+
+        # This index covers the queries used for eviction.
+        c.execute('CREATE INDEX api_cache_last_access '
+                  'ON api_cache(last_access, size)')
+
+        # This index covers the query for the sets of Vary header names.
+        c.execute('CREATE INDEX api_cache_vary_names '
+                  'ON api_cache(vary_names)')
+
+        c.execute('CREATE TABLE cache_info(version INTEGER)')
+
+        c.execute('INSERT INTO cache_info(version) VALUES(?)',
+                  (self.SCHEMA_VERSION,))
+
+    @contextlib.contextmanager
+
+    def _transaction(self):
+        """Run statements in a write transaction.
+
+        This yields a cursor. The transaction takes the database's write
+        lock right away (waiting up to BUSY_TIMEOUT seconds for other
+        processes to release it), and is committed when the block exits,
+        or rolled back if it raises an exception.
+        """
+        with self._lock:
+            with contextlib.closing(self.db.cursor()) as c:
+                c.execute('BEGIN IMMEDIATE')
+
+                try:
+                    yield c
+                except Exception:
+                    c.execute('ROLLBACK')
+                    raise
+                else:
+                    c.execute('COMMIT')
+
     def _get_entry(self, request):
         """Find an entry in the API cache store that matches the request.
 
-        If no such cache entry exists, this returns None.
+        Writes that haven't been committed yet take precedence over the
+        entries in memory, which take precedence over the entries in the
+        database. If no such cache entry exists, this returns None.
         """
         url = request.get_full_url()
 
+        with self._lock:
+            pending = self._pending.get(url, {})
+
+            for entry in six.itervalues(pending):
+                if entry is not None and entry.matches_request(request):
+                    return entry
+
+            entries = self._memory.pop(url, None)
+
+            if entries is not None:
+                # Mark the URL as the most recently used one.
+                self._memory[url] = entries
+
+                for vary_key, (entry, size) in six.iteritems(entries):
+                    if entry.matches_request(request):
+                        self._accessed[(url, vary_key)] = time.time()
+
+                        return entry
+
+            # Each set of Vary header names gives one possible key for an
+            # entry matching the request. Entries with pending writes have
+            # already been checked.
+            vary_keys = set(
+                self._make_vary_key(dict(
+                    (header, request.headers.get(header))
+                    for header in vary_names
+                ))
+                for vary_names in self._vary_names
+            ).difference(pending)
+
+            if not vary_keys:
+                return None
+
+            try:
+                with contextlib.closing(self.db.cursor()) as c:
+                    # The response body is only read if the entry is up to
+                    # date, since otherwise it may not be needed at all.
+                    c.execute(
+                        'SELECT url, vary_key, max_age, etag, local_date, '
+                        '       last_modified, mime_type, item_mime_type, '
+                        '       CASE WHEN max_age IS NULL OR '
+                        '                 local_date + max_age > ? '
+                        '            THEN response_body END, '
+                        '       status '
+                        'FROM api_cache '
+                        'WHERE url=? AND vary_key IN (%s) '
+                        'LIMIT 1'
+                        % ','.join('?' * len(vary_keys)),
+                        [time.time(), url] + list(vary_keys))
+                    row = c.fetchone()
+            except sqlite3.Error as e:
+                self._die('Could not retrieve an entry from the HTTP cache', e)
+
+            if (row is None or
+                (self._clear_negative and row[9] != 200) or
+                url.split('?', 1)[0] in self._invalidated):
+                # Entries in the database are ignored once they've been
+                # cleared or invalidated, even before they've been deleted.
+                return None
+
+            vary_key = row[1]
+            self._accessed[(url, vary_key)] = time.time()
+
+            if row[8] is None:
+                return self._make_entry(
+                    row,
+                    lambda: self._load_response_body(url, vary_key))
+
+            entry = self._make_entry(row)
+            self._add_to_memory(entry, vary_key)
+
+            return entry
+
+    def _load_response_body(self, url, vary_key):
+        """Load the response body of an entry in the database.
+
+        This returns None if the entry is no longer in the database.
+        """
+        with self._lock:
+            if self.db is None:
+                return None
+
+            try:
+                with contextlib.closing(self.db.cursor()) as c:
+                    c.execute('SELECT response_body FROM api_cache '
+                              'WHERE url=? AND vary_key=?',
+                              (url, vary_key))
+                    row = c.fetchone()
+            except sqlite3.Error as e:
+                self._die('Could not retrieve an entry from the HTTP cache', e)
+
+        if row is None or row[0] is None:
+            return None
+
+        return six.binary_type(row[0])
+
+    def _load_vary_names(self):
+        """Load the sets of Vary header names used in the database."""
         try:
             with contextlib.closing(self.db.cursor()) as c:
-                for row in c.execute('SELECT * FROM api_cache WHERE url=?',
-                                     (url,)):
-                    if row.matches_request(request):
-                        return row
+                self._vary_names = set(
+                    tuple(json.loads(row[0]))
+                    for row in c.execute('SELECT DISTINCT vary_names '
+                                         'FROM api_cache')
+                )
         except sqlite3.Error as e:
-            self._die('Could not retrieve an entry from the HTTP cache', e)
-
-        return None
+            self._die('Could not read from the HTTP cache', e)
 
     def _save_entry(self, entry):
         """Save the entry into the store.
 
-        If the entry already exists in the store, do an UPDATE; otherwise do an
-        INSERT. This does not commit to the database.
+        The entry is kept in memory, and the write to the database is
+        buffered until the next flush.
         """
-        vary_headers = json.dumps(entry.vary_headers)
-        local_date = entry.local_date.strftime(entry.DATE_FORMAT)
+        vary_key = self._make_vary_key(entry.vary_headers)
 
-        try:
-            with contextlib.closing(self.db.cursor()) as c:
-                try:
-                    c.execute('''INSERT INTO api_cache (url,
-                                                        vary_headers,
-                                                        max_age,
-                                                        etag,
-                                                        local_date,
-                                                        last_modified,
-                                                        mime_type,
-                                                        item_mime_type,
-                                                        response_body)
-                                 VALUES(?,?,?,?,?,?,?,?,?)''',
-                              (entry.url, vary_headers, entry.max_age,
-                               entry.etag, local_date, entry.last_modified,
-                               entry.mime_type, entry.item_mime_type,
-                               sqlite3.Binary(entry.response_body)))
-                except sqlite3.IntegrityError:
-                    c.execute('''UPDATE api_cache
-                                 SET max_age=?,
-                                     etag=?,
-                                     local_date=?,
-                                     last_modified=?,
-                                     mime_type=?,
-                                     item_mime_type=?,
-                                     response_body=?
-                                 WHERE url=? AND vary_headers=?''',
-                              (entry.max_age, entry.etag, local_date,
-                               entry.last_modified, entry.mime_type,
-                               entry.item_mime_type,
-                               sqlite3.Binary(entry.response_body), entry.url,
-                               vary_headers))
-
-            self._write_db()
-        except sqlite3.Error as e:
-            self._die('Could not write entry to the HTTP cache for the API', e)
+        with self._lock:
+            self._vary_names.add(tuple(sorted(entry.vary_headers)))
+            self._add_to_memory(entry, vary_key)
+            self._add_pending(entry.url, vary_key, entry)
 
     def _delete_entry(self, entry):
-        """Remove the entry from the store."""
-        try:
-            with contextlib.closing(self.db.cursor()) as c:
-                c.execute(
-                    'DELETE FROM api_cache WHERE URL=? AND vary_headers=?',
-                    (entry.url, json.dumps(entry.vary_headers)))
+        """Remove the entry from the store.
 
-            self._write_db()
-        except sqlite3.Error as e:
-            self._die('Could not delete entry from the HTTP cache for the API',
-                      e)
+        The entry is removed from memory, and the write to the database is
+        buffered until the next flush.
+        """
+        vary_key = self._make_vary_key(entry.vary_headers)
+
+        with self._lock:
+            self._remove_from_memory(entry.url, vary_key)
+            self._add_pending(entry.url, vary_key, None)
+
+    def _add_to_memory(self, entry, vary_key):
+        """Keep an entry in memory, evicting old entries if needed."""
+        url = entry.url
+        size = len(entry.response_body)
+
+        if size > self.MEMORY_MAX_SIZE:
+            self._remove_from_memory(url, vary_key)
+            return
+
+        self._remove_from_memory(url, vary_key)
+        entries = self._memory.pop(url, {})
+        entries[vary_key] = (entry, size)
+        self._memory[url] = entries
+        self._memory_size += size
+
+        while (len(self._memory) > self.MEMORY_MAX_ENTRIES or
+               self._memory_size > self.MEMORY_MAX_SIZE):
+            old_url, old_entries = self._memory.popitem(last=False)
+
+            for old_entry, old_size in six.itervalues(old_entries):
+                self._memory_size -= old_size
+
+    def _remove_from_memory(self, url, vary_key):
+        """Remove an entry from memory, if it's there."""
+        entries = self._memory.get(url)
+
+        if entries and vary_key in entries:
+            entry, size = entries.pop(vary_key)
+            self._memory_size -= size
+
+            if not entries:
+                del self._memory[url]
+
+    def _add_pending(self, url, vary_key, entry):
+        """Buffer a write, flushing the buffer if it's full."""
+        with self._lock:
+            self._pending.setdefault(url, {})[vary_key] = entry
+            self._pending_count += 1
+
+            if self._pending_count >= self.MAX_PENDING_WRITES:
+                self.flush()
+
+    def _write_entry(self, c, entry, vary_key, last_access):
+        """Insert or replace an entry in the database."""
+        response_body = entry.response_body
+
+        c.execute('''INSERT OR REPLACE INTO api_cache (url,
+                                                     vary_names,
+                                                     vary_key,
+                                                     max_age,
+                                                     etag,
+                                                     local_date,
+                                                     last_modified,
+                                                     mime_type,
+                                                     item_mime_type,
+                                                     response_body,
+                                                     last_access,
+                                                     size,
+                                                     status)
+                     VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)''',
+                  (entry.url,
+                   json.dumps(sorted(entry.vary_headers)),
+                   vary_key,
+                   entry.max_age,
+                   entry.etag,
+                   datetime_to_timestamp(entry.local_date),
+                   entry.last_modified,
+                   entry.mime_type,
+                   entry.item_mime_type,
+                   sqlite3.Binary(response_body),
+                   last_access,
+                   len(response_body),
+                   entry.status))
+
+    def _evict(self, c):
+        """Evict the least recently used entries if the cache is too big."""
+        c.execute('SELECT COUNT(*), TOTAL(size) FROM api_cache')
+        num_entries, size = c.fetchone()
+        max_entries = self.max_entries
+        max_size = self.max_size
+
+        if ((max_entries is None or num_entries <= max_entries) and
+            (max_size is None or size <= max_size)):
+            return
+
+        if max_entries is not None:
+            max_entries = int(max_entries * self.EVICTION_TARGET)
+
+        if max_size is not None:
+            max_size = max_size * self.EVICTION_TARGET
+
+        evicted = []
+
+        for rowid, entry_size in c.execute('SELECT rowid, size '
+                                           'FROM api_cache '
+                                           'ORDER BY last_access'):
+            if ((max_entries is None or num_entries <= max_entries) and
+                (max_size is None or size <= max_size)):
+                break
+
+            evicted.append((rowid,))
+            num_entries -= 1
+            size -= entry_size
+
+        logging.debug('Evicting %d entries from the HTTP cache for the API',
+                      len(evicted))
+        c.executemany('DELETE FROM api_cache WHERE rowid=?', evicted)
 
     @staticmethod
-    def _row_factory(cursor, row):
-        """A factory for creating individual Cache Entries from db rows."""
+    def _make_entry(row, load_response_body=None):
+        """Create a CacheEntry from a row returned by _get_entry."""
+        response_body = row[8]
+
+        if response_body is not None:
+            response_body = six.binary_type(response_body)
+
         return CacheEntry(
             url=row[0],
             vary_headers=json.loads(row[1]),
             max_age=row[2],
             etag=row[3],
-            local_date=datetime.datetime.strptime(row[4],
-                                                  CacheEntry.DATE_FORMAT),
+            local_date=datetime.datetime.fromtimestamp(row[4]),
             last_modified=row[5],
             mime_type=row[6],
             item_mime_type=row[7],
-            response_body=six.binary_type(row[8]),
+            response_body=response_body,
+            load_response_body=load_response_body,
+            status=row[9],
         )
 
-    def _write_db(self):
-        """Flush the contents of the DB to the disk."""
-        if self.db:
-            try:
-                self.db.commit()
-            except sqlite3.Error as e:
-                logging.error("Could not write database to disk: %s. Try "
-                              "running 'rbt clear-cache' to manually clear "
-                              "the HTTP cache for the API.",
-                              e)
-                die()
-
     def _die(self, msg, e):
         """Remove the connection to the database and print an error message."""
-        self.db = None  # So that _write_db doesn't cause an exception
+        self.db = None  # So that flush doesn't cause an exception
+        self._pending = {}
         logging.error("%s: %s. Try running 'rbt clear-cache' to manually "
                       "clear the HTTP cache for the API.",
                       msg, e)
         die()
 
-    def _split_csv(self, csvline):
-        """Split a line of comma-separated values into a list."""
-        return [
-            s.strip()
-            for s in csvline.split(',')
-        ]
+
+class ResourceCache(object):
+    """A persistent cache of API payloads which rarely change.
+
+    This keeps the decoded payloads of a few resources (such as the root
+    resource) for ttl seconds, so that commands run within that time don't
+    need to request them from the server at all. Unlike the APICache, which
+    follows the caching headers sent by the server, entries are never
+    revalidated, so this should only be used for resources where being out
+    of date by up to ttl seconds is acceptable.
+
+    The entries for each server and identity are stored together in a JSON
+    file in CACHE_DIR. The identity names the account the payloads were
+    fetched with (such as a username), since they differ between accounts.
+    """
+    CACHE_DIR = os.path.join(APICache.CACHE_DIR, 'resources')
+
+    def __init__(self, server_url, identity=None, ttl=0, cache_dir=None):
+        """Create a new ResourceCache for a server and identity."""
+        self.ttl = ttl
+        self.cache_dir = cache_dir or self.CACHE_DIR
+
+        key = '%s\n%s' % (server_url, identity or '')
+        self.path = os.path.join(
+            self.cache_dir,
+            '%s.json' % hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def get(self, url):
+        """Return the cached payload for a URL, or None.
+
+        The payload is a dictionary with the decoded ``payload`` and the
+        ``mime_type`` and ``item_mime_type`` of the response.
+        """
+        with self._lock:
+            entry = self._load().get(url)
+
+        if entry is None or entry.get('expires', 0) <= time.time():
+            return None
+
+        return entry
+
+    def set(self, url, payload, mime_type, item_mime_type=None):
+        """Cache the payload for a URL for the next ttl seconds."""
+        with self._lock:
+            entries = self._load()
+            entries[url] = {
+                'payload': payload,
+                'mime_type': mime_type,
+                'item_mime_type': item_mime_type,
+                'expires': time.time() + self.ttl,
+            }
+            self._save(entries)
+
+    def clear(self):
+        """Remove all entries for the server and identity."""
+        with self._lock:
+            self._entries = {}
+
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def _load(self):
+        """Load the entries from disk, if they haven't been yet."""
+        if self._entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            except (IOError, OSError, ValueError):
+                self._entries = {}
+
+        return self._entries
+
+    def _save(self, entries):
+        """Write the entries to disk.
+
+        The file is replaced atomically, so that other processes never read
+        a partially written file.
+        """
+        try:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir)
+
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+
+            os.rename(temp_path, self.path)
+        except (IOError, OSError) as e:
+            logging.debug('Could not write the resource cache %s: %s',
+                          self.path, e)
+
+
+def parse_http_date(value):
+    """Return the POSIX timestamp for an HTTP date, or None if invalid.
+
+    This accepts the three formats allowed by RFC 7231 (IMF-fixdate, the
+    obsolete RFC 850 format and asctime) without depending on the current
+    locale, so it's safe to call from multiple threads.
+    """
+    parsed = parsedate_tz(value)
+
+    if parsed is None:
+        return None
+
+    try:
+        # Dates without a zone (asctime) are in UTC.
+        return calendar.timegm(parsed[:6]) - (parsed[9] or 0)
+    except (OverflowError, ValueError):
+        return None
+
+
+def datetime_to_timestamp(date):
+    """Return the POSIX timestamp for a local datetime."""
+    return time.mktime(date.timetuple()) + date.microsecond / 1e6
+
+
+def _flush_cache(cache_ref):
+    """Flush an APICache at exit, if it still exists."""
+    cache = cache_ref()
+
+    if cache is not None:
+        cache.flush()
 
 
 def clear_cache():
     """Delete the HTTP cache used for the API."""
     try:
+        if os.path.exists(ResourceCache.CACHE_DIR):
+            shutil.rmtree(ResourceCache.CACHE_DIR)
+
         os.unlink(APICache.CACHE_PATH)
+
+        # Remove the write-ahead log and its index along with the database.
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(APICache.CACHE_PATH + suffix):
+                os.unlink(APICache.CACHE_PATH + suffix)
+
         print("Cleared cache in '%s'" % APICache.CACHE_PATH)
     except Exception as e:
         logging.error("Could not clear cache in '%s': %s. Try manually "
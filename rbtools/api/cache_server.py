@@ -0,0 +1,526 @@
+"""A server sharing one API cache between many RBTools processes.
+
+Normally, every RBTools command opens the SQLite database of the API cache
+itself. On hosts running many commands at the same time, they each look up
+and revalidate the same resources (such as the root resource, capabilities
+and repository lists) separately.
+
+:py:class:`APICacheServer` owns the API cache instead, and answers lookups
+from :py:class:`RemoteAPICache` clients over a Unix socket. When several
+clients need the same URL fetched or revalidated at the same time, only the
+first one is asked to contact the Review Board server, and the others wait
+for its result.
+
+Requests to the Review Board server are always made by the clients, with
+their own credentials. The server only stores and hands out responses, with
+the same Vary header matching as a local API cache.
+"""
+
+from __future__ import unicode_literals
+
+import datetime
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+import six
+from six.moves.socketserver import (StreamRequestHandler, TCPServer,
+                                    ThreadingMixIn)
+from six.moves.urllib.request import urlopen
+
+from rbtools.api.cache import (APICache, BaseAPICache, CacheEntry,
+                                datetime_to_timestamp)
+
+
+class _CacheRequest(object):
+    """A request looked up in the API cache on behalf of a client.
+
+    This provides the parts of a urllib2 request that the API cache uses to
+    find matching entries.
+    """
+    method = 'GET'
+
+    def __init__(self, url, headers):
+        self.url = url
+        self.headers = headers
+
+    def get_full_url(self):
+        return self.url
+
+
+def _write_message(f, message, body=None):
+    """Write a message to a file object for a socket.
+
+    Messages are a line of JSON, optionally followed by a body of bytes.
+    """
+    if body is not None:
+        message = dict(message, body_length=len(body))
+
+    f.write(json.dumps(message).encode('utf-8') + b'\n')
+
+    if body is not None:
+        f.write(body)
+
+    f.flush()
+
+
+def _read_message(f):
+    """Read a message from a file object for a socket.
+
+    This returns a tuple of the message and its body (or None if it has no
+    body). The message is None if the connection was closed.
+    """
+    line = f.readline()
+
+    if not line:
+        return None, None
+
+    message = json.loads(line.decode('utf-8'))
+    body = None
+
+    if 'body_length' in message:
+        body_length = message.pop('body_length')
+        body = f.read(body_length)
+
+        if len(body) != body_length:
+            raise IOError('The connection was closed in the middle of a '
+                          'message')
+
+    return message, body
+
+
+def _serialize_entry(entry):
+    """Return the message data and body for a CacheEntry."""
+    return {
+        'url': entry.url,
+        'vary_headers': entry.vary_headers,
+        'max_age': entry.max_age,
+        'etag': entry.etag,
+        'local_date': datetime_to_timestamp(entry.local_date),
+        'last_modified': entry.last_modified,
+        'mime_type': entry.mime_type,
+        'item_mime_type': entry.item_mime_type,
+        'status': entry.status,
+    }, entry.response_body
+
+
+def _deserialize_entry(data, body):
+    """Return a CacheEntry for message data and a body."""
+    return CacheEntry(
+        url=data['url'],
+        vary_headers=data['vary_headers'],
+        max_age=data['max_age'],
+        etag=data['etag'],
+        local_date=datetime.datetime.fromtimestamp(data['local_date']),
+        last_modified=data['last_modified'],
+        mime_type=data['mime_type'],
+        item_mime_type=data['item_mime_type'],
+        response_body=body,
+        status=data.get('status', 200))
+
+
+class _APICacheRequestHandler(StreamRequestHandler):
+    """Handles the messages sent by one RemoteAPICache connection."""
+
+    def handle(self):
+        try:
+            while True:
+                message, body = _read_message(self.rfile)
+
+                if message is None:
+                    break
+
+                response, response_body = self.server.handle_message(
+                    self, message, body)
+                _write_message(self.wfile, response, response_body)
+        except (IOError, KeyError, ValueError, socket.error) as e:
+            logging.debug('Closing API cache connection: %s', e)
+        finally:
+            self.server.release_leases(self)
+
+
+class APICacheServer(ThreadingMixIn, TCPServer):
+    """A server sharing an API cache between processes over a Unix socket.
+
+    Clients send these messages:
+
+    ``get``:
+        Look up the entry matching a URL and request headers. If there's
+        no up-to-date entry, the client is given a lease on the URL, which
+        means it should fetch or revalidate it and ``save`` the result.
+        While a client holds the lease, other clients asking for the URL
+        wait (up to LEASE_TIMEOUT seconds) for the result.
+
+    ``save``:
+        Save an entry, and release the client's lease on its URL.
+
+    ``delete``:
+        Delete an entry.
+
+    ``release``:
+        Release the client's lease on a URL, without saving anything (for
+        instance, because the response couldn't be cached). Leases are
+        also released when a client disconnects.
+
+    ``clear_negative``:
+        Delete all entries for error responses.
+
+    ``invalidate``:
+        Invalidate the entries for a URL and the lists containing it.
+
+    Writes to the API cache are committed every FLUSH_INTERVAL seconds.
+    """
+    SOCKET_PATH = os.path.join(APICache.CACHE_DIR, 'apicache.sock')
+
+    # The number of seconds a client waits for another one to fetch a URL.
+    LEASE_TIMEOUT = 30
+
+    # The number of seconds between commits of the cache's writes.
+    FLUSH_INTERVAL = 5
+
+    address_family = getattr(socket, 'AF_UNIX', None)
+    daemon_threads = True
+
+    def __init__(self, socket_path=SOCKET_PATH, cache=None):
+        """Create the server, listening on the given socket path.
+
+        The optional cache parameter is the APICache to share. By default,
+        the default API cache is used.
+        """
+        if self.address_family is None:
+            raise IOError('Unix sockets are not supported on this system')
+
+        if os.path.exists(socket_path):
+            # A server that exited uncleanly leaves its socket behind. It
+            # can be replaced, unless another server is still listening.
+            if self._is_listening(socket_path):
+                raise IOError('Another API cache server is listening on %s'
+                              % socket_path)
+
+            os.unlink(socket_path)
+        elif not os.path.exists(os.path.dirname(socket_path)):
+            os.makedirs(os.path.dirname(socket_path), 0o700)
+
+        self.socket_path = socket_path
+        self.cache = cache or APICache()
+
+        # The clients holding leases on URLs. This maps each URL to the
+        # request handler for the client's connection.
+        self._leases = {}
+        self._leases_changed = threading.Condition()
+
+        self._closed = threading.Event()
+        self._flush_thread = threading.Thread(target=self._flush_periodically)
+        self._flush_thread.daemon = True
+
+        # Only the user running the server can use the cache. The socket is
+        # created with these permissions, so that other users can't connect
+        # before they're set.
+        old_umask = os.umask(0o077)
+
+        try:
+            TCPServer.__init__(self, socket_path, _APICacheRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+        os.chmod(socket_path, 0o600)
+
+        self._flush_thread.start()
+
+    def close(self):
+        """Stop accepting connections, and commit the cache's writes."""
+        self._closed.set()
+        self.server_close()
+        self.cache.close()
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def handle_message(self, handler, message, body):
+        """Handle a message from a client.
+
+        This returns a tuple of the response and its body.
+        """
+        op = message.get('op')
+
+        if op == 'get':
+            entry, lease = self.get_entry(handler, message['url'],
+                                          message['headers'])
+
+            if entry is None:
+                return {'entry': None, 'lease': lease}, None
+
+            data, response_body = _serialize_entry(entry)
+
+            return {'entry': data, 'lease': lease}, response_body
+        elif op == 'save':
+            entry = _deserialize_entry(message['entry'], body)
+            self.cache._save_entry(entry)
+            self.release_lease(handler, entry.url)
+        elif op == 'delete':
+            self.cache._delete_entry(CacheEntry(
+                url=message['url'],
+                vary_headers=message['vary_headers'],
+                max_age=None,
+                etag=None,
+                local_date=None,
+                last_modified=None,
+                mime_type=None,
+                item_mime_type=None,
+                response_body=None))
+        elif op == 'release':
+            self.release_lease(handler, message['url'])
+        elif op == 'clear_negative':
+            self.cache._clear_negative_entries()
+        elif op == 'invalidate':
+            self.cache.invalidate(message['url'])
+        else:
+            return {'error': 'Unknown operation %r' % op}, None
+
+        return {'ok': True}, None
+
+    def get_entry(self, handler, url, headers):
+        """Look up an entry for a client.
+
+        This returns a tuple of the entry (or None) and whether the client
+        was given the lease on the URL.
+        """
+        if not self.cache._is_available():
+            return None, False
+
+        request = _CacheRequest(url, headers)
+        deadline = time.time() + self.LEASE_TIMEOUT
+
+        with self._leases_changed:
+            while True:
+                entry = self.cache._get_entry(request)
+
+                if entry is not None and entry.response_body is None:
+                    entry = None
+
+                if entry is not None and entry.up_to_date():
+                    return entry, False
+
+                owner = self._leases.get(url)
+                timeout = deadline - time.time()
+
+                if owner is None or owner is handler or timeout <= 0:
+                    self._leases[url] = handler
+
+                    return entry, True
+
+                self._leases_changed.wait(timeout)
+
+    def release_lease(self, handler, url):
+        """Release a client's lease on a URL, if it holds it."""
+        with self._leases_changed:
+            if self._leases.get(url) is handler:
+                del self._leases[url]
+                self._leases_changed.notify_all()
+
+    def release_leases(self, handler):
+        """Release all of a client's leases."""
+        with self._leases_changed:
+            for url, owner in list(six.iteritems(self._leases)):
+                if owner is handler:
+                    del self._leases[url]
+
+            self._leases_changed.notify_all()
+
+    def _flush_periodically(self):
+        """Commit the cache's writes every FLUSH_INTERVAL seconds."""
+        while not self._closed.wait(self.FLUSH_INTERVAL):
+            self.cache.flush()
+
+    def _is_listening(self, socket_path):
+        """Return whether a server is listening on a socket path."""
+        s = socket.socket(self.address_family, socket.SOCK_STREAM)
+
+        try:
+            s.connect(socket_path)
+
+            return True
+        except socket.error:
+            return False
+        finally:
+            s.close()
+
+
+class RemoteAPICache(BaseAPICache):
+    """An API cache stored by an APICacheServer.
+
+    This works like :py:class:`rbtools.api.cache.APICache`, except that
+    entries are looked up and stored through the server listening on
+    socket_path, rather than in a local database. Each thread uses its own
+    connection to the server.
+
+    A socket.error is raised if the server can't be reached when the cache
+    is created. If the connection fails later, requests are passed through
+    to urlopen without using the cache.
+    """
+    def __init__(self, socket_path=APICacheServer.SOCKET_PATH,
+                 urlopen=urlopen, stale_while_revalidate=0, offline=False):
+        super(RemoteAPICache, self).__init__(
+            urlopen=urlopen,
+            stale_while_revalidate=stale_while_revalidate,
+            offline=offline)
+
+        self.socket_path = socket_path
+        self._local = threading.local()
+        self._connections = []
+        self._failed = False
+
+        self._get_connection()
+
+    def flush(self):
+        """Do nothing, since the server commits all writes."""
+        pass
+
+    def close(self):
+        """Close all connections to the server.
+
+        Background revalidations still in progress are given up to
+        REVALIDATE_TIMEOUT seconds to finish first.
+        """
+        super(RemoteAPICache, self).close()
+
+        with self._lock:
+            for sock, rfile, wfile, leases in self._connections:
+                try:
+                    rfile.close()
+                    wfile.close()
+                except (IOError, socket.error):
+                    # The server already closed the connection.
+                    pass
+
+                sock.close()
+
+            self._connections = []
+            self._failed = True
+
+    def make_request(self, request):
+        """Perform the specified request.
+
+        If this thread was given the lease on the request's URL, and didn't
+        save a response for it, the lease is released afterwards.
+        """
+        try:
+            return super(RemoteAPICache, self).make_request(request)
+        finally:
+            url = request.get_full_url()
+            connection = getattr(self._local, 'connection', None)
+
+            if connection is not None and url in connection[3]:
+                self._send({'op': 'release', 'url': url})
+
+    def _is_available(self):
+        return not self._failed
+
+    def _get_entry(self, request):
+        url = request.get_full_url()
+        headers = dict(
+            (self._to_text(name), self._to_text(value))
+            for name, value in six.iteritems(request.headers)
+        )
+
+        response, body = self._send({
+            'op': 'get',
+            'url': url,
+            'headers': headers,
+        })
+
+        if response is None:
+            return None
+
+        if response['lease']:
+            self._local.connection[3].add(url)
+
+        if response['entry'] is None:
+            return None
+
+        return _deserialize_entry(response['entry'], body)
+
+    def _save_entry(self, entry):
+        data, body = _serialize_entry(entry)
+        self._send({'op': 'save', 'entry': data}, body)
+
+    def _delete_entry(self, entry):
+        self._send({
+            'op': 'delete',
+            'url': entry.url,
+            'vary_headers': entry.vary_headers,
+        })
+
+    def invalidate(self, url):
+        self._send({'op': 'invalidate', 'url': url})
+
+    def _clear_negative_entries(self):
+        self._send({'op': 'clear_negative'})
+
+    def _send(self, message, body=None):
+        """Send a message to the server and return its response.
+
+        If the connection fails, the cache stops being used, and this
+        returns (None, None).
+        """
+        if self._failed:
+            return None, None
+
+        try:
+            sock, rfile, wfile, leases = self._get_connection()
+            _write_message(wfile, message, body)
+            response, response_body = _read_message(rfile)
+
+            if response is None:
+                raise IOError('The API cache server closed the connection')
+        except (IOError, ValueError, socket.error) as e:
+            logging.warning('Could not communicate with the API cache '
+                            'server at %s: %s. The HTTP cache for the API '
+                            'will not be used.',
+                            self.socket_path, e)
+            self._failed = True
+
+            return None, None
+
+        if message['op'] == 'save':
+            leases.discard(message['entry']['url'])
+        elif message['op'] == 'release':
+            leases.discard(message['url'])
+
+        return response, response_body
+
+    def _get_connection(self):
+        """Return this thread's connection to the server.
+
+        The connection is a tuple of the socket, the file objects for
+        reading and writing, and the set of URLs this thread holds leases
+        on.
+        """
+        connection = getattr(self._local, 'connection', None)
+
+        if connection is None:
+            if APICacheServer.address_family is None:
+                raise socket.error('Unix sockets are not supported on this '
+                                   'system')
+
+            sock = socket.socket(APICacheServer.address_family,
+                                 socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+            connection = (sock, sock.makefile('rb'), sock.makefile('wb'),
+                          set())
+            self._local.connection = connection
+
+            with self._lock:
+                self._connections.append(connection)
+
+        return connection
+
+    def _to_text(self, value):
+        """Return a header name or value as text."""
+        if isinstance(value, six.binary_type):
+            return value.decode('utf-8')
+
+        return six.text_type(value)
@@ -26,8 +26,14 @@ class RBClient(object):
     def get_url(self, url, *args, **kwargs):
         return self._transport.get_url(url, *args, **kwargs)
 
+    def execute_batch(self, requests, *args, **kwargs):
+        return self._transport.execute_batch(requests, *args, **kwargs)
+
     def login(self, *args, **kwargs):
         return self._transport.login(*args, **kwargs)
 
     def logout(self, *args, **kwargs):
         return self._transport.logout(*args, **kwargs)
+
+    def close(self, *args, **kwargs):
+        return self._transport.close(*args, **kwargs)
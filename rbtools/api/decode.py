@@ -1,11 +1,24 @@
 from __future__ import unicode_literals
 
+import codecs
 import json
+import logging
+from collections import OrderedDict
 
 from rbtools.api.utils import parse_mimetype
 
 
 DECODER_MAP = {}
+STREAM_DECODER_MAP = {}
+
+# The registered JSON implementations, mapping each name to a function
+# returning its loads function. See register_json_backend.
+JSON_BACKENDS = OrderedDict()
+
+# The name and loads function of the JSON implementation in use, once it
+# has been picked, and whether it was set with set_json_backend.
+_json_backend = None
+_json_backend_set = False
 
 
 def DefaultDecoder(payload):
@@ -24,8 +37,95 @@ def DefaultDecoder(payload):
 DEFAULT_DECODER = DefaultDecoder
 
 
+def register_json_backend(name, load_backend):
+    """Register a JSON implementation for decoding API payloads.
+
+    load_backend is called when the implementation is first needed, and
+    returns a function decoding a JSON payload (as bytes) in the same way
+    as json.loads. It raises ImportError if the implementation isn't
+    installed, in which case the next one is tried.
+
+    Backends registered later are preferred over earlier ones, so the
+    standard library's json module, which is registered first, is always
+    the last resort.
+    """
+    global _json_backend
+
+    JSON_BACKENDS[name] = load_backend
+
+    if not _json_backend_set:
+        # Pick the preferred backend again when it's next needed.
+        _json_backend = None
+
+
+def set_json_backend(name=None):
+    """Set the JSON implementation used for decoding API payloads.
+
+    If name is None, the preferred backend that is installed is used, as
+    described in register_json_backend. Otherwise, the backend with that
+    name is used. ValueError is raised if there's no such backend, and
+    ImportError if it isn't installed.
+    """
+    global _json_backend, _json_backend_set
+
+    if name is None:
+        _json_backend = None
+        _json_backend_set = False
+    else:
+        try:
+            load_backend = JSON_BACKENDS[name]
+        except KeyError:
+            raise ValueError('"%s" is not a registered JSON backend' % name)
+
+        _json_backend = (name, load_backend())
+        _json_backend_set = True
+
+
+def get_json_backend():
+    """Return the name of the JSON implementation used for API payloads."""
+    return _get_json_backend()[0]
+
+
+def _get_json_backend():
+    """Return the name and loads function of the JSON implementation."""
+    global _json_backend
+
+    if _json_backend is None:
+        for name, load_backend in reversed(list(JSON_BACKENDS.items())):
+            try:
+                _json_backend = (name, load_backend())
+            except ImportError:
+                continue
+
+            logging.debug('Using %s to decode JSON payloads', name)
+            break
+
+    return _json_backend
+
+
+def _load_json():
+    return json.loads
+
+
+def _load_ujson():
+    import ujson
+
+    return ujson.loads
+
+
+def _load_orjson():
+    import orjson
+
+    return orjson.loads
+
+
+register_json_backend('json', _load_json)
+register_json_backend('ujson', _load_ujson)
+register_json_backend('orjson', _load_orjson)
+
+
 def JsonDecoder(payload):
-    return json.loads(payload)
+    return _get_json_backend()[1](payload)
 
 DECODER_MAP['application/json'] = JsonDecoder
 
@@ -46,3 +146,226 @@ def decode_response(payload, mime_type):
         decoder = DEFAULT_DECODER
 
     return decoder(payload)
+
+
+class JsonListStreamDecoder(object):
+    """Incrementally decodes a JSON list payload from a stream.
+
+    The payload of a list resource is a JSON object, with the items under a
+    single key (e.g. ``review_requests``). Iterating over the decoder yields
+    the payload of each item as soon as it has been read from the stream,
+    so only one item (and a chunk of the stream) is held in memory at a
+    time, rather than the entire list.
+
+    The rest of the payload (such as ``links`` and ``total_results``) is
+    available in :py:attr:`payload` once iteration has finished, since it
+    may come after the items in the stream. The key that held the items is
+    available in :py:attr:`token`, and is left out of :py:attr:`payload`.
+
+    Incremental decoding uses the standard library's json module. If a
+    faster JSON backend is in use (see :py:func:`set_json_backend`), the
+    whole payload is read and decoded with it instead, which is faster, at
+    the cost of holding one decoded page in memory.
+
+    ValueError is raised if the stream doesn't contain a JSON object, or
+    if it ends early.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    _WHITESPACE = ' \t\n\r'
+
+    def __init__(self, stream, encoding='utf-8'):
+        self.stream = stream
+        self.payload = {}
+        self.token = None
+
+        self._encoding = encoding
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder(encoding)()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def __iter__(self):
+        name, loads = _get_json_backend()
+
+        if name != 'json':
+            for item in self._iter_decoded_payload(loads):
+                yield item
+
+            return
+
+        self._expect('{')
+
+        if self._peek() == '}':
+            self._pos += 1
+            return
+
+        while True:
+            key = self._decode_value()
+            self._expect(':')
+
+            if self.token is None and self._peek() == '[':
+                self.token = key
+
+                for item in self._iter_list():
+                    yield item
+            else:
+                self.payload[key] = self._decode_value()
+
+            if self._expect(',}') == '}':
+                break
+
+        # Read the rest of the stream, so that the whole response has been
+        # consumed.
+        while self._read(self.CHUNK_SIZE):
+            pass
+
+        if self._buf[self._pos:].strip(self._WHITESPACE):
+            raise ValueError('Unexpected data after the JSON payload')
+
+    def close(self):
+        """Close the stream."""
+        if hasattr(self.stream, 'close'):
+            self.stream.close()
+
+    def _iter_decoded_payload(self, loads):
+        """Decode the whole payload, and yield each value of its list."""
+        data = self.stream.read()
+
+        if codecs.lookup(self._encoding).name != 'utf-8':
+            data = data.decode(self._encoding)
+
+        payload = loads(data)
+
+        if not isinstance(payload, dict):
+            raise ValueError('The JSON payload is not an object')
+
+        items = []
+
+        for key, value in list(payload.items()):
+            if isinstance(value, list):
+                self.token = key
+                items = payload.pop(key)
+                break
+
+        self.payload = payload
+
+        for item in items:
+            yield item
+
+    def _iter_list(self):
+        """Yield each value of the JSON array at the current position."""
+        self._expect('[')
+
+        if self._peek() == ']':
+            self._pos += 1
+            return
+
+        while True:
+            yield self._decode_value()
+
+            if self._expect(',]') == ']':
+                break
+
+    def _read(self, size):
+        """Read more of the stream into the buffer.
+
+        Returns False if the end of the stream has been reached.
+        """
+        if self._eof:
+            return False
+
+        data = self.stream.read(size)
+
+        if self._pos:
+            # Drop what has been decoded already, so the buffer only holds
+            # the value being decoded.
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+
+        if data:
+            self._buf += self._text_decoder.decode(data)
+        else:
+            self._buf += self._text_decoder.decode(b'', final=True)
+            self._eof = True
+
+        return True
+
+    def _peek(self):
+        """Return the next character that isn't whitespace.
+
+        The position is moved past any whitespace, but not the character.
+        """
+        while True:
+            buf = self._buf
+            pos = self._pos
+
+            while pos < len(buf) and buf[pos] in self._WHITESPACE:
+                pos += 1
+
+            self._pos = pos
+
+            if pos < len(buf):
+                return buf[pos]
+            elif not self._read(self.CHUNK_SIZE):
+                raise ValueError('Unexpected end of JSON payload')
+
+    def _expect(self, chars):
+        """Consume the next character, which must be one of the given ones.
+
+        The character is returned.
+        """
+        c = self._peek()
+
+        if c not in chars:
+            raise ValueError('Expected one of %r in the JSON payload, but '
+                             'found %r'
+                             % (chars, c))
+
+        self._pos += 1
+
+        return c
+
+    def _decode_value(self):
+        """Decode the JSON value at the current position."""
+        self._peek()
+
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+
+                # A value running up to the end of the buffer may be
+                # incomplete (e.g. a number), unless the stream has ended.
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+
+                    return value
+            except ValueError:
+                if self._eof:
+                    raise
+
+            # Read at least as much as is buffered, so that large values are
+            # decoded in a linear amount of time.
+            self._read(max(self.CHUNK_SIZE, len(self._buf) - self._pos))
+
+
+STREAM_DECODER_MAP['application/json'] = JsonListStreamDecoder
+
+
+def decode_response_stream(stream, mime_type):
+    """Return a decoder for a Web API list response read from a stream.
+
+    The decoder yields the payload of each item in the list, as described
+    in :py:class:`JsonListStreamDecoder`. None is returned if the response
+    can't be decoded incrementally for the provided mime_type, in which
+    case :py:func:`decode_response` should be used.
+    """
+    mime = parse_mimetype(mime_type)
+
+    format = '%s/%s' % (mime['main_type'], mime['format'])
+
+    if format in STREAM_DECODER_MAP:
+        return STREAM_DECODER_MAP[format](stream)
+    else:
+        return None
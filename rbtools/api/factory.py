@@ -9,7 +9,7 @@ SPECIAL_KEYS = set(('links', 'total_results', 'stat', 'count'))
 
 
 def create_resource(transport, payload, url, mime_type=None,
-                    item_mime_type=None, guess_token=True):
+                    item_mime_type=None, guess_token=True, projection=None):
     """Construct and return a resource object.
 
     The mime type will be used to find a resource specific base class.
@@ -23,6 +23,10 @@ def create_resource(transport, payload, url, mime_type=None,
     resources body lives under. If False, we assume that the resource
     body is the body of the payload itself. This is important for
     constructing Item resources from a resource list.
+
+    The projection, if any, is the
+    :py:class:`rbtools.api.projection.Projection` the resource was
+    requested with.
     """
 
     # Determine the key for the resources data.
@@ -44,4 +48,5 @@ def create_resource(transport, payload, url, mime_type=None,
         resource_class = ItemResource
 
     return resource_class(transport, payload, url, token=token,
-                          item_mime_type=item_mime_type)
+                          item_mime_type=item_mime_type,
+                          projection=projection)
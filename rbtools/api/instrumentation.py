@@ -0,0 +1,227 @@
+from __future__ import unicode_literals
+
+import contextlib
+import json
+import threading
+
+
+_local = threading.local()
+
+
+class RequestTiming(object):
+    """Timing information for a single API request made by a transport.
+
+    All durations are in seconds. A duration is None if it wasn't measured
+    for the request. For example, the connection phases are only measured
+    for requests sent over persistent connections, and nothing is read from
+    the network when the response comes from the API cache.
+
+    The phases are:
+
+    ``connect_time``:
+        DNS lookup and connection setup (including TLS) for a new
+        connection. This is 0 when an existing connection was reused.
+
+    ``ttfb``:
+        Time from sending the request to receiving the response headers.
+
+    ``read_time``:
+        Time spent reading the response body.
+
+    ``request_time``:
+        Total time spent carrying out the HTTP request, including
+        authentication round-trips and the API cache.
+
+    ``decode_time``:
+        Time spent decoding the response payload.
+
+    ``construct_time``:
+        Time spent constructing the resource from the payload.
+
+    ``total_time``:
+        Total time spent on the request by the transport.
+
+    ``cache_outcome`` is the result of looking the request up in the API
+    cache. It's one of ``hit``, ``miss``, ``revalidated`` (the server
+    confirmed an expired entry was still valid), ``updated`` (an expired
+    entry was replaced), ``stale`` (an expired entry was used while being
+    revalidated in the background), ``offline`` (an entry was used in
+    offline mode), ``negative`` (a cached error response was used),
+    ``uncacheable``, or None if the cache wasn't used.
+
+    ``error`` is the name of the exception raised by the request, if any.
+    """
+    FIELDS = ('method', 'url', 'connect_time', 'ttfb', 'read_time',
+              'request_time', 'decode_time', 'construct_time', 'total_time',
+              'cache_outcome', 'error')
+
+    def __init__(self, method, url):
+        if isinstance(method, bytes):
+            method = method.decode('utf-8')
+
+        self.method = method
+        self.url = url
+        self.connect_time = None
+        self.ttfb = None
+        self.read_time = None
+        self.request_time = None
+        self.decode_time = None
+        self.construct_time = None
+        self.total_time = None
+        self.cache_outcome = None
+        self.error = None
+
+    def to_dict(self):
+        """Return the timing information as a dictionary."""
+        return dict(
+            (field, getattr(self, field))
+            for field in self.FIELDS
+        )
+
+
+class Instrumentation(object):
+    """Receives events about the requests made by a transport.
+
+    An instance can be passed to a transport through the ``instrumentation``
+    argument. Subclasses should override the methods for the events they
+    are interested in. The methods may be called from several threads at
+    once, when requests are made concurrently.
+    """
+    def request_started(self, timing):
+        """Called before a request is made.
+
+        The timing argument is the :py:class:`RequestTiming` for the
+        request, which will be filled in as the request is carried out.
+        """
+        pass
+
+    def request_finished(self, timing):
+        """Called once a request has finished, successfully or not."""
+        pass
+
+
+class HTTPProfiler(Instrumentation):
+    """Collects the timings of all requests for a summary.
+
+    This is used by ``--profile-http``.
+    """
+    SUMMARY_FIELDS = ('connect_time', 'ttfb', 'read_time', 'request_time',
+                      'decode_time', 'construct_time', 'total_time')
+
+    def __init__(self):
+        self.timings = []
+        self._lock = threading.Lock()
+
+    def request_finished(self, timing):
+        with self._lock:
+            self.timings.append(timing)
+
+    def get_summary(self):
+        """Return the totals across all requests, as a dictionary."""
+        cache_outcomes = {}
+        totals = dict(
+            (field, 0.0)
+            for field in self.SUMMARY_FIELDS
+        )
+
+        for timing in self.timings:
+            for field in self.SUMMARY_FIELDS:
+                totals[field] += getattr(timing, field) or 0.0
+
+            if timing.cache_outcome:
+                cache_outcomes[timing.cache_outcome] = \
+                    cache_outcomes.get(timing.cache_outcome, 0) + 1
+
+        return {
+            'requests': len(self.timings),
+            'errors': len([
+                timing
+                for timing in self.timings
+                if timing.error
+            ]),
+            'totals': totals,
+            'cache_outcomes': cache_outcomes,
+        }
+
+    def to_json(self):
+        """Return the summary and all request timings as JSON."""
+        return json.dumps({
+            'summary': self.get_summary(),
+            'requests': [
+                timing.to_dict()
+                for timing in self.timings
+            ],
+        }, indent=2, sort_keys=True)
+
+    def to_table(self):
+        """Return the request timings as a table, in milliseconds."""
+        columns = (
+            ('connect_time', 'Connect'),
+            ('ttfb', 'TTFB'),
+            ('read_time', 'Read'),
+            ('decode_time', 'Decode'),
+            ('construct_time', 'Build'),
+            ('total_time', 'Total'),
+        )
+
+        def format_duration(value):
+            if value is None:
+                return '-'
+
+            return '%.1f' % (value * 1000)
+
+        header = '%-6s ' % 'Method'
+        header += ''.join('%9s' % title for field, title in columns)
+        header += '  %-11s %s' % ('Cache', 'URL')
+        lines = [header]
+
+        for timing in self.timings:
+            line = '%-6s ' % timing.method
+            line += ''.join(
+                '%9s' % format_duration(getattr(timing, field))
+                for field, title in columns
+            )
+            line += '  %-11s %s' % (timing.error or timing.cache_outcome or
+                                    '-',
+                                    timing.url)
+            lines.append(line)
+
+        summary = self.get_summary()
+        line = '%-6s ' % 'Total'
+        line += ''.join(
+            '%9s' % format_duration(summary['totals'][field])
+            for field, title in columns
+        )
+        line += '  %d requests' % summary['requests']
+
+        if summary['cache_outcomes']:
+            line += ' (%s)' % ', '.join(
+                '%s: %d' % (outcome, count)
+                for outcome, count in sorted(summary['cache_outcomes'].items())
+            )
+
+        lines.append(line)
+
+        return '\n'.join(lines)
+
+
+def get_current_timing():
+    """Return the RequestTiming for the request being made by this thread.
+
+    This allows the lower layers (the HTTP handlers and the API cache) to
+    fill in the timings of the request the transport is making. If no
+    request is being timed, this returns None.
+    """
+    return getattr(_local, 'timing', None)
+
+
+@contextlib.contextmanager
+def timing_context(timing):
+    """Make timing the current RequestTiming for this thread."""
+    old_timing = get_current_timing()
+    _local.timing = timing
+
+    try:
+        yield timing
+    finally:
+        _local.timing = old_timing
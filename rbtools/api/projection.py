@@ -0,0 +1,98 @@
+from __future__ import unicode_literals
+
+import logging
+
+from six.moves.urllib.parse import parse_qsl, urlparse
+
+
+class Projection(object):
+    """The fields and links to request for a kind of resource.
+
+    Projections are registered on a transport (through the ``projections``
+    argument of :py:class:`rbtools.api.client.RBClient`), keyed by the name
+    of the link or URI template used to fetch the resource, such as
+    ``review_requests``. Calling the method for that link (e.g.
+    ``root.get_review_requests()``) then sets the ``only-fields`` and
+    ``only-links`` query arguments, unless they're passed in explicitly.
+    This makes the payloads smaller, and faster to transfer and decode.
+
+    fields and links are lists of names. If either is None, all of them
+    are requested.
+
+    Resources remember the projection they were fetched with. When debug
+    output is enabled, a warning is logged the first time a field or link
+    that wasn't requested is accessed, since it's missing from the payload.
+    """
+    def __init__(self, fields=None, links=None):
+        self.fields = fields
+        self.links = links
+        self._warned = set()
+
+    @classmethod
+    def from_url(cls, url):
+        """Return the projection used in a request URL.
+
+        None is returned if the URL has no ``only-fields`` or ``only-links``
+        query arguments.
+        """
+        if 'only-fields' not in url and 'only-links' not in url:
+            return None
+
+        query = dict(parse_qsl(urlparse(url).query, keep_blank_values=True))
+        names = []
+
+        for key in ('only-fields', 'only-links'):
+            value = query.get(key)
+
+            if value is not None:
+                value = [name for name in value.split(',') if name]
+
+            names.append(value)
+
+        return cls(*names)
+
+    def get_query_args(self):
+        """Return the query arguments for requesting the projection."""
+        query_args = {}
+
+        if self.fields is not None:
+            query_args['only_fields'] = ','.join(self.fields)
+
+        if self.links is not None:
+            query_args['only_links'] = ','.join(self.links)
+
+        return query_args
+
+    def check_attribute(self, name, url):
+        """Warn about access to an attribute missing due to the projection.
+
+        This is called when name isn't a field or link method of the
+        resource at url. The warning is only logged when debug output is
+        enabled, and once per attribute.
+        """
+        if (name.startswith('_') or
+            not logging.getLogger().isEnabledFor(logging.DEBUG)):
+            return
+
+        if name.startswith('get_') and self.links is not None:
+            kind = 'link'
+            requested = self.links
+            name = name[4:]
+        elif self.fields is not None:
+            kind = 'field'
+            requested = self.fields
+        else:
+            return
+
+        if name not in requested and (kind, name) not in self._warned:
+            self._warned.add((kind, name))
+            logging.warning('The "%s" %s of %s was accessed, but it was not '
+                            'requested (only the %ss %s were). Add it to the '
+                            'projection for the resource.',
+                            name, kind, url, kind,
+                            ', '.join(requested) or 'none')
+
+    def __repr__(self):
+        return '%s(fields=%r, links=%r)' % (self.__class__.__name__,
+                                            self.fields,
+                                            self.links)
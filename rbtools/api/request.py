@@ -1,16 +1,23 @@
 from __future__ import unicode_literals
 
 import base64
+import errno
 import logging
 import mimetypes
 import os
 import random
 import shutil
+import socket
 import sys
+import threading
+import time
+import zlib
+from email.utils import mktime_tz, parsedate_tz
 from io import BytesIO
 from json import loads as json_loads
 
 import six
+from six.moves import http_client
 from six.moves.http_client import UNAUTHORIZED
 from six.moves.http_cookiejar import Cookie, MozillaCookieJar
 from six.moves.urllib.error import HTTPError, URLError
@@ -21,28 +28,63 @@ from six.moves.urllib.request import (
     HTTPCookieProcessor,
     HTTPDigestAuthHandler,
     HTTPErrorProcessor,
+    HTTPHandler,
     HTTPPasswordMgr,
     ProxyHandler,
     Request as URLRequest,
     build_opener,
     install_opener,
     urlopen)
+from six.moves.urllib.response import addinfourl
+
+try:
+    from six.moves.urllib.request import HTTPSHandler
+except ImportError:
+    # Python was built without SSL support.
+    HTTPSHandler = None
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
 
 from rbtools import get_package_version
 from rbtools.api.cache import APICache
+from rbtools.api.cache_server import RemoteAPICache
 from rbtools.api.errors import APIError, create_api_error, ServerInterfaceError
+from rbtools.api.instrumentation import get_current_timing
 from rbtools.utils.filesystem import get_home_path
 
 
 RBTOOLS_COOKIE_FILE = '.rbtools-cookies'
 RB_COOKIE_NAME = 'rbsessionid'
 
+# The content codings that ContentDecodingHandler can decode.
+ACCEPT_ENCODING = 'gzip, deflate'
+
+# Socket errors meaning that the server closed an idle persistent connection.
+STALE_CONNECTION_ERRNOS = (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE)
+
+# Socket errors which RetryPolicy considers worth retrying.
+TRANSIENT_ERRNOS = STALE_CONNECTION_ERRNOS + (errno.ECONNREFUSED,
+                                              errno.ETIMEDOUT)
+
+
+def make_basic_auth_header(username, password):
+    """Return the value of an HTTP Basic Authorization header."""
+    raw = ('%s:%s' % (username, password)).encode('utf-8')
+
+    return 'Basic %s' % base64.b64encode(raw).strip().decode('ascii')
+
 
 class HttpRequest(object):
     """High-level HTTP-request object."""
     def __init__(self, url, method='GET', query_args={}):
         self.method = method
         self.headers = {}
+
+        # Whether the body may be sent compressed, if the server allows it.
+        self.compress_body = False
         self._fields = {}
         self._files = {}
 
@@ -64,11 +106,21 @@ class HttpRequest(object):
         self._fields[name] = value
 
     def add_file(self, name, filename, content):
+        """Add a file to be uploaded.
+
+        The content may be a byte string, a memoryview, a unicode string
+        (which is encoded as UTF-8), or a file object opened in binary mode.
+        File objects are read, from their position at the time they were
+        added, as the request is sent. They must stay open until then.
+        """
         self._files[name] = {
             'filename': filename,
             'content': content,
         }
 
+        if hasattr(content, 'read'):
+            self._files[name]['offset'] = content.tell()
+
     def del_field(self, name):
         del self._fields[name]
 
@@ -78,30 +130,44 @@ class HttpRequest(object):
     def encode_multipart_formdata(self):
         """Encodes data for use in an HTTP request.
 
-        Parameters:
-            fields - the fields to be encoded.  This should be a dict in a
-                     key:value format
-            files  - the files to be encoded.  This should be a dict in a
-                     key:dict, filename:value and content:value format
+        This returns the content type and the full body as a byte string.
+        Use :py:meth:`encode_multipart_body` to avoid holding the whole body
+        in memory.
+        """
+        content_type, body = self.encode_multipart_body()
+
+        if body is not None:
+            body = body.getvalue()
+
+        return content_type, body
+
+    def encode_multipart_body(self):
+        """Encodes data for use in an HTTP request as a streamed body.
+
+        This returns the content type and a :py:class:`MultipartBody`, or
+        ``(None, None)`` if there are no fields or files. The content of
+        files is not copied into the body. It's read in chunks as the body
+        is sent.
         """
         if not (self._fields or self._files):
             return None, None
 
         NEWLINE = b'\r\n'
         BOUNDARY = self._make_mime_boundary()
-        content = BytesIO()
+        body = MultipartBody()
 
         for key in self._fields:
-            content.write(b'--' + BOUNDARY + NEWLINE)
-            content.write(('Content-Disposition: form-data; '
-                           'name="%s"' % key).encode('utf-8'))
-            content.write(NEWLINE + NEWLINE)
+            body.add_bytes(b'--' + BOUNDARY + NEWLINE)
+            body.add_bytes(('Content-Disposition: form-data; '
+                            'name="%s"' % key).encode('utf-8'))
+            body.add_bytes(NEWLINE + NEWLINE)
 
             if isinstance(self._fields[key], six.string_types):
-                content.write(self._fields[key].encode('utf-8') + NEWLINE)
+                body.add_bytes(self._fields[key].encode('utf-8') + NEWLINE)
             else:
-                content.write(six.text_type(self._fields[key]).encode('utf-8')
-                              + NEWLINE)
+                body.add_bytes(
+                    six.text_type(self._fields[key]).encode('utf-8') +
+                    NEWLINE)
 
         for key in self._files:
             filename = self._files[key]['filename']
@@ -113,26 +179,28 @@ class HttpRequest(object):
             else:
                 mime_type = b'application/octet-stream'
 
-            content.write(b'--' + BOUNDARY + NEWLINE)
-            content.write(b'Content-Disposition: form-data; name="%s"; '
-                          % key.encode('utf-8'))
-            content.write(b'filename="%s"' % filename.encode('utf-8')
-                          + NEWLINE)
-            content.write(b'Content-Type: %s' % mime_type + NEWLINE)
-            content.write(NEWLINE)
+            body.add_bytes(b'--' + BOUNDARY + NEWLINE)
+            body.add_bytes(b'Content-Disposition: form-data; name="%s"; '
+                           % key.encode('utf-8'))
+            body.add_bytes(b'filename="%s"' % filename.encode('utf-8')
+                           + NEWLINE)
+            body.add_bytes(b'Content-Type: %s' % mime_type + NEWLINE)
+            body.add_bytes(NEWLINE)
 
             if isinstance(value, six.text_type):
-                content.write(value.encode('utf-8'))
+                body.add_bytes(value.encode('utf-8'))
+            elif hasattr(value, 'read'):
+                body.add_file(value, self._files[key]['offset'])
             else:
-                content.write(value)
+                body.add_bytes(value)
 
-            content.write(NEWLINE)
+            body.add_bytes(NEWLINE)
 
-        content.write(b'--' + BOUNDARY + b'--' + NEWLINE + NEWLINE)
+        body.add_bytes(b'--' + BOUNDARY + b'--' + NEWLINE + NEWLINE)
         content_type = ('multipart/form-data; boundary=%s' %
                         BOUNDARY.decode('utf-8')).encode('utf-8')
 
-        return content_type, content.getvalue()
+        return content_type, body
 
     def _make_mime_boundary(self):
         """Create a mime boundary.
@@ -146,6 +214,166 @@ class HttpRequest(object):
         return (b'=' * 15) + (fmt % token).encode('utf-8') + b'=='
 
 
+class MultipartBody(object):
+    """A multipart/form-data request body which is streamed when sent.
+
+    The body is made up of byte strings, memoryviews and file objects. Its
+    length is computed from the parts up front, and the content of the
+    parts is only produced, CHUNK_SIZE bytes at a time, as the body is read
+    by the HTTP connection. File objects are never read into memory in
+    full.
+
+    The body can be sent more than once (for instance, after the server
+    asks for authentication). :py:meth:`rewind` must be called before each
+    attempt.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self):
+        self._parts = []
+        self._length = 0
+        self._chunks = None
+        self._chunk = b''
+        self._offset = 0
+
+    def add_bytes(self, data):
+        """Add a byte string or memoryview to the body."""
+        if isinstance(data, memoryview):
+            self._length += len(data) * data.itemsize
+        else:
+            self._length += len(data)
+
+        self._parts.append(data)
+
+    def add_file(self, fp, start=None):
+        """Add the rest of a file object.
+
+        The file is read from the given start offset, or from its current
+        position if not provided.
+        """
+        if start is None:
+            start = fp.tell()
+
+        fp.seek(0, os.SEEK_END)
+        size = fp.tell() - start
+        fp.seek(start)
+
+        self._length += size
+        self._parts.append((fp, start, size))
+
+    def has_files(self):
+        """Return whether the body streams the content of any files."""
+        return any(isinstance(part, tuple) for part in self._parts)
+
+    def rewind(self):
+        """Start reading the body from the beginning again."""
+        self._chunks = None
+        self._chunk = b''
+        self._offset = 0
+
+    def read(self, size=-1):
+        """Read up to size bytes of the body.
+
+        If size is negative, the rest of the body is returned.
+
+        The data is sliced from the current chunk at a read offset, so each
+        byte of the body is only copied once, however small the reads are.
+        """
+        if self._chunks is None:
+            self._chunks = self.iter_chunks()
+
+        pieces = []
+
+        while size != 0:
+            if self._offset >= len(self._chunk):
+                chunk = next(self._chunks, None)
+
+                if chunk is None:
+                    break
+
+                if isinstance(chunk, memoryview) and chunk.itemsize != 1:
+                    chunk = chunk.tobytes()
+
+                self._chunk = chunk
+                self._offset = 0
+
+            start = self._offset
+
+            if size < 0:
+                end = len(self._chunk)
+            else:
+                end = min(len(self._chunk), start + size)
+                size -= end - start
+
+            if start == 0 and end == len(self._chunk):
+                pieces.append(self._chunk)
+            else:
+                pieces.append(self._chunk[start:end])
+
+            self._offset = end
+
+        if len(pieces) == 1:
+            return self._to_bytes(pieces[0])
+        else:
+            return b''.join(self._to_bytes(piece) for piece in pieces)
+
+    def iter_chunks(self):
+        """Yield the content of the body in chunks."""
+        chunk_size = self.CHUNK_SIZE
+
+        for part in self._parts:
+            if isinstance(part, tuple):
+                fp, start, remaining = part
+                fp.seek(start)
+
+                while remaining > 0:
+                    chunk = fp.read(min(chunk_size, remaining))
+
+                    if not chunk:
+                        raise IOError('File %r was truncated while it was '
+                                      'being uploaded' %
+                                      getattr(fp, 'name', fp))
+
+                    remaining -= len(chunk)
+                    yield chunk
+            elif len(part) > chunk_size:
+                view = memoryview(part)
+
+                for i in range(0, len(view), chunk_size):
+                    yield view[i:i + chunk_size]
+            else:
+                yield part
+
+    def getvalue(self):
+        """Return the entire body as a byte string."""
+        return b''.join(self._to_bytes(chunk) for chunk in self.iter_chunks())
+
+    def _to_bytes(self, chunk):
+        if isinstance(chunk, memoryview):
+            return chunk.tobytes()
+
+        return chunk
+
+    def __len__(self):
+        return self._length
+
+
+class RewindBodyHandler(BaseHandler):
+    """Rewinds streamed request bodies before each attempt to send them.
+
+    urllib sends a request again after some responses, such as a 401
+    asking for authentication. A :py:class:`MultipartBody` has been read
+    by then, so it has to start over from the beginning.
+    """
+    def http_request(self, request):
+        if isinstance(request.data, MultipartBody):
+            request.data.rewind()
+
+        return request
+
+    https_request = http_request
+
+
 class Request(URLRequest):
     """A request which contains a method attribute."""
     def __init__(self, url, body='', headers={}, method='PUT'):
@@ -166,27 +394,33 @@ class PresetHTTPAuthHandler(BaseHandler):
         self.url = url
         self.password_mgr = password_mgr
         self.used = False
+        self._lock = threading.Lock()
 
     def reset(self, username, password):
-        self.password_mgr.rb_user = username
-        self.password_mgr.rb_pass = password
-        self.used = False
+        with self._lock:
+            self.password_mgr.rb_user = username
+            self.password_mgr.rb_pass = password
+            self.used = False
 
     def http_request(self, request):
-        if not self.used:
+        with self._lock:
+            used = self.used
+            self.used = True
+
+        if not used:
             if self.password_mgr.api_token:
                 request.add_header(self.AUTH_HEADER,
                                    'token %s' % self.password_mgr.api_token)
-                self.used = True
             elif self.password_mgr.rb_user:
                 # Note that we call password_mgr.find_user_password to get the
                 # username and password we're working with.
                 username, password = \
                     self.password_mgr.find_user_password('Web API', self.url)
-                raw = '%s:%s' % (username, password)
                 request.add_header(self.AUTH_HEADER,
-                                   'Basic %s' % base64.b64encode(raw).strip())
-                self.used = True
+                                   make_basic_auth_header(username, password))
+            else:
+                with self._lock:
+                    self.used = False
 
         return request
 
@@ -211,6 +445,486 @@ class ReviewBoardHTTPErrorProcessor(HTTPErrorProcessor):
     https_response = http_response
 
 
+class ContentDecodingHandler(BaseHandler):
+    """Decodes gzip- and deflate-encoded response bodies.
+
+    Responses with a ``Content-Encoding`` of ``gzip`` or ``deflate`` are
+    replaced with a response holding the decoded body, with the
+    ``Content-Encoding`` header removed and ``Content-Length`` updated.
+    Since this happens inside the opener, everything above it (including
+    error processing and the API cache) only ever sees decoded bodies.
+
+    This only decodes responses. Compressed responses must be asked for
+    with an ``Accept-Encoding`` header on the request.
+    """
+    def http_response(self, request, response):
+        headers = response.info()
+        encoding = headers.get('Content-Encoding', '').strip().lower()
+
+        if encoding not in ('gzip', 'x-gzip', 'deflate'):
+            return response
+
+        data = response.read()
+
+        try:
+            data = decompress_body(data, encoding)
+        except zlib.error as e:
+            raise URLError('Could not decode %s-encoded response: %s'
+                           % (encoding, e))
+
+        del headers['Content-Encoding']
+        del headers['Content-Length']
+        headers['Content-Length'] = str(len(data))
+
+        decoded = addinfourl(BytesIO(data), headers, response.geturl(),
+                             response.code)
+        decoded.msg = response.msg
+
+        return decoded
+
+    https_response = http_response
+
+
+def compress_body(body):
+    """Return the gzip-compressed content of a MultipartBody.
+
+    The body is compressed a chunk at a time, but the compressed content is
+    held in memory in full, so this isn't used for bodies streaming files.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    content = BytesIO()
+
+    for chunk in body.iter_chunks():
+        content.write(compressor.compress(chunk))
+
+    content.write(compressor.flush())
+
+    return content.getvalue()
+
+
+def decompress_body(data, encoding):
+    """Decompress a gzip- or deflate-encoded body.
+
+    Some servers send raw deflate data, rather than the zlib-wrapped data
+    the spec calls for, with ``Content-Encoding: deflate``. Both are
+    accepted.
+    """
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+    try:
+        return zlib.decompress(data)
+    except zlib.error:
+        return zlib.decompress(data, -zlib.MAX_WBITS)
+
+
+class RetryPolicy(object):
+    """Decides when and how long to wait before retrying a failed request.
+
+    Requests using safe methods (GET, HEAD and OPTIONS) are retried when the
+    connection to the server fails with a transient error (the connection
+    was refused, reset or timed out), or when the server responds with one
+    of RETRY_STATUSES (for instance, a 503 during a rolling restart).
+    Permanent failures, such as DNS lookup or certificate errors, are never
+    retried.
+
+    The delay before each retry grows exponentially from backoff_factor
+    seconds, up to max_backoff, and is randomized (with "full jitter") so
+    that many clients don't retry in lockstep. A ``Retry-After`` header
+    from the server overrides the computed delay. No more than
+    max_retries retries are made, and a retry is abandoned if it would
+    bring the total time spent waiting above max_total_wait seconds.
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self, max_retries=3, backoff_factor=0.5, max_backoff=10,
+                 max_total_wait=30):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_total_wait = max_total_wait
+
+    def should_retry(self, method, attempt, status=None, error=None):
+        """Return whether a failed request should be retried.
+
+        The attempt argument is the number of retries made so far. The
+        status argument is the HTTP status of the response, if one was
+        received. Otherwise, the error argument is the reason the request
+        failed, usually an exception from the socket layer.
+        """
+        if attempt >= self.max_retries:
+            return False
+
+        if isinstance(method, bytes):
+            method = method.decode('utf-8')
+
+        if method.upper() not in self.SAFE_METHODS:
+            return False
+
+        if status is not None:
+            return status in self.RETRY_STATUSES
+
+        return self.is_transient_error(error)
+
+    def is_transient_error(self, error):
+        """Return whether a connection error is likely to go away.
+
+        Only timeouts and refused or dropped connections are considered
+        transient. Anything else (DNS lookup failures, TLS errors, or
+        errors that aren't from the socket layer) won't be fixed by trying
+        again.
+        """
+        if isinstance(error, socket.timeout):
+            return True
+
+        if isinstance(error, (socket.gaierror, socket.herror)):
+            return False
+
+        if ssl is not None and isinstance(error, ssl.SSLError):
+            return False
+
+        if isinstance(error, http_client.BadStatusLine):
+            # RemoteDisconnected (Python 3) is a subclass of BadStatusLine.
+            return error.__class__.__name__ == 'RemoteDisconnected'
+
+        return getattr(error, 'errno', None) in TRANSIENT_ERRNOS
+
+    def get_delay(self, attempt, waited=0, headers=None):
+        """Return the number of seconds to wait before the next retry.
+
+        The waited argument is the time already spent waiting on earlier
+        retries of the request. If the retry would exceed max_total_wait,
+        this returns None.
+        """
+        delay = None
+
+        if headers is not None:
+            delay = self.parse_retry_after(headers.get('Retry-After'))
+
+        if delay is None:
+            delay = random.uniform(
+                0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+        if waited + delay > self.max_total_wait:
+            return None
+
+        return delay
+
+    def parse_retry_after(self, value):
+        """Parse a Retry-After header into a number of seconds.
+
+        The header may contain either a number of seconds or an HTTP date.
+        This returns None if the value can't be parsed.
+        """
+        if not value:
+            return None
+
+        value = value.strip()
+
+        if value.isdigit():
+            return int(value)
+
+        parsed = parsedate_tz(value)
+
+        if parsed is None:
+            return None
+
+        return max(0, mktime_tz(parsed) - time.time())
+
+    def sleep(self, delay):
+        """Wait for the given number of seconds before retrying."""
+        time.sleep(delay)
+
+
+class ConnectionPool(object):
+    """A pool of idle, persistent HTTP connections.
+
+    Connections are keyed by the connection class, the host (which may be
+    a proxy) and the tunneled host, if any. A connection is only returned
+    to the pool once its response has been fully read and the server has
+    not asked for it to be closed.
+    """
+    MAX_IDLE_PER_HOST = 4
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_PER_HOST):
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return an idle connection for the key, or None."""
+        with self._lock:
+            connections = self._idle.get(key)
+
+            if connections:
+                return connections.pop()
+
+        return None
+
+    def put(self, key, connection):
+        """Return a connection to the pool for later reuse."""
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+
+            if len(connections) < self.max_idle_per_host:
+                connections.append(connection)
+                return
+
+        connection.close()
+
+    def close(self):
+        """Close all idle connections in the pool."""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+
+        for connections in six.itervalues(idle):
+            for connection in connections:
+                connection.close()
+
+
+class PooledResponseBody(object):
+    """The body of a response received over a pooled connection.
+
+    The body is read from the network as the caller reads it. Once it has
+    been read in full, the connection is returned to the pool (or closed,
+    if the server asked for that). If the body is closed before then, the
+    connection is closed, since the rest of the response is still pending
+    on it.
+    """
+    def __init__(self, response, release, timing=None):
+        """Initialize the body.
+
+        release is called with True once the body has been read in full,
+        or with False if the connection can't be reused.
+        """
+        self._response = response
+        self._release = release
+        self._timing = timing
+
+    def read(self, amt=None):
+        """Read up to amt bytes of the body, or all of it."""
+        return self._read(self._response.read, amt)
+
+    def readline(self, limit=-1):
+        """Read a line of the body."""
+        return self._read(self._response.readline, limit)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def close(self):
+        """Close the body, closing the connection if it wasn't read."""
+        self._finish(False)
+
+    def _read(self, read, *args):
+        if self._release is None:
+            return b''
+
+        start = time.time()
+
+        try:
+            data = read(*args)
+        except (socket.error, http_client.HTTPException) as e:
+            self._finish(False)
+            raise URLError(e)
+
+        if self._timing is not None:
+            self._timing.read_time = ((self._timing.read_time or 0) +
+                                      time.time() - start)
+
+        if self._response.isclosed():
+            self._finish(True)
+
+        return data
+
+    def _finish(self, reuse):
+        release = self._release
+
+        if release is not None:
+            self._release = None
+            release(reuse)
+
+
+class KeepAliveHandlerMixin(object):
+    """Opens HTTP requests over persistent connections.
+
+    urllib's handlers force a ``Connection: close`` header and open a new
+    connection (and, for HTTPS, a new TLS session) for every request. This
+    mixin instead sends HTTP/1.1 keep-alive requests over connections taken
+    from a :py:class:`ConnectionPool`.
+
+    Successful responses are streamed through a
+    :py:class:`PooledResponseBody`, which returns the connection to the
+    pool once the body has been read. Other responses are read in full
+    right away, since urllib's handlers often discard them unread (for
+    instance, when answering an authentication challenge). All other
+    handlers (cookies, authentication, proxies and error processing) keep
+    working as before, since they only operate on the request and response
+    objects.
+    """
+    def __init__(self, connection_pool, *args, **kwargs):
+        super(KeepAliveHandlerMixin, self).__init__(*args, **kwargs)
+        self.connection_pool = connection_pool
+
+    def do_keep_alive_open(self, http_class, req, **http_conn_args):
+        """Perform a request over a pooled connection.
+
+        A connection taken from the pool may have been closed by the server
+        while it was idle. If the request fails on such a connection before
+        any response was received, it is retried once on a new connection.
+        This reconnect doesn't count against the :py:class:`RetryPolicy`,
+        since the request never reached the server.
+        """
+        host = req.host
+
+        if not host:
+            raise URLError('no host given')
+
+        key = (http_class, host, req._tunnel_host)
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(
+            (name, value)
+            for name, value in six.iteritems(req.headers)
+            if name not in headers
+        )
+        headers['Connection'] = 'keep-alive'
+        headers = dict(
+            (name.title(), value)
+            for name, value in six.iteritems(headers)
+        )
+
+        tunnel_headers = {}
+
+        if req._tunnel_host and 'Proxy-Authorization' in headers:
+            # Proxy-Authorization should not be sent to the origin server.
+            tunnel_headers['Proxy-Authorization'] = \
+                headers.pop('Proxy-Authorization')
+
+        timing = get_current_timing()
+        connection = self.connection_pool.get(key)
+        response = None
+
+        if connection is not None:
+            if timing is not None:
+                timing.connect_time = 0
+
+            try:
+                response = self._get_response(connection, req, headers,
+                                              timing)
+            except (socket.error, http_client.HTTPException) as e:
+                connection.close()
+
+                if not self._is_stale_connection_error(e):
+                    raise URLError(e)
+
+                logging.debug('Persistent connection to %s was closed (%s); '
+                              'reconnecting', host, e)
+
+        if response is None:
+            connection = http_class(host, timeout=req.timeout,
+                                    **http_conn_args)
+
+            if req._tunnel_host:
+                connection.set_tunnel(req._tunnel_host,
+                                      headers=tunnel_headers)
+
+            try:
+                start = time.time()
+                connection.connect()
+
+                if timing is not None:
+                    timing.connect_time = time.time() - start
+
+                response = self._get_response(connection, req, headers,
+                                              timing)
+            except (socket.error, http_client.HTTPException) as e:
+                connection.close()
+                raise URLError(e)
+
+        def _release(reuse):
+            if reuse and not response.will_close:
+                self.connection_pool.put(key, connection)
+            else:
+                connection.close()
+
+        # Once a response has started arriving, the server has processed
+        # the request. Failures from here on are never retried, since that
+        # could perform a POST or PUT twice.
+        body = PooledResponseBody(response, _release, timing)
+
+        if not (200 <= response.status < 300) or response.length == 0:
+            body = BytesIO(body.read())
+
+        result = addinfourl(body, response.msg, req.get_full_url(),
+                            response.status)
+        result.msg = response.reason
+
+        return result
+
+    def _get_response(self, connection, req, headers, timing=None):
+        """Send the request and wait for the response headers.
+
+        If the request is being timed, the time to the first byte of the
+        response is recorded.
+        """
+        if hasattr(req, 'selector'):
+            selector = req.selector
+        else:
+            selector = req.get_selector()
+
+        if isinstance(req.data, MultipartBody):
+            req.data.rewind()
+
+        start = time.time()
+        connection.request(req.get_method(), selector, req.data, headers)
+        response = connection.getresponse()
+
+        if timing is not None:
+            timing.ttfb = time.time() - start
+
+        return response
+
+    def _is_stale_connection_error(self, e):
+        """Return whether an error means a pooled connection had been closed.
+
+        These errors all happen before any part of a response was received,
+        so the server did not process the request and it is safe to send it
+        again, regardless of the HTTP method.
+        """
+        if isinstance(e, http_client.BadStatusLine):
+            # RemoteDisconnected (Python 3) is a subclass of BadStatusLine.
+            # Python 2 reports a closed connection as an empty status line.
+            return (e.__class__.__name__ == 'RemoteDisconnected' or
+                    e.line in ('', "''"))
+
+        return getattr(e, 'errno', None) in STALE_CONNECTION_ERRNOS
+
+
+class KeepAliveHTTPHandler(KeepAliveHandlerMixin, HTTPHandler):
+    """Handler for http:// URLs using persistent connections."""
+    def http_open(self, req):
+        return self.do_keep_alive_open(http_client.HTTPConnection, req)
+
+
+if HTTPSHandler is not None:
+    class KeepAliveHTTPSHandler(KeepAliveHandlerMixin, HTTPSHandler):
+        """Handler for https:// URLs using persistent connections."""
+        def https_open(self, req):
+            http_conn_args = {}
+            context = getattr(self, '_context', None)
+
+            if context is not None:
+                http_conn_args['context'] = context
+
+            return self.do_keep_alive_open(http_client.HTTPSConnection, req,
+                                           **http_conn_args)
+else:
+    KeepAliveHTTPSHandler = None
+
+
 class ReviewBoardHTTPBasicAuthHandler(HTTPBasicAuthHandler):
     """Custom Basic Auth handler that doesn't retry excessively.
 
@@ -230,10 +944,42 @@ class ReviewBoardHTTPBasicAuthHandler(HTTPBasicAuthHandler):
 
     def __init__(self, *args, **kwargs):
         HTTPBasicAuthHandler.__init__(self, *args, **kwargs)
-        self._retried = False
-        self._lasturl = ""
-        self._needs_otp_token = False
-        self._otp_token_attempts = 0
+
+        # The retry state belongs to the request being authenticated, so
+        # it's kept per thread when requests are made concurrently.
+        self._state = threading.local()
+
+    @property
+    def _retried(self):
+        return getattr(self._state, 'retried', False)
+
+    @_retried.setter
+    def _retried(self, value):
+        self._state.retried = value
+
+    @property
+    def _lasturl(self):
+        return getattr(self._state, 'lasturl', '')
+
+    @_lasturl.setter
+    def _lasturl(self, value):
+        self._state.lasturl = value
+
+    @property
+    def _needs_otp_token(self):
+        return getattr(self._state, 'needs_otp_token', False)
+
+    @_needs_otp_token.setter
+    def _needs_otp_token(self, value):
+        self._state.needs_otp_token = value
+
+    @property
+    def _otp_token_attempts(self):
+        return getattr(self._state, 'otp_token_attempts', 0)
+
+    @_otp_token_attempts.setter
+    def _otp_token_attempts(self, value):
+        self._state.otp_token_attempts = value
 
     def retry_http_basic_auth(self, host, request, realm, *args, **kwargs):
         if self._lasturl != host:
@@ -259,8 +1005,7 @@ class ReviewBoardHTTPBasicAuthHandler(HTTPBasicAuthHandler):
         if password is None:
             return None
 
-        raw = '%s:%s' % (user, password)
-        auth = 'Basic %s' % base64.b64encode(raw).strip()
+        auth = make_basic_auth_header(user, password)
 
         if (request.headers.get(self.auth_header, None) == auth and
             (not self._needs_otp_token or
@@ -324,16 +1069,23 @@ class ReviewBoardHTTPPasswordMgr(HTTPPasswordMgr):
         self.auth_callback = auth_callback
         self.otp_token_callback = otp_token_callback
 
+        # Requests on several threads may need credentials at once. The
+        # callbacks are called one at a time, so that the user is only
+        # prompted once, and the other requests reuse the credentials.
+        self._callback_lock = threading.RLock()
+
     def find_user_password(self, realm, uri):
         if realm == 'Web API':
-            if self.auth_callback:
-                username, password = self.auth_callback(realm, uri,
-                                                        username=self.rb_user,
-                                                        password=self.rb_pass)
-                self.rb_user = username
-                self.rb_pass = password
-
-            return self.rb_user, self.rb_pass
+            with self._callback_lock:
+                if self.auth_callback:
+                    username, password = self.auth_callback(
+                        realm, uri,
+                        username=self.rb_user,
+                        password=self.rb_pass)
+                    self.rb_user = username
+                    self.rb_pass = password
+
+                return self.rb_user, self.rb_pass
         else:
             # If this is an auth request for some other domain (since HTTP
             # handlers are global), fall back to standard password management.
@@ -341,7 +1093,8 @@ class ReviewBoardHTTPPasswordMgr(HTTPPasswordMgr):
 
     def get_otp_token(self, uri, method):
         if self.otp_token_callback:
-            return self.otp_token_callback(uri, method)
+            with self._callback_lock:
+                return self.otp_token_callback(uri, method)
 
 
 def create_cookie_jar(cookie_file=None):
@@ -392,10 +1145,36 @@ class ReviewBoardServer(object):
     be passed the realm, and url of the Review Board server and should
     return a 2-tuple of username, password. The user can be prompted
     for their credentials using this mechanism.
+
+    If ``keep_alive`` is True, requests are sent over persistent HTTP/1.1
+    connections which are reused across API calls, instead of opening a new
+    connection (and TLS session) for every request.
+
+    If ``compress_responses`` is True, the server is asked for gzip- or
+    deflate-compressed responses, which are decoded transparently before
+    they reach the API cache or the caller.
+
+    If ``compress_uploads`` is True, the bodies of requests which allow it
+    (such as diff uploads) are sent gzip-compressed, unless they stream the
+    content of files, which would then have to be held in memory.
+
+    The ``retry_policy`` parameter takes a :py:class:`RetryPolicy` deciding
+    which failed requests are retried. By default, safe requests are
+    retried up to 3 times.
+
+    The ``cache_max_size`` and ``cache_max_entries`` parameters limit the
+    size of the API cache, once it's enabled. See
+    :py:class:`rbtools.api.cache.APICache` for the defaults.
     """
     def __init__(self, url, cookie_file=None, username=None, password=None,
                  api_token=None, agent=None, session=None, disable_proxy=False,
-                 auth_callback=None, otp_token_callback=None):
+                 auth_callback=None, otp_token_callback=None,
+                 keep_alive=False, compress_responses=False,
+                 compress_uploads=False, retry_policy=None,
+                 cache_max_size=APICache.DEFAULT_MAX_SIZE,
+                 cache_max_entries=APICache.DEFAULT_MAX_ENTRIES,
+                 cache_stale_while_revalidate=0, offline=False,
+                 cache_server=None):
         self.url = url
         if not self.url.endswith('/'):
             self.url += '/'
@@ -403,6 +1182,8 @@ class ReviewBoardServer(object):
         self.url = self.url + 'api/'
         self.cookie_jar, self.cookie_file = create_cookie_jar(
             cookie_file=cookie_file)
+        self._cookie_lock = threading.Lock()
+        self.retry_policy = retry_policy or RetryPolicy()
 
         try:
             self.cookie_jar.load(ignore_expires=True)
@@ -460,8 +1241,24 @@ class ReviewBoardServer(object):
             HTTPDigestAuthHandler(password_mgr),
             self.preset_auth_handler,
             ReviewBoardHTTPErrorProcessor(),
+            RewindBodyHandler(),
         ]
 
+        self.compress_responses = compress_responses
+        self.compress_uploads = compress_uploads
+
+        if compress_responses:
+            handlers.append(ContentDecodingHandler())
+
+        if keep_alive:
+            self.connection_pool = ConnectionPool()
+            handlers.append(KeepAliveHTTPHandler(self.connection_pool))
+
+            if KeepAliveHTTPSHandler is not None:
+                handlers.append(KeepAliveHTTPSHandler(self.connection_pool))
+        else:
+            self.connection_pool = None
+
         if agent:
             self.agent = agent
         else:
@@ -474,13 +1271,62 @@ class ReviewBoardServer(object):
         install_opener(opener)
 
         self._cache = None
+        self._cache_enabled = False
         self._urlopen = urlopen
+        self.cache_max_size = cache_max_size
+        self.cache_max_entries = cache_max_entries
+        self.cache_stale_while_revalidate = cache_stale_while_revalidate
+        self.offline = offline
+        self.cache_server = cache_server
+
+        if offline:
+            # Every response has to come from the cache, including the
+            # root resource (which is normally fetched before the cache is
+            # enabled).
+            self.enable_cache()
 
     def enable_cache(self):
         """Enable caching for all future requests."""
+        self._urlopen = self._get_cache().make_request
+        self._cache_enabled = True
+
+    def _get_cache(self):
+        """Return the API cache, opening it if it isn't open yet."""
         if not self._cache:
-            self._cache = APICache()
-            self._urlopen = self._cache.make_request
+            if self.cache_server:
+                try:
+                    self._cache = RemoteAPICache(
+                        self.cache_server,
+                        stale_while_revalidate=(
+                            self.cache_stale_while_revalidate),
+                        offline=self.offline)
+                except socket.error as e:
+                    logging.warning('Could not connect to the API cache '
+                                    'server at %s: %s. Using the local '
+                                    'HTTP cache for the API instead.',
+                                    self.cache_server, e)
+
+            if not self._cache:
+                self._cache = APICache(
+                    max_size=self.cache_max_size,
+                    max_entries=self.cache_max_entries,
+                    stale_while_revalidate=self.cache_stale_while_revalidate,
+                    offline=self.offline)
+
+        return self._cache
+
+    def close(self):
+        """Close any persistent connections to the server.
+
+        This also commits any writes buffered by the API cache. The cache
+        is closed first, since its background revalidations may still be
+        using the connections.
+        """
+        if self._cache is not None:
+            self._cache.close()
+
+        if self.connection_pool is not None:
+            self.connection_pool.close()
 
     def login(self, username, password):
         """Reset the user information"""
@@ -516,30 +1362,138 @@ class ReviewBoardServer(object):
 
         The request argument should be an instance of
         'rbtools.api.request.HttpRequest'.
+
+        If compressed uploads are enabled and the request allows it, the body
+        is sent gzip-compressed. If the server rejects the compressed body,
+        the request is sent again uncompressed, and compression is turned
+        off for all further requests.
         """
+        compress = self.compress_uploads and request.compress_body
+
         try:
-            content_type, body = request.encode_multipart_formdata()
+            return self._make_request(request, compress=compress)
+        except APIError as e:
+            if not compress or not self._is_compression_rejected(e):
+                raise
+
+            logging.debug('The server rejected a compressed request body '
+                          '(%s); sending it uncompressed', e)
+            self.compress_uploads = False
+
+            return self._make_request(request, compress=False)
+
+    def _make_request(self, request, compress=False):
+        """Perform an http request, optionally compressing the body."""
+        try:
+            content_type, body = request.encode_multipart_body()
             headers = request.headers
+            headers.pop(str('Content-Encoding'), None)
+
+            if body and compress and not body.has_files():
+                body = compress_body(body)
+                headers[str('Content-Encoding')] = 'gzip'
 
             if body:
                 headers.update({
-                    b'Content-Type': content_type,
-                    b'Content-Length': str(len(body)),
+                    str('Content-Type'): content_type,
+                    str('Content-Length'): str(len(body)),
                 })
             else:
-                headers[b'Content-Length'] = '0'
+                headers[str('Content-Length')] = '0'
+
+            if self.compress_responses:
+                headers.setdefault(str('Accept-Encoding'), ACCEPT_ENCODING)
+
+            url = request.url
+            method = request.method
 
-            r = Request(request.url.encode('utf-8'), body, headers,
-                        request.method.encode('utf-8'))
-            rsp = self._urlopen(r)
+            if six.PY2:
+                url = url.encode('utf-8')
+                method = method.encode('utf-8')
+            elif isinstance(method, bytes):
+                method = method.decode('utf-8')
+
+            r = Request(url, body, headers, method)
+            rsp = self._urlopen_with_retries(r)
+
+            if (request.method == 'GET' and request.url == self.url and
+                not self._cache_enabled):
+                # The root resource is fetched before the cache is enabled.
+                # It's stored anyway, so that offline mode can use it.
+                rsp = self._get_cache().save_response(r, rsp)
         except HTTPError as e:
             self.process_error(e.code, e.read())
         except URLError as e:
             raise ServerInterfaceError('%s' % e.reason)
 
         try:
-            self.cookie_jar.save()
+            with self._cookie_lock:
+                self.cookie_jar.save()
         except IOError:
             pass
 
         return rsp
+
+    def _urlopen_with_retries(self, r):
+        """Open a request, retrying transient failures.
+
+        The retry policy decides which failures are retried and how long to
+        wait before each retry. The last failure is raised once no more
+        retries are allowed.
+        """
+        retry_policy = self.retry_policy
+        attempt = 0
+        waited = 0
+
+        while True:
+            try:
+                return self._urlopen(r)
+            except HTTPError as e:
+                delay = None
+
+                if retry_policy.should_retry(r.get_method(), attempt,
+                                             status=e.code):
+                    delay = retry_policy.get_delay(attempt, waited, e.info())
+
+                if delay is None:
+                    raise
+
+                reason = 'HTTP %d' % e.code
+                e.close()
+            except URLError as e:
+                delay = None
+
+                if retry_policy.should_retry(r.get_method(), attempt,
+                                             error=e.reason):
+                    delay = retry_policy.get_delay(attempt, waited)
+
+                if delay is None:
+                    raise
+
+                reason = e.reason
+
+            logging.debug('HTTP %s request to %s failed (%s); retrying in '
+                          '%.1f seconds', r.get_method(), r.get_full_url(),
+                          reason, delay)
+            retry_policy.sleep(delay)
+            waited += delay
+            attempt += 1
+
+    def _is_compression_rejected(self, e):
+        """Return whether an error means a compressed body wasn't understood.
+
+        Servers that don't support compressed request bodies either reject
+        the Content-Encoding outright (HTTP 415), or fail to parse the body
+        and report the form data as invalid (API error 105) with the diff
+        file missing. Any other invalid form data is a genuine error in the
+        request, which sending it uncompressed won't fix.
+        """
+        if e.http_status == 415:
+            return True
+
+        if e.http_status == 400 and e.error_code == 105:
+            fields = (e.rsp or {}).get('fields') or {}
+
+            return 'path' in fields
+
+        return False
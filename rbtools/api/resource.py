@@ -1,11 +1,14 @@
 from __future__ import unicode_literals
 
+import functools
 import re
+from multiprocessing.pool import ThreadPool
 
 import six
 from pkg_resources import parse_version
 from six.moves import range
-from six.moves.urllib.parse import urljoin
+from six.moves.urllib.parse import (parse_qsl, urlencode, urljoin,
+                                    urlparse, urlunparse)
 
 from rbtools.api.cache import MINIMUM_VERSION
 from rbtools.api.decorators import request_method_decorator
@@ -15,7 +18,10 @@ from rbtools.api.request import HttpRequest
 RESOURCE_MAP = {}
 LINKS_TOK = 'links'
 LINK_KEYS = set(['href', 'method', 'title'])
-_EXCLUDE_ATTRS = [LINKS_TOK, 'stat']
+_EXCLUDE_ATTRS = set([LINKS_TOK, 'stat'])
+
+# The default number of pages fetched at once by ListResource.parallel_pages.
+DEFAULT_PAGINATION_WORKERS = 4
 
 
 def resource_mimetype(mimetype):
@@ -98,6 +104,35 @@ SPECIAL_LINKS = {
     'update': ['update', _update],
 }
 
+# A mapping of the names of the generated REST operation methods to their
+# link and the method used for generating the request.
+_SPECIAL_LINK_METHODS = dict(
+    (name, (link, meth))
+    for link, (name, meth) in six.iteritems(SPECIAL_LINKS)
+    if meth is not None
+)
+
+
+def _wrap_field(resource, field):
+    """Wrap a field of a resource or record for access by the caller.
+
+    Dictionaries are wrapped as ResourceLinkField (if they describe a link)
+    or ResourceDictField, and lists as ResourceListField. Nested fields are
+    only wrapped when they're accessed.
+    """
+    if isinstance(field, dict):
+        dict_keys = set(field.keys())
+
+        if ('href' in dict_keys and
+            len(dict_keys.difference(LINK_KEYS)) == 0):
+            return ResourceLinkField(resource, field)
+        else:
+            return ResourceDictField(resource, field)
+    elif isinstance(field, list):
+        return ResourceListField(resource, field)
+    else:
+        return field
+
 
 class Resource(object):
     """Defines common functionality for Item and List Resources.
@@ -114,15 +149,29 @@ class Resource(object):
     'self' link will be generated with the name 'get_self'. Each
     additional link will have a method generated which constructs a
     request for retrieving the linked resource.
+
+    If a :py:class:`rbtools.api.projection.Projection` is registered on the
+    transport for a link, its 'get_<link>()' method requests only the
+    fields and links of the projection, unless 'only_fields' or
+    'only_links' are passed explicitly. The projection the resource itself
+    was requested with is kept in '_projection'.
+
+    Resources define __slots__, so that large lists of them stay compact.
+    Subclasses should define __slots__ as well, listing any attributes
+    they add.
     """
+    __slots__ = ('_url', '_transport', '_token', '_payload', '_links',
+                 '_projection')
+
     _excluded_attrs = []
 
-    def __init__(self, transport, payload, url, token=None, **kwargs):
+    def __init__(self, transport, payload, url, token=None, projection=None,
+                 **kwargs):
         self._url = url
         self._transport = transport
         self._token = token
         self._payload = payload
-        self._excluded_attrs = self._excluded_attrs + _EXCLUDE_ATTRS
+        self._projection = projection
 
         # Determine where the links live in the payload. This
         # can either be at the root, or inside the resources
@@ -136,37 +185,63 @@ class Resource(object):
             self._payload[LINKS_TOK] = {}
             self._links = {}
 
-        # Add a method for each supported REST operation, and
-        # for retrieving 'self'.
-        for link, method in six.iteritems(SPECIAL_LINKS):
-            if link in self._links and method[1]:
-                setattr(self,
-                        method[0],
-                        lambda resource=self, meth=method[1], **kwargs: (
-                            meth(resource, **kwargs)))
-
-        # Generate request methods for any additional links
-        # the resource has.
-        for link, body in six.iteritems(self._links):
-            if link not in SPECIAL_LINKS:
-                setattr(self,
-                        'get_%s' % link,
-                        lambda resource=self, url=body['href'], **kwargs: (
-                            self._get_url(url, **kwargs)))
-
-    def _wrap_field(self, field):
-        if isinstance(field, dict):
-            dict_keys = set(field.keys())
-
-            if ('href' in dict_keys and
-                len(dict_keys.difference(LINK_KEYS)) == 0):
-                return ResourceLinkField(self, field)
-            else:
-                return ResourceDictField(self, field)
-        elif isinstance(field, list):
-            return ResourceListField(self, field)
+    def __getattr__(self, name):
+        method = self._get_link_method(name)
+
+        if method is None:
+            raise AttributeError(name)
+
+        return method
+
+    def _get_link_method(self, name):
+        """Return the request method for one of the resource's links.
+
+        Methods for the supported REST operations (e.g. 'update()') and
+        'get_self()' are looked up in SPECIAL_LINKS, and every other link
+        has a 'get_<link>()' method. These are created when they're
+        accessed, rather than for every resource up front.
+
+        None is returned if the name doesn't correspond to a link.
+        """
+        if name.startswith('_'):
+            return None
+
+        links = self._links
+
+        if name in _SPECIAL_LINK_METHODS:
+            link, meth = _SPECIAL_LINK_METHODS[name]
+
+            if link in links:
+                return functools.partial(meth, self)
+        elif name.startswith('get_'):
+            link = name[4:]
+
+            if link in links and link not in SPECIAL_LINKS:
+                return self._make_get_method(self._get_url, link,
+                                             links[link]['href'])
+
+        return None
+
+    def _make_get_method(self, get_url, name, *args):
+        """Return a method fetching a resource, applying its projection.
+
+        name is the name of the link or URI template for the resource,
+        which the projection is looked up by.
+        """
+        projection = self._transport.projections.get(name)
+
+        if projection is None:
+            return functools.partial(get_url, *args)
         else:
-            return field
+            return functools.partial(get_url, *args,
+                                     **projection.get_query_args())
+
+    def _check_projection(self, name):
+        """Warn if an attribute is missing due to the projection."""
+        if self._projection is not None:
+            self._projection.check_attribute(name, self._url)
+
+    _wrap_field = _wrap_field
 
     @property
     def links(self):
@@ -195,6 +270,8 @@ class ResourceDictField(object):
     class. Attribute access will correspond to accessing the
     dictionary key with the name of the attribute.
     """
+    __slots__ = ('_resource', '_fields')
+
     def __init__(self, resource, fields):
         self._resource = resource
         self._fields = fields
@@ -241,6 +318,8 @@ class ResourceLinkField(ResourceDictField):
     calls. Currently the only supported method is "GET", which can be
     invoked using the 'get' method.
     """
+    __slots__ = ('_transport',)
+
     def __init__(self, resource, fields):
         super(ResourceLinkField, self).__init__(resource, fields)
         self._transport = resource._transport
@@ -255,6 +334,8 @@ class ResourceListField(list):
 
     Acts as a normal list, but wraps any returned items.
     """
+    __slots__ = ('_resource',)
+
     def __init__(self, resource, list_field):
         super(ResourceListField, self).__init__(list_field)
         self._resource = resource
@@ -282,32 +363,41 @@ class ItemResource(Resource):
     not exist for an Item Resource payload, this class will be used to
     create the resource.
 
-    The body of the resource is copied into the fields dictionary. The
+    The fields dictionary refers to the body of the resource, rather than
+    a copy of it, and fields are only wrapped when they're accessed. The
     Transport is responsible for providing access to this data,
     preferably as attributes for the wrapping class.
     """
+    __slots__ = ('_fields',)
+
     _excluded_attrs = []
 
     def __init__(self, transport, payload, url, token=None, **kwargs):
         super(ItemResource, self).__init__(transport, payload, url,
                                            token=token, **kwargs)
-        self._fields = {}
 
         # Determine the body of the resource's data.
         if token is not None:
-            data = self._payload[token]
+            self._fields = self._payload[token]
         else:
-            data = self._payload
+            self._fields = self._payload
 
-        for name, value in six.iteritems(data):
-            if name not in self._excluded_attrs:
-                self._fields[name] = value
+    def _is_field(self, name):
+        """Return whether the name is a field of the resource."""
+        return (name in self._fields and
+                name not in _EXCLUDE_ATTRS and
+                name not in self._excluded_attrs)
 
     def __getattr__(self, name):
-        if name in self._fields:
+        method = self._get_link_method(name)
+
+        if method is not None:
+            return method
+        elif self._is_field(name):
             return self._wrap_field(self._fields[name])
         else:
-            raise AttributeError
+            self._check_projection(name)
+            raise AttributeError(name)
 
     def __getitem__(self, key):
         try:
@@ -316,15 +406,17 @@ class ItemResource(Resource):
             raise KeyError
 
     def __contains__(self, key):
-        return key in self._fields
+        return self._is_field(key)
 
     def iterfields(self):
         for key in self._fields:
-            yield key
+            if self._is_field(key):
+                yield key
 
     def iteritems(self):
         for key, value in six.iteritems(self._fields):
-            yield (key, self._wrap_field(value))
+            if self._is_field(key):
+                yield (key, self._wrap_field(value))
 
     def __repr__(self):
         return '%s(transport=%r, payload=%r, url=%r, token=%r)' % (
@@ -343,6 +435,8 @@ class CountResource(ItemResource):
     special case all payloads of this form, this class is used for
     resource construction.
     """
+    __slots__ = ()
+
     def __init__(self, transport, payload, url, **kwargs):
         super(CountResource, self).__init__(transport, payload, url,
                                             token=None)
@@ -364,6 +458,70 @@ class CountResource(ItemResource):
         return HttpRequest(self._url, query_args=kwargs)
 
 
+class ItemRecord(object):
+    """A lightweight, read-only view of an item in a list resource.
+
+    Records provide the fields and links of an item, like an ItemResource,
+    but none of its request methods. This makes them much cheaper to create
+    when scanning large lists, such as through ListResource.all_records.
+    The full item resource can be retrieved through the 'resource'
+    property.
+    """
+    __slots__ = ('_list', '_fields')
+
+    def __init__(self, list_resource, payload):
+        self._list = list_resource
+        self._fields = payload
+
+    _wrap_field = _wrap_field
+
+    @property
+    def _transport(self):
+        return self._list._transport
+
+    @property
+    def links(self):
+        """Get the item's links."""
+        return ResourceDictField(self, self._fields.get(LINKS_TOK, {}))
+
+    @property
+    def resource(self):
+        """Return the full item resource for the record."""
+        return self._list._make_item(self._fields)
+
+    def __getattr__(self, name):
+        if name in self._fields and name not in _EXCLUDE_ATTRS:
+            return self._wrap_field(self._fields[name])
+        else:
+            self._list._check_projection(name)
+            raise AttributeError(name)
+
+    def __getitem__(self, key):
+        try:
+            return self.__getattr__(key)
+        except AttributeError:
+            raise KeyError
+
+    def __contains__(self, key):
+        return key in self._fields and key not in _EXCLUDE_ATTRS
+
+    def iterfields(self):
+        for key in self._fields:
+            if key not in _EXCLUDE_ATTRS:
+                yield key
+
+    def iteritems(self):
+        for key, value in six.iteritems(self._fields):
+            if key not in _EXCLUDE_ATTRS:
+                yield (key, self._wrap_field(value))
+
+    def __repr__(self):
+        return '%s(list_resource=%r, payload=%r)' % (
+            self.__class__.__name__,
+            self._list,
+            self._fields)
+
+
 class ListResource(Resource):
     """The base class for List Resources.
 
@@ -378,7 +536,14 @@ class ListResource(Resource):
     not the entire list of resources. To iterate over all item
     resources 'get_next()' or 'get_prev()' should be used to grab
     additional pages of items.
+
+    When only the fields of the items are needed, 'records' and
+    'all_records' provide read-only ItemRecords, which are cheaper to
+    create than item resources.
     """
+    __slots__ = ('_item_mime_type', '_item_list', 'num_items',
+                 'total_results')
+
     def __init__(self, transport, payload, url, token=None,
                  item_mime_type=None, **kwargs):
         super(ListResource, self).__init__(transport, payload, url,
@@ -403,8 +568,10 @@ class ListResource(Resource):
         return True
 
     def __getitem__(self, key):
-        payload = self._item_list[key]
+        return self._make_item(self._item_list[key])
 
+    def _make_item(self, payload):
+        """Return the item resource for an item's payload."""
         # TODO: Should try and guess the url based on the parent url,
         # and the id number if the self link doesn't exist.
         try:
@@ -419,7 +586,8 @@ class ListResource(Resource):
                                payload,
                                url,
                                mime_type=self._item_mime_type,
-                               guess_token=False)
+                               guess_token=False,
+                               projection=self._projection)
 
     def __iter__(self):
         for i in range(self.num_items):
@@ -451,20 +619,182 @@ class ListResource(Resource):
 
         Each page of resources is itself an instance of the same
         ``ListResource`` class.
+
+        This can't be used with an asynchronous transport. See
+        :py:meth:`rbtools.api.transport.asynchronous.AsyncTransport.
+        get_all_pages` instead.
         """
+        self._check_blocking_pagination()
         page = self
 
         while True:
             yield page
-            page = page.get_next()
+
+            try:
+                page = page.get_next()
+            except StopIteration:
+                return
 
     @property
     def all_items(self):
-        """Yield all item resources in all pages of this resource."""
-        for page in self.all_pages:
+        """Yield all item resources in all pages of this resource.
+
+        If the transport supports it, the pages following this one are
+        decoded incrementally as they're received, so that only one of
+        their items is held in memory at a time. See
+        :py:meth:`rbtools.api.transport.Transport.stream_list`.
+        """
+        for payload in self._iter_all_item_payloads():
+            yield self._make_item(payload)
+
+    @property
+    def records(self):
+        """Yield a read-only ItemRecord for each item in this page."""
+        for payload in self._item_list:
+            yield ItemRecord(self, payload)
+
+    @property
+    def all_records(self):
+        """Yield read-only ItemRecords for all items in all pages.
+
+        This behaves like :py:attr:`all_items`, but is much cheaper for
+        scans of large lists which only read the fields of each item.
+        """
+        for payload in self._iter_all_item_payloads():
+            yield ItemRecord(self, payload)
+
+    def _iter_all_item_payloads(self):
+        """Yield the payloads of all items in all pages of this resource.
+
+        The following pages are decoded incrementally if the transport
+        supports it. Otherwise, each page is fetched in full.
+        """
+        self._check_blocking_pagination()
+
+        for payload in self._item_list:
+            yield payload
+
+        links = self._links
+
+        while 'next' in links:
+            url = links['next']['href']
+            decoder = self._transport.stream_list(HttpRequest(url))
+
+            if decoder is None:
+                page = self._get_url(url)
+
+                for payload in page._item_list:
+                    yield payload
+
+                links = page._links
+            else:
+                try:
+                    for payload in decoder:
+                        yield payload
+                finally:
+                    decoder.close()
+
+                links = decoder.payload.get(LINKS_TOK, {})
+
+    def parallel_pages(self, max_workers=DEFAULT_PAGINATION_WORKERS):
+        """Yield all pages of item resources, fetching them concurrently.
+
+        This behaves like :py:attr:`all_pages`, but rather than following
+        the ``next`` link of each page in turn, the URLs of all remaining
+        pages are computed up front from ``total_results`` and the
+        ``start`` and ``max-results`` arguments of the ``next`` link. Up
+        to ``max_workers`` pages are then fetched at the same time. Pages
+        are still yielded in order.
+
+        If the page URLs can't be computed, this falls back to following
+        the ``next`` links.
+
+        Since all remaining pages are requested right away, this is meant
+        for full scans of a list. Callers which usually stop after the
+        first few items should use :py:attr:`all_pages` instead.
+
+        Like :py:attr:`all_pages`, this can't be used with an asynchronous
+        transport.
+        """
+        self._check_blocking_pagination()
+        page_urls = self._get_page_urls()
+
+        if page_urls is None:
+            for page in self.all_pages:
+                yield page
+
+            return
+
+        yield self
+
+        if not page_urls:
+            return
+
+        pool = ThreadPool(min(max_workers, len(page_urls)))
+
+        try:
+            for page in pool.imap(self._fetch_page, page_urls):
+                yield page
+        finally:
+            pool.terminate()
+
+    def parallel_items(self, max_workers=DEFAULT_PAGINATION_WORKERS):
+        """Yield all item resources in all pages, fetching them concurrently.
+
+        See :py:meth:`parallel_pages` for details.
+        """
+        for page in self.parallel_pages(max_workers=max_workers):
             for item in page:
                 yield item
 
+    def _get_page_urls(self):
+        """Return the URLs of all pages following this one.
+
+        This returns None if the pagination of the list can't be determined
+        from the ``next`` link.
+        """
+        if 'next' not in self._links:
+            return []
+
+        url_parts = list(urlparse(self._links['next']['href']))
+        query = dict(parse_qsl(url_parts[4]))
+
+        try:
+            start = int(query['start'])
+            max_results = int(query.get('max-results', self.num_items))
+        except (KeyError, ValueError):
+            return None
+
+        if max_results <= 0:
+            return None
+
+        page_urls = []
+
+        for page_start in range(start, self.total_results, max_results):
+            query.update({
+                'start': page_start,
+                'max-results': max_results,
+            })
+            url_parts[4] = urlencode(query)
+            page_urls.append(urlunparse(url_parts))
+
+        return page_urls
+
+    def _fetch_page(self, url):
+        return self._get_url(url)
+
+    def _check_blocking_pagination(self):
+        """Raise an error if the transport can't fetch pages while iterating.
+
+        An asynchronous transport returns awaitables for the following
+        pages, which can't be iterated over.
+        """
+        if self._transport.is_async:
+            raise NotImplementedError(
+                'Pages of a list resource cannot be iterated over with an '
+                'asynchronous transport. Use get_all_pages() or '
+                'get_all_items() on the transport instead.')
+
     def __repr__(self):
         return ('%s(transport=%r, payload=%r, url=%r, token=%r, '
                 'item_mime_type=%r)' % (self.__class__.__name__,
@@ -485,21 +815,14 @@ class RootResource(ItemResource):
     resource. Template replacement values should be passed in as a
     dictionary to the values parameter.
     """
+    __slots__ = ('_uri_templates',)
+
     _excluded_attrs = ['uri_templates']
     _TEMPLATE_PARAM_RE = re.compile('\{(?P<key>[A-Za-z_0-9]*)\}')
 
     def __init__(self, transport, payload, url, **kwargs):
         super(RootResource, self).__init__(transport, payload, url, token=None)
-        # Generate methods for accessing resources directly using
-        # the uri-templates.
-        for name, url in six.iteritems(payload['uri_templates']):
-            attr_name = 'get_%s' % name
-
-            if not hasattr(self, attr_name):
-                setattr(self,
-                        attr_name,
-                        lambda resource=self, url=url, **kwargs: (
-                            self._get_template_request(url, **kwargs)))
+        self._uri_templates = payload['uri_templates']
 
         server_version = payload.get('product', {}).get('package_version')
 
@@ -507,6 +830,30 @@ class RootResource(ItemResource):
             parse_version(server_version) >= parse_version(MINIMUM_VERSION)):
             transport.enable_cache()
 
+    def __getattr__(self, name):
+        try:
+            return super(RootResource, self).__getattr__(name)
+        except AttributeError:
+            # Methods for accessing resources directly using the
+            # uri-templates are created when they're accessed.
+            if (name.startswith('get_') and
+                name[4:] in self._uri_templates):
+                return self._make_get_method(self._get_template_request,
+                                             name[4:],
+                                             self._uri_templates[name[4:]])
+
+            raise
+
+    def execute_batch(self, requests, **kwargs):
+        """Execute several requests concurrently.
+
+        The requests should be created by calling resource methods with
+        ``internal=True``. The results are returned in the same order as
+        the requests, as described in
+        :py:meth:`rbtools.api.transport.Transport.execute_batch`.
+        """
+        return self._transport.execute_batch(requests, **kwargs)
+
     @request_method_decorator
     def _get_template_request(self, url_template, values={}, **kwargs):
         """Generate an HttpRequest from a uri-template.
@@ -531,6 +878,8 @@ class RootResource(ItemResource):
 class DiffUploaderMixin(object):
     """A mixin for uploading diffs to a resource."""
 
+    __slots__ = ()
+
     def prepare_upload_diff_request(self, diff, parent_diff=None,
                                     base_dir=None, base_commit_id=None,
                                     **kwargs):
@@ -540,6 +889,7 @@ class DiffUploaderMixin(object):
         diff output.
         """
         request = HttpRequest(self._url, method=b'POST', query_args=kwargs)
+        request.compress_body = True
         request.add_file('path', 'diff', diff)
 
         if parent_diff:
@@ -562,6 +912,8 @@ class DiffListResource(DiffUploaderMixin, ListResource):
     diffs.
     """
 
+    __slots__ = ()
+
     @request_method_decorator
     def upload_diff(self, diff, parent_diff=None, base_dir=None,
                     base_commit_id=None, **kwargs):
@@ -585,6 +937,9 @@ class DiffResource(ItemResource):
     Provides the 'get_patch' method for retrieving the content of the
     actual diff file itself.
     """
+
+    __slots__ = ()
+
     @request_method_decorator
     def get_patch(self, **kwargs):
         """Retrieves the actual diff file contents."""
@@ -596,6 +951,9 @@ class DiffResource(ItemResource):
 @resource_mimetype('application/vnd.reviewboard.org.file')
 class FileDiffResource(ItemResource):
     """The File Diff resource specific base class."""
+
+    __slots__ = ()
+
     @request_method_decorator
     def get_patch(self, **kwargs):
         """Retrieves the actual diff file contents."""
@@ -615,12 +973,16 @@ class FileDiffResource(ItemResource):
 @resource_mimetype('application/vnd.reviewboard.org.file-attachments')
 class FileAttachmentListResource(ListResource):
     """The File Attachment List resource specific base class."""
+
+    __slots__ = ()
+
     @request_method_decorator
     def upload_attachment(self, filename, content, caption=None, **kwargs):
         """Uploads a new attachment.
 
         The content argument should contain the body of the file to be
-        uploaded, in string format.
+        uploaded, in string format, or be a file object opened in binary
+        mode.
         """
         request = HttpRequest(self._url, method=b'POST', query_args=kwargs)
         request.add_file('path', filename, content)
@@ -634,18 +996,23 @@ class FileAttachmentListResource(ListResource):
 @resource_mimetype('application/vnd.reviewboard.org.draft-file-attachments')
 class DraftFileAttachmentListResource(FileAttachmentListResource):
     """The Draft File Attachment List resource specific base class."""
-    pass
+
+    __slots__ = ()
 
 
 @resource_mimetype('application/vnd.reviewboard.org.screenshots')
 class ScreenshotListResource(ListResource):
     """The Screenshot List resource specific base class."""
+
+    __slots__ = ()
+
     @request_method_decorator
     def upload_screenshot(self, filename, content, caption=None, **kwargs):
         """Uploads a new screenshot.
 
         The content argument should contain the body of the screenshot
-        to be uploaded, in string format.
+        to be uploaded, in string format, or be a file object opened in
+        binary mode.
         """
         request = HttpRequest(self._url, method=b'POST', query_args=kwargs)
         request.add_file('path', filename, content)
@@ -659,13 +1026,16 @@ class ScreenshotListResource(ListResource):
 @resource_mimetype('application/vnd.reviewboard.org.draft-screenshots')
 class DraftScreenshotListResource(ScreenshotListResource):
     """The Draft Screenshot List resource specific base class."""
-    pass
+
+    __slots__ = ()
 
 
 @resource_mimetype('application/vnd.reviewboard.org.review-request')
 class ReviewRequestResource(ItemResource):
     """The Review Request resource specific base class."""
 
+    __slots__ = ()
+
     @property
     def absolute_url(self):
         """Returns the absolute URL for the Review Request.
@@ -724,6 +1094,8 @@ class ValidateDiffResource(DiffUploaderMixin, ItemResource):
     Provides additional functionality to assist in the validation of diffs.
     """
 
+    __slots__ = ()
+
     @request_method_decorator
     def validate_diff(self, repository, diff, parent_diff=None, base_dir=None,
                       base_commit_id=None, **kwargs):
@@ -1,16 +1,56 @@
 from __future__ import unicode_literals
 
+import base64
 import datetime
-import locale
+import errno
+import gc
+import json
+import logging
+import os
 import re
+import shutil
+import socket
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+
+from email.utils import formatdate
+from multiprocessing.pool import ThreadPool
 
 import six
-
-from rbtools.api.cache import APICache, CacheEntry, CachedHTTPResponse
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.error import HTTPError, URLError
+from six.moves.urllib.parse import parse_qsl, urlparse
+from six.moves.urllib.request import build_opener, install_opener
+
+from rbtools.api.cache import (APICache, BaseAPICache, CacheEntry,
+                                CachedHTTPResponse, ResourceCache,
+                                parse_http_date)
+from rbtools.api.cache_server import APICacheServer, RemoteAPICache
 from rbtools.api.capabilities import Capabilities
+from rbtools.api import decode
+from rbtools.api.decode import (JsonListStreamDecoder, decode_response,
+                                get_json_backend, register_json_backend,
+                                set_json_backend)
+from rbtools.api.errors import APIError, ServerInterfaceError
 from rbtools.api.factory import create_resource
-from rbtools.api.request import HttpRequest, Request
+from rbtools.api.instrumentation import HTTPProfiler
+from rbtools.api.projection import Projection
+from rbtools.api.request import (ConnectionPool,
+                                 decompress_body,
+                                 HttpRequest,
+                                 KeepAliveHTTPHandler,
+                                 MultipartBody,
+                                 Request,
+                                 RetryPolicy,
+                                 ReviewBoardServer)
 from rbtools.api.resource import (CountResource,
+                                  ItemRecord,
                                   ItemResource,
                                   ListResource,
                                   ResourceDictField,
@@ -18,8 +58,15 @@ from rbtools.api.resource import (CountResource,
                                   ReviewRequestResource,
                                   RootResource)
 from rbtools.api.transport import Transport
+from rbtools.api.transport.sync import SyncTransport
 from rbtools.testing import TestCase
 
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2.x doesn't provide tracemalloc.
+    tracemalloc = None
+
 
 class CapabilitiesTests(TestCase):
     """Tests for rbtools.api.capabilities.Capabilities"""
@@ -270,6 +317,18 @@ class ResourceTests(TestWithPayloads):
 
         self.assertFalse(hasattr(r, 'create'))
 
+    def test_item_resource_links_created_on_access(self):
+        """Testing item resource link methods are created on access"""
+        r = create_resource(self.transport, self.item_payload, '')
+
+        self.assertFalse(hasattr(r, '__dict__'))
+        self.assertFalse(hasattr(r, 'get_missing_link'))
+        self.assertFalse(hasattr(r, 'get_links'))
+
+        href = self.item_payload['links']['other_link']['href']
+        request = r.get_other_link(expand='other')
+        self.assertEqual(request.url, '%s?expand=other' % href)
+
     def test_list_resource_list(self):
         """Testing list resource lists."""
         r = create_resource(self.transport, self.list_payload, '')
@@ -313,6 +372,32 @@ class ResourceTests(TestWithPayloads):
         self.assertFalse(hasattr(r, 'update'))
         self.assertFalse(hasattr(r, 'delete'))
 
+    def test_list_resource_records(self):
+        """Testing list resource records."""
+        r = create_resource(self.transport, self.list_payload, '')
+        records = list(r.records)
+
+        self.assertEqual(len(records), r.num_items)
+
+        for index, record in enumerate(records):
+            payload = self.list_payload['resource_token'][index]
+
+            self.assertTrue(isinstance(record, ItemRecord))
+            self.assertFalse(hasattr(record, '__dict__'))
+            self.assertEqual(set(record.iterfields()),
+                             set(payload) - set(['links']))
+            self.assertEqual(record.field1, payload['field1'])
+            self.assertEqual(record['field2'], payload['field2'])
+            self.assertFalse('links' in record)
+            self.assertFalse(hasattr(record, 'get_self'))
+            self.assertEqual(record.links.self.href,
+                             payload['links']['self']['href'])
+
+            resource = record.resource
+            self.assertTrue(isinstance(resource, ItemResource))
+            self.assertEqual(resource.field1, payload['field1'])
+            self.assertTrue(callable(resource.get_self))
+
     def test_root_resource_templates(self):
         """Testing generation of methods for the root resource uri templates."""
         r = create_resource(
@@ -326,6 +411,11 @@ class ResourceTests(TestWithPayloads):
             self.assertTrue(hasattr(r, method_name))
             self.assertTrue(callable(getattr(r, method_name)))
 
+        request = r.get_reviews(review_request_id=1)
+        self.assertEqual(
+            request.url,
+            'http://localhost:8080/api/review-requests/1/reviews/')
+
     def test_resource_dict_field(self):
         """Testing access of a dictionary field."""
         r = create_resource(self.transport, self.item_payload, '')
@@ -346,65 +436,2152 @@ class ResourceTests(TestWithPayloads):
         nested_fields = set(
             f for f in self.item_payload['resource_token']['nested_field'])
 
-        self.assertEqual(set(),
-                         nested_fields.symmetric_difference(iterated_fields))
+        self.assertEqual(set(),
+                         nested_fields.symmetric_difference(iterated_fields))
+
+    def test_link_field(self):
+        """Testing access of a link field."""
+        r = create_resource(self.transport, self.item_payload, '')
+
+        field = r.link_field
+        self.assertTrue(isinstance(field, ResourceLinkField))
+
+        request = field.get()
+        self.assertEqual(request.method, 'GET')
+        self.assertEqual(
+            request.url,
+            self.item_payload['resource_token']['link_field']['href'])
+
+
+class RecordingLogHandler(logging.Handler):
+    """A logging handler which records the messages logged."""
+    def __init__(self):
+        super(RecordingLogHandler, self).__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class ProjectionTests(TestWithPayloads):
+    """Tests for requesting resources with a Projection."""
+    def setUp(self):
+        super(ProjectionTests, self).setUp()
+
+        self.transport = MockTransport()
+        self.transport.projections = {
+            'other_link': Projection(fields=['field1', 'field2'],
+                                     links=['self']),
+            'reviews': Projection(fields=['id']),
+        }
+
+        self.log_handler = RecordingLogHandler()
+        root_logger = logging.getLogger()
+        self.old_log_level = root_logger.level
+        root_logger.addHandler(self.log_handler)
+        root_logger.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        root_logger = logging.getLogger()
+        root_logger.removeHandler(self.log_handler)
+        root_logger.setLevel(self.old_log_level)
+
+        super(ProjectionTests, self).tearDown()
+
+    def _get_query(self, request):
+        """Return the query arguments of a request."""
+        return dict(parse_qsl(urlparse(request.url).query,
+                              keep_blank_values=True))
+
+    def test_get_query_args(self):
+        """Testing Projection.get_query_args"""
+        self.assertEqual(
+            Projection(fields=['id', 'summary'], links=[]).get_query_args(),
+            {
+                'only_fields': 'id,summary',
+                'only_links': '',
+            })
+        self.assertEqual(Projection(links=['draft']).get_query_args(),
+                         {'only_links': 'draft'})
+        self.assertEqual(Projection().get_query_args(), {})
+
+    def test_from_url(self):
+        """Testing Projection.from_url"""
+        projection = Projection.from_url(
+            'http://localhost/api/?only-fields=id%2Csummary&only-links=')
+        self.assertEqual(projection.fields, ['id', 'summary'])
+        self.assertEqual(projection.links, [])
+
+        projection = Projection.from_url(
+            'http://localhost/api/?start=25&only-links=draft')
+        self.assertEqual(projection.fields, None)
+        self.assertEqual(projection.links, ['draft'])
+
+        self.assertEqual(
+            Projection.from_url('http://localhost/api/?start=25'), None)
+
+    def test_link_method(self):
+        """Testing link methods request the projection for the link"""
+        r = create_resource(self.transport, self.item_payload, '')
+
+        request = r.get_other_link()
+        self.assertEqual(self._get_query(request), {
+            'only-fields': 'field1,field2',
+            'only-links': 'self',
+        })
+
+        request = r.get_other_link(only_fields='field1', start=5)
+        self.assertEqual(self._get_query(request), {
+            'only-fields': 'field1',
+            'only-links': 'self',
+            'start': '5',
+        })
+
+        self.assertEqual(self._get_query(r.get_self()), {})
+
+    def test_root_resource_template_method(self):
+        """Testing URI template methods request the projection for the
+        template
+        """
+        r = create_resource(
+            self.transport,
+            self.root_payload,
+            '',
+            mime_type='application/vnd.reviewboard.org.root+json')
+
+        request = r.get_reviews(review_request_id=1)
+        self.assertEqual(
+            request.url,
+            'http://localhost:8080/api/review-requests/1/reviews/'
+            '?only-fields=id')
+        self.assertEqual(self._get_query(r.get_groups()), {})
+
+    def test_warns_on_missing_field(self):
+        """Testing accessing a field missing due to the projection logs a
+        warning in debug mode
+        """
+        r = create_resource(self.transport, self.list_payload, '',
+                            projection=Projection(fields=['field1'],
+                                                  links=['self']))
+
+        for item in (r[0], next(iter(r.records))):
+            self.assertEqual(item.field1, 1)
+
+            with self.assertRaises(AttributeError):
+                item.summary
+
+            with self.assertRaises(AttributeError):
+                item.get_draft
+
+        self.assertEqual(len(self.log_handler.messages), 2)
+        self.assertTrue(self.log_handler.messages[0].startswith(
+            'The "summary" field of'))
+        self.assertTrue(self.log_handler.messages[1].startswith(
+            'The "draft" link of'))
+
+    def test_no_warning_without_debug(self):
+        """Testing accessing a field missing due to the projection doesn't
+        log a warning outside of debug mode
+        """
+        logging.getLogger().setLevel(logging.INFO)
+        r = create_resource(self.transport, self.list_payload, '',
+                            projection=Projection(fields=['field1']))
+
+        with self.assertRaises(AttributeError):
+            r[0].summary
+
+        self.assertEqual(self.log_handler.messages, [])
+
+
+class JsonBackendTests(TestCase):
+    """Tests for the JSON backends used to decode API payloads."""
+
+    def setUp(self):
+        super(JsonBackendTests, self).setUp()
+
+        self._backends = decode.JSON_BACKENDS.copy()
+        self.decoded = []
+
+    def tearDown(self):
+        decode.JSON_BACKENDS.clear()
+        decode.JSON_BACKENDS.update(self._backends)
+        set_json_backend()
+
+        super(JsonBackendTests, self).tearDown()
+
+    def _load_recording_backend(self):
+        def _loads(payload):
+            self.decoded.append(payload)
+
+            return json.loads(payload)
+
+        return _loads
+
+    def _load_missing_backend(self):
+        raise ImportError('No module named missing')
+
+    def test_preferred_backend(self):
+        """Testing decode_response uses the last registered backend"""
+        register_json_backend('recording', self._load_recording_backend)
+
+        self.assertEqual(get_json_backend(), 'recording')
+        self.assertEqual(
+            decode_response(b'{"stat": "ok"}', 'application/json'),
+            {'stat': 'ok'})
+        self.assertEqual(self.decoded, [b'{"stat": "ok"}'])
+
+    def test_missing_backend(self):
+        """Testing decode_response falls back when a backend isn't
+        installed
+        """
+        register_json_backend('recording', self._load_recording_backend)
+        register_json_backend('missing', self._load_missing_backend)
+
+        self.assertEqual(get_json_backend(), 'recording')
+
+    def test_set_json_backend(self):
+        """Testing set_json_backend"""
+        register_json_backend('recording', self._load_recording_backend)
+        set_json_backend('json')
+        register_json_backend('other', self._load_recording_backend)
+
+        self.assertEqual(get_json_backend(), 'json')
+        self.assertEqual(
+            decode_response(b'{"stat": "ok"}', 'application/json'),
+            {'stat': 'ok'})
+        self.assertEqual(self.decoded, [])
+
+        set_json_backend()
+        self.assertEqual(get_json_backend(), 'other')
+
+    def test_set_json_backend_unknown(self):
+        """Testing set_json_backend with an unknown backend"""
+        with self.assertRaises(ValueError):
+            set_json_backend('unknown')
+
+        with self.assertRaises(ImportError):
+            register_json_backend('missing', self._load_missing_backend)
+            set_json_backend('missing')
+
+    def test_backends_decode_payloads(self):
+        """Testing each installed JSON backend decodes payloads the same
+        way
+        """
+        payload = json.dumps({
+            'review_requests': [
+                {
+                    'id': i,
+                    'summary': '\u3053\u3093\u306b\u3061\u306f',
+                    'public': True,
+                    'ratio': 0.25,
+                    'depends_on': None,
+                }
+                for i in range(10)
+            ],
+            'total_results': 10,
+            'stat': 'ok',
+        }).encode('utf-8')
+        expected = json.loads(payload)
+
+        for name in self._backends:
+            try:
+                set_json_backend(name)
+            except ImportError:
+                continue
+
+            self.assertEqual(decode_response(payload, 'application/json'),
+                             expected)
+
+
+class JsonListStreamDecoderTests(TestCase):
+    """Tests for rbtools.api.decode.JsonListStreamDecoder."""
+
+    payload = {
+        'links': {
+            'self': {
+                'href': 'http://localhost:8080/api/review-requests/',
+                'method': 'GET',
+            },
+        },
+        'review_requests': [
+            {
+                'id': i,
+                'summary': '\u3053\u3093\u306b\u3061\u306f %d' % i,
+                'public': True,
+                'ratio': i / 4.0,
+                'bugs_closed': [],
+            }
+            for i in range(20)
+        ],
+        'total_results': 20,
+        'stat': 'ok',
+    }
+
+    def setUp(self):
+        super(JsonListStreamDecoderTests, self).setUp()
+
+        # Faster backends decode the whole payload at once.
+        set_json_backend('json')
+
+    def tearDown(self):
+        set_json_backend()
+
+        super(JsonListStreamDecoderTests, self).tearDown()
+
+    def _decode(self, data, chunk_size=JsonListStreamDecoder.CHUNK_SIZE):
+        decoder = JsonListStreamDecoder(six.BytesIO(data))
+        decoder.CHUNK_SIZE = chunk_size
+
+        return decoder, list(decoder)
+
+    def test_decode(self):
+        """Testing JsonListStreamDecoder yields each item"""
+        data = json.dumps(self.payload, indent=2).encode('utf-8')
+
+        for chunk_size in (1, 7, 4096):
+            decoder, items = self._decode(data, chunk_size)
+
+            self.assertEqual(items, self.payload['review_requests'])
+            self.assertEqual(decoder.token, 'review_requests')
+            self.assertEqual(decoder.payload, {
+                'links': self.payload['links'],
+                'total_results': 20,
+                'stat': 'ok',
+            })
+
+    def test_decode_empty_list(self):
+        """Testing JsonListStreamDecoder with an empty list"""
+        decoder, items = self._decode(b'{"repositories": [], "stat": "ok"}')
+
+        self.assertEqual(items, [])
+        self.assertEqual(decoder.token, 'repositories')
+        self.assertEqual(decoder.payload, {'stat': 'ok'})
+
+    def test_decode_invalid(self):
+        """Testing JsonListStreamDecoder with invalid payloads"""
+        for data in (b'', b'[]', b'{"repositories": [{"id": 1}',
+                     b'{"stat": "ok" "total_results": 1}',
+                     b'{"stat": "ok"} {}'):
+            with self.assertRaises(ValueError):
+                self._decode(data, chunk_size=4)
+
+    def test_decode_with_backend(self):
+        """Testing JsonListStreamDecoder decodes the whole payload with a
+        faster JSON backend
+        """
+        decoded = []
+
+        def _load_recording_backend():
+            def _loads(payload):
+                decoded.append(payload)
+
+                return json.loads(payload)
+
+            return _loads
+
+        backends = decode.JSON_BACKENDS.copy()
+        self.addCleanup(decode.JSON_BACKENDS.update, backends)
+        self.addCleanup(decode.JSON_BACKENDS.clear)
+        register_json_backend('recording', _load_recording_backend)
+        set_json_backend('recording')
+
+        data = json.dumps(self.payload).encode('utf-8')
+        decoder, items = self._decode(data, chunk_size=7)
+
+        self.assertEqual(decoded, [data])
+        self.assertEqual(items, self.payload['review_requests'])
+        self.assertEqual(decoder.token, 'review_requests')
+        self.assertEqual(decoder.payload, {
+            'links': self.payload['links'],
+            'total_results': 20,
+            'stat': 'ok',
+        })
+
+        for data in (b'[]', b'{"repositories": [{"id": 1}'):
+            with self.assertRaises(ValueError):
+                self._decode(data)
+
+
+class PagingTransport(Transport):
+    """Transport which generates the pages of a large list resource.
+
+    Pages are generated when they're requested, like they'd be received
+    from a server, so that only the pages in use are kept in memory.
+    """
+    URL = 'http://localhost:8080/api/review-requests/'
+
+    def __init__(self, num_pages, items_per_page):
+        super(PagingTransport, self).__init__(self.URL)
+        self.num_pages = num_pages
+        self.items_per_page = items_per_page
+
+    def execute_request_method(self, method, *args, **kwargs):
+        request = method(*args, **kwargs)
+
+        if not isinstance(request, HttpRequest):
+            return request
+
+        query = dict(parse_qsl(urlparse(request.url).query))
+
+        return self.get_page(int(query['start']))
+
+    def get_page(self, start):
+        return create_resource(
+            self,
+            self.make_payload(start),
+            self.URL,
+            item_mime_type='application/vnd.reviewboard.org.review-request')
+
+    def make_payload(self, start):
+        total_results = self.num_pages * self.items_per_page
+        links = {
+            'self': {
+                'href': self.URL,
+                'method': 'GET',
+            },
+        }
+
+        if start + self.items_per_page < total_results:
+            links['next'] = {
+                'href': '%s?start=%d&max-results=%d'
+                        % (self.URL, start + self.items_per_page,
+                           self.items_per_page),
+                'method': 'GET',
+            }
+
+        return {
+            'review_requests': [
+                {
+                    'id': pk,
+                    'summary': 'Review request %d' % pk,
+                    'description': 'Description %d\n' % pk * 20,
+                    'links': {
+                        'self': {
+                            'href': '%s%d/' % (self.URL, pk),
+                            'method': 'GET',
+                        },
+                        'diffs': {
+                            'href': '%s%d/diffs/' % (self.URL, pk),
+                            'method': 'GET',
+                        },
+                    },
+                }
+                for pk in range(start + 1, start + self.items_per_page + 1)
+            ],
+            'links': links,
+            'total_results': total_results,
+            'stat': 'ok',
+        }
+
+
+@unittest.skipIf(tracemalloc is None, 'tracemalloc is not available')
+class ListResourceMemoryTests(TestCase):
+    """Tests for the memory used by scans of list resources."""
+
+    ITEMS_PER_PAGE = 200
+
+    def _measure(self, func):
+        """Return the result of a function and its memory usage.
+
+        The memory usage is returned as a tuple of the memory still held
+        once the function returns, and the peak memory.
+        """
+        gc.collect()
+        tracemalloc.start()
+
+        try:
+            result = func()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return result, current, peak
+
+    def _scan(self, num_pages, name):
+        """Scan all items in a list, returning the count and peak memory."""
+        transport = PagingTransport(num_pages, self.ITEMS_PER_PAGE)
+        count, current, peak = self._measure(
+            lambda: sum(1 for item in getattr(transport.get_page(0), name)
+                        if item.id))
+
+        self.assertEqual(count, num_pages * self.ITEMS_PER_PAGE)
+
+        return peak
+
+    def test_all_items_peak_memory(self):
+        """Testing ListResource.all_items peak memory for a full scan"""
+        # Only the current and next pages should be kept in memory, no
+        # matter how many pages there are.
+        self.assertLess(self._scan(40, 'all_items'),
+                        self._scan(5, 'all_items') * 1.25)
+
+    def test_all_records_peak_memory(self):
+        """Testing ListResource.all_records peak memory for a full scan"""
+        self.assertLess(self._scan(40, 'all_records'),
+                        self._scan(5, 'all_records') * 1.25)
+
+    def test_records_memory(self):
+        """Testing ListResource.records uses less memory than item
+        resources
+        """
+        page = PagingTransport(1, self.ITEMS_PER_PAGE).get_page(0)
+        items, items_size, peak = self._measure(lambda: list(page))
+        records, records_size, peak = self._measure(
+            lambda: list(page.records))
+
+        self.assertEqual(len(records), len(items))
+        self.assertLess(records_size, items_size)
+
+
+class HttpRequestTests(TestCase):
+    def setUp(self):
+        self.request = HttpRequest('/')
+
+    def test_default_values(self):
+        """Testing the default values."""
+        self.assertEqual(self.request.url, '/')
+        self.assertEqual(self.request.method, 'GET')
+        content_type, content = self.request.encode_multipart_formdata()
+        self.assertTrue(content_type is None)
+        self.assertTrue(content is None)
+
+    def test_post_form_data(self):
+        """Testing the multipart form data generation."""
+        request = HttpRequest('/', 'POST')
+        request.add_field('foo', 'bar')
+        request.add_field('bar', 42)
+        request.add_field('err', 'must-be-deleted')
+        request.add_field('name', 'somestring')
+        request.del_field('err')
+
+        ctype, content = request.encode_multipart_formdata()
+        m = re.match(b'^multipart/form-data; boundary=(.*)$', ctype)
+        self.assertFalse(m is None)
+        fields = [l.strip() for l in content.split(b'--' + m.group(1))][1:-1]
+
+        d = {}
+
+        disposition_re = re.compile(
+            b'Content-Disposition: form-data; name="(.*?)"$')
+
+        for f in fields:
+            lst = f.split(b'\r\n\r\n')
+            self.assertEqual(len(lst), 2)
+            k, v = lst
+
+            m = disposition_re.match(k)
+            self.assertFalse(m is None)
+            d[m.group(1)] = v
+
+        self.assertEqual(
+            d, {b'foo': b'bar', b'bar': b'42', b'name': b'somestring'})
+
+
+    def test_post_file_object(self):
+        """Testing the multipart form data generation with a file object"""
+        fp = tempfile.TemporaryFile()
+        self.addCleanup(fp.close)
+        fp.write(b'x' * 1000)
+        fp.seek(0)
+
+        request = HttpRequest('/', 'POST')
+        request.add_field('caption', 'test')
+        request.add_file('path', 'test.txt', fp)
+
+        content_type, body = request.encode_multipart_body()
+        content = body.getvalue()
+        self.assertEqual(len(body), len(content))
+        self.assertTrue(b'\r\n\r\n' + b'x' * 1000 + b'\r\n' in content)
+
+        # The file is read again for every encoding of the body.
+        self.assertEqual(len(request.encode_multipart_formdata()[1]),
+                         len(content))
+
+    def test_multipart_body_read(self):
+        """Testing MultipartBody.read in chunks and after rewinding"""
+        body = MultipartBody()
+        body.CHUNK_SIZE = 4
+        body.add_bytes(b'header\r\n')
+        body.add_bytes(memoryview(b'0123456789'))
+
+        fp = tempfile.TemporaryFile()
+        self.addCleanup(fp.close)
+        fp.write(b'skipped-abcdefghij')
+        fp.seek(len(b'skipped-'))
+        body.add_file(fp)
+
+        expected = b'header\r\n0123456789abcdefghij'
+        self.assertEqual(len(body), len(expected))
+
+        for i in range(2):
+            body.rewind()
+            chunks = []
+
+            while True:
+                chunk = body.read(3)
+
+                if not chunk:
+                    break
+
+                chunks.append(chunk)
+
+            # Reads span chunks, so only the last one is short.
+            self.assertEqual(set(len(chunk) for chunk in chunks[:-1]),
+                             set([3]))
+            self.assertEqual(b''.join(chunks), expected)
+
+        body.rewind()
+        self.assertEqual(body.read(5), expected[:5])
+        self.assertEqual(body.read(), expected[5:])
+        self.assertEqual(body.read(), b'')
+
+
+class CountingHTTPServer(ThreadingMixIn, HTTPServer):
+    """A local stand-in server that counts accepted connections."""
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        HTTPServer.__init__(self, *args, **kwargs)
+        self.connection_count = 0
+
+    def get_request(self):
+        request = HTTPServer.get_request(self)
+        self.connection_count += 1
+        return request
+
+
+class KeepAliveRequestHandler(BaseHTTPRequestHandler):
+    """Handler for CountingHTTPServer which supports HTTP/1.1 keep-alive."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._send_body(200, b'{"stat": "ok"}')
+
+    def _send_body(self, status, body, headers={}):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+
+        for name, value in six.iteritems(headers):
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args, **kwargs):
+        pass
+
+
+class APIRequestHandler(KeepAliveRequestHandler):
+    """Handler serving API payloads.
+
+    The server's ``payloads`` attribute maps request paths to a tuple of
+    the mimetype and the payload to return. The payload may also be a
+    function taking the query arguments and returning the payload. Any
+    headers in the server's ``response_headers`` attribute are added to
+    successful responses. The bodies of POST requests are recorded in the
+    server's ``request_bodies`` attribute, and their Content-Encoding in
+    ``request_encodings``. Compressed request bodies are rejected unless
+    ``accept_compressed_uploads`` is set. If the server's ``compress``
+    attribute is set, responses are gzip-compressed when the client accepts
+    it, and ``bytes_sent`` counts the bytes of the bodies sent. Requests
+    are answered with the (status, headers) in ``failures``, one at a time,
+    before any payloads are served.
+    """
+    def do_GET(self):
+        self._send_payload()
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        body = self.rfile.read(length)
+        encoding = self.headers.get('Content-Encoding')
+        self.server.request_encodings.append(encoding)
+
+        if encoding == 'gzip':
+            if self.server.compressed_upload_error is not None:
+                self._send_body(400, json.dumps({
+                    'stat': 'fail',
+                    'err': {
+                        'code': 105,
+                        'msg': 'One or more fields had errors',
+                    },
+                    'fields': self.server.compressed_upload_error,
+                }).encode('utf-8'))
+                return
+
+            if not self.server.accept_compressed_uploads:
+                self._send_body(415, b'Unsupported Media Type')
+                return
+
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+        self.server.request_bodies.append(body)
+        self._send_payload()
+
+    def _send_payload(self):
+        url_parts = urlparse(self.path)
+        path = url_parts.path
+        self.server.paths.append(self.path)
+
+        if self.server.failures:
+            status, headers = self.server.failures.pop(0)
+            self._send_body(status, b'Service Unavailable', headers)
+            return
+
+        try:
+            mime_type, payload = self.server.payloads[path]
+        except KeyError:
+            self._send_body(404, json.dumps({
+                'stat': 'fail',
+                'err': {
+                    'code': 100,
+                    'msg': 'Object does not exist',
+                },
+            }).encode('utf-8'))
+            return
+
+        if callable(payload):
+            payload = payload(dict(parse_qsl(url_parts.query)))
+
+        body = json.dumps(payload).encode('utf-8')
+        accept_encoding = self.headers.get('Accept-Encoding', '')
+
+        self.send_response(200)
+        self.send_header('Content-Type', mime_type)
+
+        if self.server.compress and 'gzip' in accept_encoding:
+            compressor = zlib.compressobj(9, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            self.send_header('Content-Encoding', 'gzip')
+
+        self.server.bytes_sent += len(body)
+        self.send_header('Content-Length', str(len(body)))
+
+        for header, value in six.iteritems(self.server.response_headers):
+            self.send_header(header, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class AuthenticatingRequestHandler(KeepAliveRequestHandler):
+    """Handler requiring Basic auth, which then hands out a session cookie.
+
+    Each request is recorded on the server as a tuple of the method, the
+    Authorization header and the Cookie header.
+    """
+    AUTHORIZATION = 'Basic %s' % base64.b64encode(b'user:pass').decode('ascii')
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self._handle()
+
+    def _handle(self):
+        authorization = self.headers.get('Authorization')
+        cookie = self.headers.get('Cookie')
+        self.server.requests.append((self.command, authorization, cookie))
+
+        if cookie == 'rbsessionid=session123':
+            self._send_body(200, b'{"stat": "ok"}')
+        elif authorization == self.AUTHORIZATION:
+            self._send_body(200, b'{"stat": "ok"}', {
+                'Set-Cookie': 'rbsessionid=session123; Path=/',
+            })
+        else:
+            self._send_body(401, b'{"stat": "fail"}', {
+                'WWW-Authenticate': 'Basic realm="Web API"',
+            })
+
+
+class TruncatingRequestHandler(KeepAliveRequestHandler):
+    """Handler which closes the connection partway through a response."""
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append(self.command)
+
+        self.send_response(201)
+        self.send_header('Content-Length', '100')
+        self.end_headers()
+        self.wfile.write(b'{"stat":')
+        self.close_connection = True
+
+
+class KeepAliveTests(TestCase):
+    """Tests for persistent connections in rbtools.api.request."""
+    def setUp(self):
+        self.server = CountingHTTPServer(('127.0.0.1', 0),
+                                         KeepAliveRequestHandler)
+        self.url = 'http://127.0.0.1:%d/api/' % self.server.server_port
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuses_connection(self):
+        """Testing KeepAliveHTTPHandler reuses one connection for many
+        requests
+        """
+        pool = ConnectionPool()
+        opener = build_opener(KeepAliveHTTPHandler(pool))
+
+        for i in range(5):
+            rsp = opener.open(Request(self.url, None, method='GET'))
+            self.assertEqual(rsp.getcode(), 200)
+            self.assertEqual(rsp.read(), b'{"stat": "ok"}')
+            self.assertEqual(rsp.info()['Content-Type'], 'application/json')
+
+        pool.close()
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_streams_response(self):
+        """Testing KeepAliveHTTPHandler streams the response body and pools
+        the connection once it has been read
+        """
+        pool = ConnectionPool()
+        opener = build_opener(KeepAliveHTTPHandler(pool))
+
+        def get_idle_count():
+            return sum(len(connections)
+                       for connections in six.itervalues(pool._idle))
+
+        rsp = opener.open(Request(self.url, None, method='GET'))
+        self.assertEqual(get_idle_count(), 0)
+        self.assertEqual(rsp.read(2), b'{"')
+        self.assertEqual(get_idle_count(), 0)
+        self.assertEqual(rsp.read(), b'stat": "ok"}')
+        self.assertEqual(get_idle_count(), 1)
+
+        # A body closed before being read can't leave its connection in the
+        # pool.
+        rsp = opener.open(Request(self.url, None, method='GET'))
+        rsp.close()
+        self.assertEqual(get_idle_count(), 0)
+
+        opener.open(Request(self.url, None, method='GET')).read()
+        pool.close()
+        self.assertEqual(self.server.connection_count, 2)
+
+    def test_without_keep_alive(self):
+        """Testing the default handler opens a connection per request"""
+        opener = build_opener()
+
+        for i in range(3):
+            opener.open(Request(self.url, None, method='GET')).read()
+
+        self.assertEqual(self.server.connection_count, 3)
+
+    def test_reconnects_closed_connection(self):
+        """Testing KeepAliveHTTPHandler reconnects when a pooled connection
+        was closed
+        """
+        pool = ConnectionPool()
+        opener = build_opener(KeepAliveHTTPHandler(pool))
+        opener.open(Request(self.url, None, method='GET')).read()
+
+        # Simulate the server dropping the idle connection.
+        for connections in six.itervalues(pool._idle):
+            for connection in connections:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+
+        rsp = opener.open(Request(self.url, None, method='GET'))
+        self.assertEqual(rsp.read(), b'{"stat": "ok"}')
+        self.assertEqual(self.server.connection_count, 2)
+
+
+    def test_no_retry_after_partial_response(self):
+        """Testing KeepAliveHTTPHandler does not resend a POST once a
+        response has been received
+        """
+        self.server.RequestHandlerClass = TruncatingRequestHandler
+        self.server.requests = []
+
+        pool = ConnectionPool()
+        opener = build_opener(KeepAliveHTTPHandler(pool))
+
+        rsp = opener.open(Request(self.url, b'data', method='POST'))
+        self.assertRaises(URLError, rsp.read)
+        self.assertEqual(self.server.requests, ['POST'])
+
+
+class ReviewBoardServerKeepAliveTests(TestCase):
+    """Tests for ReviewBoardServer with persistent connections."""
+    def setUp(self):
+        self.server = CountingHTTPServer(('127.0.0.1', 0),
+                                         AuthenticatingRequestHandler)
+        self.server.requests = []
+        self.tempdir = tempfile.mkdtemp()
+
+        # The root resource is always stored in the API cache, which must not
+        # be the user's.
+        self._old_cache_path = APICache.CACHE_PATH
+        APICache.CACHE_PATH = os.path.join(self.tempdir, 'apicache.db')
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        APICache.CACHE_PATH = self._old_cache_path
+        shutil.rmtree(self.tempdir)
+
+        # ReviewBoardServer installs a global URL opener.
+        install_opener(None)
+
+    def test_auth_and_cookies_on_one_connection(self):
+        """Testing ReviewBoardServer with keep_alive performs the auth
+        challenge, the cookie round-trip and a POST on one connection
+        """
+        def auth_callback(realm, uri, username=None, password=None):
+            return 'user', 'pass'
+
+        server = ReviewBoardServer(
+            'http://127.0.0.1:%d/' % self.server.server_port,
+            cookie_file=os.path.join(self.tempdir, 'cookies'),
+            auth_callback=auth_callback,
+            keep_alive=True)
+
+        rsp = server.make_request(HttpRequest(server.url))
+        self.assertEqual(rsp.read(), b'{"stat": "ok"}')
+
+        rsp = server.make_request(HttpRequest(server.url))
+        self.assertEqual(rsp.read(), b'{"stat": "ok"}')
+
+        request = HttpRequest(server.url, method='POST')
+        request.add_field('foo', 'bar')
+        rsp = server.make_request(request)
+        self.assertEqual(rsp.read(), b'{"stat": "ok"}')
+
+        server.close()
+
+        self.assertEqual(self.server.requests, [
+            ('GET', None, None),
+            ('GET', AuthenticatingRequestHandler.AUTHORIZATION, None),
+            ('GET', None, 'rbsessionid=session123'),
+            ('POST', None, 'rbsessionid=session123'),
+        ])
+        self.assertEqual(self.server.connection_count, 1)
+
+
+    def test_close_order(self):
+        """Testing ReviewBoardServer.close closes the API cache before the
+        connection pool
+        """
+        server = ReviewBoardServer(
+            'http://127.0.0.1:%d/' % self.server.server_port,
+            cookie_file=os.path.join(self.tempdir, 'cookies'),
+            keep_alive=True)
+        closed = []
+
+        class RecordingAPICache(APICache):
+            def close(self):
+                closed.append('cache')
+                super(RecordingAPICache, self).close()
+
+        server._cache = RecordingAPICache(create_db_in_memory=True)
+        server.connection_pool.close = lambda: closed.append('pool')
+        server.close()
+
+        self.assertEqual(closed, ['cache', 'pool'])
+
+    def test_concurrent_auth(self):
+        """Testing ReviewBoardServer prompts for credentials once when
+        concurrent requests are rejected
+        """
+        prompts = []
+
+        def auth_callback(realm, uri, username=None, password=None):
+            if username is None or password is None:
+                prompts.append(uri)
+
+                # Give the other requests time to be rejected as well.
+                time.sleep(0.1)
+
+                return 'user', 'pass'
+
+            return username, password
+
+        server = ReviewBoardServer(
+            'http://127.0.0.1:%d/' % self.server.server_port,
+            cookie_file=os.path.join(self.tempdir, 'cookies'),
+            auth_callback=auth_callback)
+        pool = ThreadPool(4)
+
+        try:
+            results = pool.map(
+                lambda i: server.make_request(HttpRequest(server.url)).read(),
+                range(4))
+        finally:
+            pool.terminate()
+
+        self.assertEqual(results, [b'{"stat": "ok"}'] * 4)
+        self.assertEqual(len(prompts), 1)
+
+
+class APIServerTestCase(TestCase):
+    """Base class for tests talking to a local stand-in API server."""
+    ROOT_MIMETYPE = 'application/vnd.reviewboard.org.root+json'
+
+    def setUp(self):
+        self.server = CountingHTTPServer(('127.0.0.1', 0), APIRequestHandler)
+        self.server.payloads = {}
+        self.server.paths = []
+        self.server.response_headers = {}
+        self.server.request_bodies = []
+        self.server.compress = False
+        self.server.request_encodings = []
+        self.server.accept_compressed_uploads = True
+        self.server.compressed_upload_error = None
+        self.server.failures = []
+        self.server.bytes_sent = 0
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_port
+        self.api_url = self.url + 'api/'
+        self.tempdir = tempfile.mkdtemp()
+        self.cookie_file = os.path.join(self.tempdir, 'cookies')
+
+        # The root resource is always stored in the API cache, which must not
+        # be the user's.
+        self._old_cache_path = APICache.CACHE_PATH
+        APICache.CACHE_PATH = os.path.join(self.tempdir, 'apicache.db')
+
+        self.add_payload('/api/', self.ROOT_MIMETYPE, {
+            'uri_templates': {
+                'group': self.api_url + 'groups/{group_name}/',
+            },
+            'links': {
+                'self': {
+                    'href': self.api_url,
+                    'method': 'GET',
+                },
+                'groups': {
+                    'href': self.api_url + 'groups/',
+                    'method': 'GET',
+                },
+            },
+            'stat': 'ok',
+        })
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        APICache.CACHE_PATH = self._old_cache_path
+        shutil.rmtree(self.tempdir)
+        install_opener(None)
+
+    def add_payload(self, path, mime_type, payload):
+        self.server.payloads[path] = (mime_type, payload)
+
+    def add_list_payload(self, path, name, items, total_results=None,
+                         links={}):
+        payload = {
+            name: items,
+            'links': dict({
+                'self': {
+                    'href': self.url + path.lstrip('/'),
+                    'method': 'GET',
+                },
+            }, **links),
+            'total_results': (total_results
+                              if total_results is not None
+                              else len(items)),
+            'stat': 'ok',
+        }
+
+        self.add_payload(path, 'application/vnd.reviewboard.org.%s+json'
+                         % name, payload)
+
+
+class ParallelPaginationTests(APIServerTestCase):
+    """Tests for ListResource.parallel_pages and parallel_items."""
+    def setUp(self):
+        super(ParallelPaginationTests, self).setUp()
+
+        self.transport = SyncTransport(self.url, cookie_file=self.cookie_file)
+        self.add_payload('/api/repositories/',
+                         'application/vnd.reviewboard.org.repositories+json',
+                         self._get_repositories_payload)
+
+    def tearDown(self):
+        self.transport.close()
+        super(ParallelPaginationTests, self).tearDown()
+
+    def _get_repositories_payload(self, query, total_results=10):
+        start = int(query.get('start', 0))
+        max_results = int(query.get('max-results', 3))
+        url = self.api_url + 'repositories/'
+        links = {
+            'self': {
+                'href': url,
+                'method': 'GET',
+            },
+        }
+
+        if start + max_results < total_results:
+            links['next'] = {
+                'href': '%s?start=%d&max-results=%d'
+                        % (url, start + max_results, max_results),
+                'method': 'GET',
+            }
+
+        return {
+            'repositories': [
+                {'id': i}
+                for i in range(start, min(start + max_results, total_results))
+            ],
+            'links': links,
+            'total_results': total_results,
+            'stat': 'ok',
+        }
+
+    def test_parallel_items(self):
+        """Testing ListResource.parallel_items yields all items in order"""
+        repositories = self.transport.get_path('repositories/')
+        self.server.paths = []
+
+        self.assertEqual([repo.id for repo in repositories.parallel_items()],
+                         list(range(10)))
+        self.assertEqual(
+            sorted(self.server.paths),
+            [
+                '/api/repositories/?start=%d&max-results=3' % start
+                for start in (3, 6, 9)
+            ])
+
+    def test_parallel_pages_single_page(self):
+        """Testing ListResource.parallel_pages with a single page"""
+        repositories = self.transport.get_path('repositories/',
+                                               max_results=25)
+        self.server.paths = []
+
+        pages = list(repositories.parallel_pages())
+        self.assertEqual(len(pages), 1)
+        self.assertEqual(pages[0].num_items, 10)
+        self.assertEqual(self.server.paths, [])
+
+    def test_all_items(self):
+        """Testing ListResource.all_items stops after the last page"""
+        repositories = self.transport.get_path('repositories/')
+
+        self.assertEqual([repo.id for repo in repositories.all_items],
+                         list(range(10)))
+
+    def _spy_on_stream_list(self):
+        """Record the decoders returned by the transport's stream_list."""
+        decoders = []
+        stream_list = self.transport.stream_list
+
+        def _stream_list(request):
+            decoder = stream_list(request)
+            decoders.append(decoder)
+
+            return decoder
+
+        self.transport.stream_list = _stream_list
+
+        return decoders
+
+    def test_all_items_decoded_incrementally(self):
+        """Testing ListResource.all_items decodes the following pages
+        incrementally
+        """
+        repositories = self.transport.get_path('repositories/')
+        decoders = self._spy_on_stream_list()
+
+        self.assertEqual([repo.id for repo in repositories.all_items],
+                         list(range(10)))
+        self.assertEqual(len(decoders), 3)
+
+        for decoder in decoders:
+            self.assertTrue(isinstance(decoder, JsonListStreamDecoder))
+            self.assertEqual(decoder.token, 'repositories')
+
+    def test_all_records_with_cache(self):
+        """Testing ListResource.all_records with the API cache"""
+        self.server.response_headers['Cache-Control'] = 'max-age=60'
+
+        server = self.transport.server
+        server._cache = APICache(create_db_in_memory=True,
+                                 urlopen=server._urlopen)
+        server._urlopen = server._cache.make_request
+
+        for i in range(2):
+            repositories = self.transport.get_path('repositories/')
+            decoders = self._spy_on_stream_list()
+
+            self.assertEqual([repo.id for repo in repositories.all_records],
+                             list(range(10)))
+            self.assertEqual(len(decoders), 3)
+
+        self.assertEqual(len(self.server.paths), 4)
+
+
+class ProjectionRequestTests(APIServerTestCase):
+    """Tests for fetching resources with projections from a server."""
+    def test_projection(self):
+        """Testing SyncTransport requests the projections for resources"""
+        self.add_list_payload('/api/groups/', 'groups', [
+            {'id': 1, 'name': 'group1', 'links': {}},
+        ])
+        transport = SyncTransport(self.url, cookie_file=self.cookie_file,
+                                  projections={
+                                      'groups': Projection(fields=['id'],
+                                                           links=[]),
+                                  })
+
+        try:
+            groups = transport.get_root().get_groups()
+        finally:
+            transport.close()
+
+        path, query = self.server.paths[-1].split('?')
+        self.assertEqual(path, '/api/groups/')
+        self.assertEqual(dict(parse_qsl(query, keep_blank_values=True)), {
+            'only-fields': 'id',
+            'only-links': '',
+        })
+        self.assertEqual(groups._projection.fields, ['id'])
+        self.assertEqual(groups[0]._projection, groups._projection)
+
+
+class ResourceCacheTests(APIServerTestCase):
+    """Tests for keeping the root resource in the ResourceCache."""
+    def setUp(self):
+        super(ResourceCacheTests, self).setUp()
+
+        self._old_cache_dir = ResourceCache.CACHE_DIR
+        ResourceCache.CACHE_DIR = os.path.join(self.tempdir, 'resources')
+
+    def tearDown(self):
+        ResourceCache.CACHE_DIR = self._old_cache_dir
+        super(ResourceCacheTests, self).tearDown()
+
+    def _make_transport(self, **kwargs):
+        if 'api_token' not in kwargs and 'session' not in kwargs:
+            kwargs.setdefault('username', 'user1')
+
+        transport = SyncTransport(self.url, cookie_file=self.cookie_file,
+                                  root_cache_ttl=60, **kwargs)
+        self.addCleanup(transport.close)
+
+        return transport
+
+    def test_root_cached(self):
+        """Testing SyncTransport constructs the root resource from the
+        resource cache
+        """
+        self._make_transport().get_root()
+        self.assertEqual(self.server.paths, ['/api/'])
+
+        root = self._make_transport().get_root()
+        self.assertEqual(self.server.paths, ['/api/'])
+        self.assertTrue(isinstance(root, RootResource))
+        self.assertTrue(hasattr(root, 'get_group'))
+
+    def test_root_cached_per_user(self):
+        """Testing SyncTransport keeps the root resource for each user
+        separately
+        """
+        self._make_transport(username='user1').get_root()
+        self._make_transport(username='user2').get_root()
+
+        self.assertEqual(self.server.paths, ['/api/', '/api/'])
+
+    def test_root_cached_per_api_token(self):
+        """Testing SyncTransport keeps the root resource for each API token
+        separately
+        """
+        self._make_transport(api_token='token1').get_root()
+        self._make_transport(api_token='token1').get_root()
+        self._make_transport(api_token='token2').get_root()
+
+        self.assertEqual(self.server.paths, ['/api/', '/api/'])
+
+        # The token itself isn't stored in the cache.
+        for filename in os.listdir(ResourceCache.CACHE_DIR):
+            with open(os.path.join(ResourceCache.CACHE_DIR, filename)) as f:
+                self.assertFalse('token1' in f.read())
+
+    def test_root_cached_per_session(self):
+        """Testing SyncTransport keeps the root resource for each session
+        cookie separately
+        """
+        self._make_transport(session='session1').get_root()
+        self._make_transport(session='session1').get_root()
+        self._make_transport(session='session2').get_root()
+
+        self.assertEqual(self.server.paths, ['/api/', '/api/'])
+
+    def test_root_not_cached_without_identity(self):
+        """Testing SyncTransport doesn't use the resource cache when the
+        account isn't known
+        """
+        transport = self._make_transport(username=None)
+        self.assertEqual(transport.resource_cache, None)
+
+        transport.get_root()
+        self._make_transport(username=None).get_root()
+
+        self.assertEqual(self.server.paths, ['/api/', '/api/'])
+
+    def test_root_expired(self):
+        """Testing SyncTransport fetches the root resource again once it
+        expires
+        """
+        transport = self._make_transport()
+        transport.resource_cache.ttl = -1
+        transport.get_root()
+
+        self._make_transport().get_root()
+        self.assertEqual(self.server.paths, ['/api/', '/api/'])
+
+    def test_not_found_refetches_root(self):
+        """Testing SyncTransport retries a request built from an out of date
+        cached root resource with the refetched root resource
+        """
+        self._make_transport().get_root()
+
+        # The server moves the groups, so the cached URI template is now out
+        # of date.
+        mime_type, root_payload = self.server.payloads['/api/']
+        self.add_payload('/api/', mime_type, dict(root_payload, uri_templates={
+            'group': self.api_url + 'teams/{group_name}/',
+        }))
+        self.add_payload('/api/teams/devs/',
+                         'application/vnd.reviewboard.org.review-group+json',
+                         {
+                             'group': {
+                                 'id': 1,
+                                 'name': 'devs',
+                                 'links': {},
+                             },
+                             'stat': 'ok',
+                         })
+
+        root = self._make_transport().get_root()
+        group = root.get_group(group_name='devs')
+
+        self.assertEqual(group.name, 'devs')
+        self.assertEqual(self.server.paths,
+                         ['/api/', '/api/groups/devs/', '/api/',
+                          '/api/teams/devs/'])
+
+        # Later requests from the out of date root resource are rebuilt as
+        # well, and the refetched root resource is cached.
+        self.assertEqual(root.get_group(group_name='devs').id, 1)
+
+        root = self._make_transport().get_root()
+        self.assertEqual(root.get_group(group_name='devs').id, 1)
+        self.assertEqual(self.server.paths,
+                         ['/api/', '/api/groups/devs/', '/api/',
+                          '/api/teams/devs/', '/api/groups/devs/',
+                          '/api/teams/devs/', '/api/teams/devs/'])
+
+    def test_unrelated_not_found_keeps_cache(self):
+        """Testing SyncTransport keeps the cached root resource after an
+        HTTP 404 for a URL not built from it
+        """
+        self._make_transport().get_root()
+
+        transport = self._make_transport()
+        transport.get_root()
+
+        with self.assertRaises(APIError):
+            transport.get_path('missing/')
+
+        self._make_transport().get_root()
+        self.assertEqual(self.server.paths, ['/api/', '/api/missing/'])
+
+    def test_post_not_found_not_retried(self):
+        """Testing SyncTransport doesn't retry a POST request that gets an
+        HTTP 404 after using the cached root resource
+        """
+        self._make_transport().get_root()
+
+        mime_type, root_payload = self.server.payloads['/api/']
+        self.add_payload('/api/', mime_type, dict(root_payload, links={
+            'groups': {
+                'href': self.api_url + 'teams/',
+                'method': 'GET',
+            },
+        }))
+
+        transport = self._make_transport()
+        transport.get_root()
+
+        with self.assertRaises(APIError):
+            transport._execute_request(
+                HttpRequest(self.api_url + 'groups/', method='POST'))
+
+        self.assertEqual(self.server.paths, ['/api/', '/api/groups/'])
+        self.assertEqual(self.server.request_bodies, [b''])
+        self.assertNotEqual(transport.resource_cache.get(self.api_url),
+                            None)
+
+
+class OfflineTests(APIServerTestCase):
+    """Tests for using the API offline after an online run."""
+    def setUp(self):
+        super(OfflineTests, self).setUp()
+
+        mime_type, root_payload = self.server.payloads['/api/']
+        self.add_payload('/api/', mime_type, dict(root_payload, product={
+            'package_version': '3.0',
+        }))
+        self.add_list_payload('/api/groups/', 'groups', [
+            {'id': 1, 'name': 'group1'},
+        ])
+        self.server.response_headers['ETag'] = '"1"'
+
+    def _make_transport(self, **kwargs):
+        transport = SyncTransport(self.url, cookie_file=self.cookie_file,
+                                  **kwargs)
+        self.addCleanup(transport.close)
+
+        return transport
+
+    def test_offline_after_online(self):
+        """Testing SyncTransport in offline mode after an online run"""
+        transport = self._make_transport()
+        transport.get_root().get_groups()
+        transport.close()
+        self.assertEqual(self.server.paths, ['/api/', '/api/groups/'])
+
+        transport = self._make_transport(offline=True)
+        root = transport.get_root()
+        self.assertTrue(isinstance(root, RootResource))
+        self.assertEqual(root.get_groups()[0].name, 'group1')
+        transport.close()
+        self.assertEqual(self.server.paths, ['/api/', '/api/groups/'])
+
+        # Online runs still fetch the root resource from the server.
+        self._make_transport().get_root()
+        self.assertEqual(self.server.paths,
+                         ['/api/', '/api/groups/', '/api/'])
+
+    def test_offline_after_online_with_cache_server(self):
+        """Testing SyncTransport in offline mode after an online run, with
+        an API cache server
+        """
+        socket_path = os.path.join(self.tempdir, 'apicache.sock')
+        cache_server = APICacheServer(
+            socket_path,
+            cache=APICache(create_db_in_memory=True))
+        thread = threading.Thread(target=cache_server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(cache_server.close)
+        self.addCleanup(cache_server.shutdown)
+        self.add_list_payload('/api/groups/', 'groups', [
+            {'id': 1, 'name': 'group1'},
+        ], links={
+            'create': {
+                'href': self.api_url + 'groups/',
+                'method': 'POST',
+            },
+        })
+
+        transport = self._make_transport(cache_server=socket_path)
+        root = transport.get_root()
+        root.get_groups().create(name='group2')
+        root.get_groups()
+        self.assertTrue(isinstance(transport.server._cache, RemoteAPICache))
+        transport.close()
+        self.assertEqual(self.server.paths,
+                         ['/api/', '/api/groups/', '/api/groups/',
+                          '/api/groups/'])
+
+        transport = self._make_transport(offline=True,
+                                         cache_server=socket_path)
+        root = transport.get_root()
+        self.assertTrue(isinstance(root, RootResource))
+        self.assertEqual(root.get_groups()[0].name, 'group1')
+        self.assertTrue(isinstance(transport.server._cache, RemoteAPICache))
+        transport.close()
+        self.assertEqual(len(self.server.paths), 4)
+
+    def test_offline_without_online(self):
+        """Testing SyncTransport in offline mode without an online run"""
+        with self.assertRaises(ServerInterfaceError):
+            self._make_transport(offline=True).get_root()
+
+        self.assertEqual(self.server.paths, [])
+
+
+class StreamingUploadTests(APIServerTestCase):
+    """Tests for uploading streamed multipart bodies to a server."""
+    def setUp(self):
+        super(StreamingUploadTests, self).setUp()
+
+        self.add_payload('/api/files/',
+                         'application/vnd.reviewboard.org.file+json', {
+                             'file': {'id': 1},
+                             'stat': 'ok',
+                         })
+
+        self.fp = tempfile.TemporaryFile()
+        self.fp.write(os.urandom(300 * 1024))
+        self.fp.seek(0)
+
+    def tearDown(self):
+        self.fp.close()
+        super(StreamingUploadTests, self).tearDown()
+
+    def _upload(self, **kwargs):
+        transport = SyncTransport(self.url, cookie_file=self.cookie_file,
+                                  **kwargs)
+        self.addCleanup(transport.close)
+
+        request = HttpRequest(self.api_url + 'files/', method='POST')
+        request.add_file('path', 'data.bin', self.fp)
+        rsp = transport.execute_request_method(lambda: request)
+        self.assertEqual(rsp.id, 1)
+
+        self.fp.seek(0)
+        self.assertEqual(len(self.server.request_bodies), 1)
+        self.assertTrue(self.fp.read() in self.server.request_bodies[0])
+
+    def test_upload_file(self):
+        """Testing uploading a file object with a streamed body"""
+        self._upload()
+
+    def test_upload_file_with_keep_alive(self):
+        """Testing uploading a file object with a streamed body over a
+        persistent connection
+        """
+        self._upload(keep_alive=True)
+
+
+class CompressedResponseTests(APIServerTestCase):
+    """Tests for decoding compressed responses."""
+    def setUp(self):
+        super(CompressedResponseTests, self).setUp()
+
+        self.server.compress = True
+        self.add_payload('/api/groups/group1/',
+                         'application/vnd.reviewboard.org.group+json', {
+                             'group': {
+                                 'id': 1,
+                                 'description': 'x' * 10000,
+                             },
+                             'stat': 'ok',
+                         })
+
+    def _get_group(self, **kwargs):
+        transport = SyncTransport(self.url, cookie_file=self.cookie_file,
+                                  **kwargs)
+        self.addCleanup(transport.close)
+
+        return transport, transport.get_path('groups/group1/')
+
+    def test_compressed_response(self):
+        """Testing decoding gzip-compressed responses"""
+        transport, group = self._get_group(compress_responses=True)
+
+        self.assertEqual(group.description, 'x' * 10000)
+        self.assertTrue(self.server.bytes_sent < 1000)
+
+    def test_compressed_response_with_keep_alive(self):
+        """Testing decoding gzip-compressed responses over a persistent
+        connection
+        """
+        transport, group = self._get_group(compress_responses=True,
+                                           keep_alive=True)
+
+        self.assertEqual(group.description, 'x' * 10000)
+        self.assertTrue(self.server.bytes_sent < 1000)
+
+    def test_uncompressed_by_default(self):
+        """Testing compressed responses are not requested by default"""
+        transport, group = self._get_group()
+
+        self.assertEqual(group.description, 'x' * 10000)
+        self.assertTrue(self.server.bytes_sent > 10000)
+
+    def test_compressed_response_with_cache(self):
+        """Testing the API cache stores decoded bodies of compressed
+        responses
+        """
+        self.server.response_headers['Cache-Control'] = 'max-age=60'
+        transport, group = self._get_group(compress_responses=True)
+
+        server = transport.server
+        server._cache = APICache(create_db_in_memory=True,
+                                 urlopen=server._urlopen)
+        server._urlopen = server._cache.make_request
+
+        for i in range(2):
+            group = transport.get_path('groups/group1/')
+            self.assertEqual(group.description, 'x' * 10000)
+
+        self.assertEqual(len(self.server.paths), 2)
+
+    def test_decompress_body_deflate(self):
+        """Testing decompress_body with zlib-wrapped and raw deflate data"""
+        data = b'x' * 1000
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        raw = compressor.compress(data) + compressor.flush()
+
+        self.assertEqual(decompress_body(zlib.compress(data), 'deflate'),
+                         data)
+        self.assertEqual(decompress_body(raw, 'deflate'), data)
+
+
+class CompressedUploadTests(APIServerTestCase):
+    """Tests for uploading compressed diffs."""
+    def setUp(self):
+        super(CompressedUploadTests, self).setUp()
+
+        self.add_payload('/api/diffs/',
+                         'application/vnd.reviewboard.org.diffs+json', {
+                             'diffs': [],
+                             'links': {
+                                 'create': {
+                                     'href': self.api_url + 'diffs/',
+                                     'method': 'POST',
+                                 },
+                             },
+                             'total_results': 0,
+                             'stat': 'ok',
+                         })
+        self.diff = b'--- a/README\n+++ b/README\n' + b'+line\n' * 1000
+
+    def _upload_diffs(self, count, diff=None, **kwargs):
+        transport = SyncTransport(self.url, cookie_file=self.cookie_file,
+                                  **kwargs)
+        self.addCleanup(transport.close)
+        diffs = transport.get_path('diffs/')
+
+        for i in range(count):
+            diffs.upload_diff(diff or self.diff)
+
+        for body in self.server.request_bodies:
+            self.assertTrue(self.diff in body)
+
+    def test_compressed_upload(self):
+        """Testing uploading compressed diffs"""
+        self._upload_diffs(1, compress_uploads=True)
+
+        self.assertEqual(self.server.request_encodings, ['gzip'])
+
+    def test_compressed_upload_rejected(self):
+        """Testing uploading compressed diffs falls back to uncompressed
+        when the server rejects them
+        """
+        self.server.accept_compressed_uploads = False
+        self._upload_diffs(2, compress_uploads=True)
+
+        self.assertEqual(self.server.request_encodings, ['gzip', None, None])
+        self.assertEqual(len(self.server.request_bodies), 2)
+
+    def test_compressed_upload_missing_file(self):
+        """Testing uploading compressed diffs falls back to uncompressed
+        when the server can't find the diff file in the compressed body
+        """
+        self.server.compressed_upload_error = {
+            'path': ['This field is required.'],
+        }
+        self._upload_diffs(1, compress_uploads=True)
+
+        self.assertEqual(self.server.request_encodings, ['gzip', None])
+
+    def test_compressed_upload_invalid_form(self):
+        """Testing uploading compressed diffs doesn't fall back to
+        uncompressed on other invalid form data
+        """
+        self.server.compressed_upload_error = {
+            'basedir': ['This field is required.'],
+        }
+
+        with self.assertRaises(APIError):
+            self._upload_diffs(1, compress_uploads=True)
+
+        self.assertEqual(self.server.request_encodings, ['gzip'])
+
+    def test_file_upload_uncompressed(self):
+        """Testing uploading diffs from files is never compressed"""
+        with tempfile.TemporaryFile() as fp:
+            fp.write(self.diff)
+            fp.seek(0)
+            self._upload_diffs(1, diff=fp, compress_uploads=True)
+
+        self.assertEqual(self.server.request_encodings, [None])
+
+    def test_uncompressed_by_default(self):
+        """Testing diffs are uploaded uncompressed by default"""
+        self._upload_diffs(1)
+
+        self.assertEqual(self.server.request_encodings, [None])
+
+
+class InstrumentationTests(APIServerTestCase):
+    """Tests for request timing instrumentation."""
+    def setUp(self):
+        super(InstrumentationTests, self).setUp()
+
+        self.profiler = HTTPProfiler()
+        self.add_payload('/api/groups/group1/',
+                         'application/vnd.reviewboard.org.group+json', {
+                             'group': {'id': 1},
+                             'stat': 'ok',
+                         })
+
+    def _make_transport(self, **kwargs):
+        transport = SyncTransport(self.url, cookie_file=self.cookie_file,
+                                  instrumentation=self.profiler, **kwargs)
+        self.addCleanup(transport.close)
+
+        return transport
+
+    def test_request_timings(self):
+        """Testing request timings over persistent connections"""
+        transport = self._make_transport(keep_alive=True)
+        transport.get_path('groups/group1/')
+        transport.get_path('groups/group1/')
+
+        timings = self.profiler.timings
+        self.assertEqual(len(timings), 2)
+
+        for timing in timings:
+            self.assertEqual(timing.method, 'GET')
+            self.assertEqual(timing.url, self.api_url + 'groups/group1/')
+            self.assertTrue(timing.connect_time is not None)
+
+            for field in ('ttfb', 'read_time', 'request_time',
+                          'decode_time', 'construct_time', 'total_time'):
+                self.assertTrue(getattr(timing, field) >= 0)
+
+            self.assertTrue(timing.cache_outcome is None)
+            self.assertTrue(timing.error is None)
+
+        # The second request reused the connection.
+        self.assertEqual(timings[1].connect_time, 0)
+
+    def test_request_timings_with_error(self):
+        """Testing request timings for a failed request"""
+        transport = self._make_transport()
+
+        with self.assertRaises(APIError):
+            transport.get_path('groups/missing/')
+
+        timing = self.profiler.timings[0]
+        self.assertEqual(timing.error, 'APIError')
+        self.assertTrue(timing.total_time >= 0)
+        self.assertTrue(timing.decode_time is None)
+
+    def test_cache_outcomes(self):
+        """Testing request timings record API cache outcomes"""
+        self.server.response_headers['Cache-Control'] = 'max-age=60'
+        transport = self._make_transport()
+
+        server = transport.server
+        server._cache = APICache(create_db_in_memory=True,
+                                 urlopen=server._urlopen)
+        server._urlopen = server._cache.make_request
+
+        transport.get_path('groups/group1/')
+        transport.get_path('groups/group1/')
+
+        self.assertEqual(
+            [timing.cache_outcome for timing in self.profiler.timings],
+            ['miss', 'hit'])
+        self.assertEqual(self.profiler.get_summary()['cache_outcomes'],
+                         {'hit': 1, 'miss': 1})
+
+    def test_summary_output(self):
+        """Testing HTTPProfiler table and JSON output"""
+        transport = self._make_transport()
+        transport.get_path('groups/group1/')
+
+        table = self.profiler.to_table().splitlines()
+        self.assertEqual(len(table), 3)
+        self.assertTrue(table[1].endswith(self.api_url + 'groups/group1/'))
+        self.assertTrue(table[2].startswith('Total'))
+
+        data = json.loads(self.profiler.to_json())
+        self.assertEqual(data['summary']['requests'], 1)
+        self.assertEqual(data['requests'][0]['method'], 'GET')
+
+
+class RecordingRetryPolicy(RetryPolicy):
+    """A retry policy which records delays instead of sleeping."""
+    def __init__(self, *args, **kwargs):
+        super(RecordingRetryPolicy, self).__init__(*args, **kwargs)
+        self.delays = []
+
+    def sleep(self, delay):
+        self.delays.append(delay)
+
+
+class RetryTests(APIServerTestCase):
+    """Tests for retrying failed requests."""
+    def setUp(self):
+        super(RetryTests, self).setUp()
+
+        self.retry_policy = RecordingRetryPolicy()
+        self.add_payload('/api/groups/group1/',
+                         'application/vnd.reviewboard.org.group+json', {
+                             'group': {'id': 1},
+                             'stat': 'ok',
+                         })
+
+    def _make_transport(self, **kwargs):
+        transport = SyncTransport(self.url, cookie_file=self.cookie_file,
+                                  retry_policy=self.retry_policy, **kwargs)
+        self.addCleanup(transport.close)
+
+        return transport
+
+    def test_retry_get(self):
+        """Testing retrying GET requests on HTTP 503"""
+        self.server.failures = [(503, {}), (502, {})]
+        group = self._make_transport().get_path('groups/group1/')
+
+        self.assertEqual(group.id, 1)
+        self.assertEqual(len(self.server.paths), 3)
+        self.assertEqual(len(self.retry_policy.delays), 2)
+        self.assertTrue(0 <= self.retry_policy.delays[0] <= 0.5)
+        self.assertTrue(0 <= self.retry_policy.delays[1] <= 1.0)
+
+    def test_retry_get_with_keep_alive(self):
+        """Testing retrying GET requests on HTTP 503 over a persistent
+        connection
+        """
+        self.server.failures = [(503, {})]
+        group = self._make_transport(keep_alive=True).get_path(
+            'groups/group1/')
+
+        self.assertEqual(group.id, 1)
+        self.assertEqual(len(self.retry_policy.delays), 1)
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_retry_after(self):
+        """Testing retrying with a Retry-After header"""
+        self.server.failures = [(503, {'Retry-After': '7'})]
+        self._make_transport().get_path('groups/group1/')
+
+        self.assertEqual(self.retry_policy.delays, [7])
+
+    def test_retry_gives_up(self):
+        """Testing retrying stops after max_retries"""
+        self.server.failures = [(503, {})] * 5
+
+        with self.assertRaises(APIError) as cm:
+            self._make_transport().get_path('groups/group1/')
+
+        self.assertEqual(cm.exception.http_status, 503)
+        self.assertEqual(len(self.server.paths), 4)
+
+    def test_retry_max_total_wait(self):
+        """Testing retrying stops when the total wait would be too long"""
+        self.server.failures = [(503, {'Retry-After': '20'})] * 2
+
+        with self.assertRaises(APIError):
+            self._make_transport().get_path('groups/group1/')
+
+        self.assertEqual(self.retry_policy.delays, [20])
+
+    def test_no_retry_post(self):
+        """Testing POST requests are not retried on HTTP 503"""
+        self.server.failures = [(503, {})]
+        request = HttpRequest(self.api_url + 'groups/group1/',
+                              method='POST')
+        request.add_field('name', 'group1')
+
+        with self.assertRaises(APIError):
+            self._make_transport().execute_request_method(lambda: request)
+
+        self.assertEqual(len(self.server.paths), 1)
+        self.assertEqual(self.retry_policy.delays, [])
+
+    def test_retry_connection_error(self):
+        """Testing retrying GET requests when the server can't be reached"""
+        # Find a port that nothing is listening on.
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        transport = SyncTransport('http://127.0.0.1:%d/' % port,
+                                  cookie_file=self.cookie_file,
+                                  retry_policy=self.retry_policy)
+        self.addCleanup(transport.close)
+
+        with self.assertRaises(ServerInterfaceError):
+            transport.get_path('groups/group1/')
+
+        self.assertEqual(len(self.retry_policy.delays), 3)
+
+    def test_no_retry_permanent_errors(self):
+        """Testing RetryPolicy doesn't retry permanent connection errors"""
+        policy = RetryPolicy()
+
+        self.assertFalse(policy.should_retry(
+            'GET', 0, error=socket.gaierror(-2, 'Name or service not known')))
+        self.assertFalse(policy.should_retry(
+            'GET', 0, error='Unable to decode the response'))
+        self.assertTrue(policy.should_retry(
+            'GET', 0, error=socket.error(errno.ECONNREFUSED, 'refused')))
+        self.assertTrue(policy.should_retry('GET', 0,
+                                            error=socket.timeout()))
+
+    def test_reconnect_without_retries(self):
+        """Testing reconnecting a closed persistent connection when retries
+        are disabled
+        """
+        self.retry_policy.max_retries = 0
+        transport = self._make_transport(keep_alive=True)
+        transport.get_path('groups/group1/')
+
+        # Simulate the server dropping the idle connection.
+        pool = transport.server.connection_pool
+
+        for connections in six.itervalues(pool._idle):
+            for connection in connections:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+
+        group = transport.get_path('groups/group1/')
+
+        self.assertEqual(group.id, 1)
+        self.assertEqual(self.server.connection_count, 2)
+        self.assertEqual(self.retry_policy.delays, [])
+
+    def test_parse_retry_after_date(self):
+        """Testing RetryPolicy.parse_retry_after with an HTTP date"""
+        policy = RetryPolicy()
+        value = formatdate(time.time() + 60, usegmt=True)
+
+        self.assertTrue(55 <= policy.parse_retry_after(value) <= 60)
+        self.assertEqual(policy.parse_retry_after('invalid'), None)
+
+
+class ExecuteBatchTests(APIServerTestCase):
+    """Tests for SyncTransport.execute_batch."""
+    def setUp(self):
+        super(ExecuteBatchTests, self).setUp()
+
+        self.transport = SyncTransport(self.url, cookie_file=self.cookie_file)
+
+        for i in range(5):
+            self.add_payload('/api/groups/group%d/' % i,
+                             'application/vnd.reviewboard.org.group+json', {
+                                 'group': {'id': i},
+                                 'stat': 'ok',
+                             })
+
+    def tearDown(self):
+        self.transport.close()
+        super(ExecuteBatchTests, self).tearDown()
+
+    def _make_requests(self, names):
+        return [
+            HttpRequest('%sgroups/%s/' % (self.api_url, name))
+            for name in names
+        ]
+
+    def test_execute_batch(self):
+        """Testing SyncTransport.execute_batch returns results in order"""
+        results = self.transport.execute_batch(
+            self._make_requests(['group%d' % i for i in range(5)]),
+            max_workers=2)
+
+        self.assertEqual([result.id for result in results], list(range(5)))
+
+    def test_execute_batch_with_errors(self):
+        """Testing SyncTransport.execute_batch with per-request errors"""
+        results = self.transport.execute_batch(
+            self._make_requests(['group0', 'missing', 'group2']))
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0].id, 0)
+        self.assertTrue(isinstance(results[1], APIError))
+        self.assertEqual(results[1].http_status, 404)
+        self.assertEqual(results[2].id, 2)
+
+    def test_execute_batch_from_root(self):
+        """Testing RootResource.execute_batch"""
+        root = self.transport.get_root()
+        results = root.execute_batch([
+            root.get_group(group_name='group%d' % i, internal=True)
+            for i in range(3)
+        ])
+
+        self.assertEqual([result.id for result in results], [0, 1, 2])
+
+    def test_execute_batch_with_cache(self):
+        """Testing SyncTransport.execute_batch with the API cache"""
+        server = self.transport.server
+        server._cache = APICache(create_db_in_memory=True,
+                                 urlopen=server._urlopen)
+        server._urlopen = server._cache.make_request
+        self.server.response_headers['Cache-Control'] = 'max-age=60'
+
+        names = ['group%d' % i for i in range(5)]
+        self.transport.execute_batch(self._make_requests(names))
+        self.assertEqual(len(self.server.paths), 5)
+
+        results = self.transport.execute_batch(self._make_requests(names))
+        self.assertEqual([result.id for result in results], list(range(5)))
+        self.assertEqual(len(self.server.paths), 5)
+
+
+@unittest.skipIf(six.PY2, 'AsyncTransport requires Python 3')
+class AsyncTransportTests(APIServerTestCase):
+    """Tests for rbtools.api.transport.asynchronous.AsyncTransport."""
+    def setUp(self):
+        super(AsyncTransportTests, self).setUp()
+
+        import asyncio
+        from rbtools.api.transport.asynchronous import AsyncTransport
+
+        self.asyncio = asyncio
+        self.loop = asyncio.new_event_loop()
+        self.transport = AsyncTransport(self.url,
+                                        cookie_file=self.cookie_file,
+                                        loop=self.loop)
+
+        self.add_list_payload('/api/groups/', 'groups', [
+            {'id': 1, 'name': 'group1'},
+        ])
+        self.add_payload('/api/groups/group1/',
+                         'application/vnd.reviewboard.org.group+json', {
+                             'group': {
+                                 'id': 1,
+                                 'name': 'group1',
+                                 'links': {
+                                     'self': {
+                                         'href': (self.api_url +
+                                                  'groups/group1/'),
+                                         'method': 'GET',
+                                     },
+                                 },
+                             },
+                             'stat': 'ok',
+                         })
+
+    def tearDown(self):
+        self.transport.close()
+        self.loop.close()
+        super(AsyncTransportTests, self).tearDown()
+
+    def test_get_root(self):
+        """Testing AsyncTransport.get_root returns an awaitable"""
+        future = self.transport.get_root()
+        self.assertTrue(self.asyncio.isfuture(future))
+
+        root = self.loop.run_until_complete(future)
+        self.assertTrue(isinstance(root, RootResource))
+
+    def test_stream_list(self):
+        """Testing AsyncTransport.stream_list falls back to fetching pages
+        as resources
+        """
+        request = HttpRequest(self.api_url + 'groups/')
+
+        self.assertEqual(self.transport.stream_list(request), None)
+        self.assertEqual(self.server.paths, [])
 
-    def test_link_field(self):
-        """Testing access of a link field."""
-        r = create_resource(self.transport, self.item_payload, '')
+    def test_execute_request_make_result(self):
+        """Testing AsyncTransport._execute_request with a result function"""
+        request = HttpRequest(self.api_url + 'groups/')
+        decoder = self.loop.run_until_complete(
+            self.transport._execute_request(
+                request, self.transport._make_list_stream))
 
-        field = r.link_field
-        self.assertTrue(isinstance(field, ResourceLinkField))
+        try:
+            self.assertEqual([item['name'] for item in decoder],
+                             ['group1'])
+        finally:
+            decoder.close()
+
+    def test_get_path_and_get_url(self):
+        """Testing AsyncTransport.get_path and get_url return awaitables"""
+        groups, group = self.loop.run_until_complete(self.asyncio.gather(
+            self.transport.get_path('groups/'),
+            self.transport.get_url(self.url + 'api/groups/group1/')))
+
+        self.assertTrue(isinstance(groups, ListResource))
+        self.assertEqual(groups[0].name, 'group1')
+        self.assertEqual(group.name, 'group1')
+
+    def test_get_all_items(self):
+        """Testing AsyncTransport.get_all_items"""
+        self._add_paged_groups()
+        groups = self.loop.run_until_complete(
+            self.transport.get_path('groups/'))
+
+        for max_workers in (None, 2):
+            items = self.loop.run_until_complete(
+                self.transport.get_all_items(groups, max_workers=max_workers))
+            self.assertEqual([item.id for item in items], [1, 2, 3])
+
+    def test_all_pages_not_supported(self):
+        """Testing ListResource.all_items with AsyncTransport raises an
+        error
+        """
+        groups = self.loop.run_until_complete(
+            self.transport.get_path('groups/'))
 
-        request = field.get()
-        self.assertEqual(request.method, 'GET')
-        self.assertEqual(
-            request.url,
-            self.item_payload['resource_token']['link_field']['href'])
+        with self.assertRaises(NotImplementedError):
+            list(groups.all_items)
 
+        with self.assertRaises(NotImplementedError):
+            list(groups.parallel_items())
 
-class HttpRequestTests(TestCase):
-    def setUp(self):
-        self.request = HttpRequest('/')
+    def _add_paged_groups(self):
+        groups_url = self.api_url + 'groups/'
 
-    def test_default_values(self):
-        """Testing the default values."""
-        self.assertEqual(self.request.url, '/')
-        self.assertEqual(self.request.method, 'GET')
-        content_type, content = self.request.encode_multipart_formdata()
-        self.assertTrue(content_type is None)
-        self.assertTrue(content is None)
+        def get_page(query):
+            start = int(query.get('start', 0))
+            links = {}
 
-    def test_post_form_data(self):
-        """Testing the multipart form data generation."""
-        request = HttpRequest('/', 'POST')
-        request.add_field('foo', 'bar')
-        request.add_field('bar', 42)
-        request.add_field('err', 'must-be-deleted')
-        request.add_field('name', 'somestring')
-        request.del_field('err')
+            if start < 2:
+                links['next'] = {
+                    'href': '%s?start=%d&max-results=1'
+                            % (groups_url, start + 1),
+                    'method': 'GET',
+                }
 
-        ctype, content = request.encode_multipart_formdata()
-        m = re.match(b'^multipart/form-data; boundary=(.*)$', ctype)
-        self.assertFalse(m is None)
-        fields = [l.strip() for l in content.split(b'--' + m.group(1))][1:-1]
+            return {
+                'groups': [{'id': start + 1}],
+                'links': links,
+                'total_results': 3,
+                'stat': 'ok',
+            }
 
-        d = {}
+        self.add_payload('/api/groups/',
+                         'application/vnd.reviewboard.org.groups+json',
+                         get_page)
 
-        disposition_re = re.compile(
-            b'Content-Disposition: form-data; name="(.*?)"$')
+    def test_link_methods(self):
+        """Testing AsyncTransport with generated link methods"""
+        root = self.loop.run_until_complete(self.transport.get_root())
 
-        for f in fields:
-            lst = f.split(b'\r\n\r\n')
-            self.assertEqual(len(lst), 2)
-            k, v = lst
+        groups_future = root.get_groups()
+        group_future = root.get_group(group_name='group1')
+        self.assertTrue(self.asyncio.isfuture(groups_future))
+        self.assertTrue(self.asyncio.isfuture(group_future))
 
-            m = disposition_re.match(k)
-            self.assertFalse(m is None)
-            d[m.group(1)] = v
+        groups, group = self.loop.run_until_complete(
+            self.asyncio.gather(groups_future, group_future))
+        self.assertEqual(groups.total_results, 1)
+        self.assertEqual(group.id, 1)
 
-        self.assertEqual(
-            d, {b'foo': b'bar', b'bar': b'42', b'name': b'somestring'})
+        # Resources built by the transport keep returning awaitables.
+        group = self.loop.run_until_complete(group.get_self())
+        self.assertEqual(group.name, 'group1')
 
 
 class ReviewRequestResourceTests(TestCase):
@@ -773,13 +2950,7 @@ class APICacheTests(TestCase):
 
     def test_expires_header_future(self):
         """Testing the cache with the Expires header in the future"""
-
-        # We generate the future date in the C locale so that it is properly
-        # formatted.
-        locale.setlocale(locale.LC_TIME, str('C'))
-        future_date = datetime.datetime.utcnow() + datetime.timedelta(days=1)
-        future_date = future_date.strftime(APICache.EXPIRES_FORMAT) + 'UTC'
-        locale.resetlocale(locale.LC_TIME)
+        future_date = formatdate(time.time() + 86400, usegmt=True)
 
         self.urlopener.endpoints['http://expires_future'] = {
             'hit_count': 0,
@@ -797,6 +2968,37 @@ class APICacheTests(TestCase):
         self.assertFalse(isinstance(first_resp, CachedHTTPResponse))
         self.assertTrue(isinstance(second_resp, CachedHTTPResponse))
 
+    def test_expires_header_invalid(self):
+        """Testing the cache with an invalid Expires header"""
+        self.urlopener.endpoints['http://expires_invalid'] = {
+            'hit_count': 0,
+            'headers': {
+                'Expires': '0',
+            },
+        }
+
+        request = Request('http://expires_invalid', method='GET')
+        self.cache.make_request(request)
+        second_resp = self.cache.make_request(request)
+
+        self.assertEqual(
+            self.urlopener.get_hit_count('http://expires_invalid'),
+            2)
+        self.assertFalse(isinstance(second_resp, CachedHTTPResponse))
+
+    def test_parse_http_date(self):
+        """Testing parse_http_date with each RFC 7231 date format"""
+        timestamp = 784111777
+
+        self.assertEqual(parse_http_date('Sun, 06 Nov 1994 08:49:37 GMT'),
+                         timestamp)
+        self.assertEqual(parse_http_date('Sunday, 06-Nov-94 08:49:37 GMT'),
+                         timestamp)
+        self.assertEqual(parse_http_date('Sun Nov  6 08:49:37 1994'),
+                         timestamp)
+        self.assertIsNone(parse_http_date('0'))
+        self.assertIsNone(parse_http_date('garbage'))
+
     def test_expires_header_overriden_by_max_age(self):
         """Testing the cache with an Expires header that is overridden"""
         request = Request('http://expires_override', method='GET')
@@ -827,10 +3029,772 @@ class APICacheTests(TestCase):
 
         try:
             self.cache._save_entry(entry)
+            self.cache.flush()
         except:
             self.fail('Could not write binary data to the API cache.')
 
         try:
             self.cache._save_entry(entry)
+            self.cache.flush()
         except:
             self.fail('Could not update binary data in the API cache.')
+
+
+class APICacheStorageTests(TestCase):
+    """Tests for how the APICache stores entries in its database."""
+    request_headers = {
+        'http://high_max_age': {
+            'Cache-Control': 'max-age=10000',
+        },
+        'http://no_cache_etag': {
+            'Cache-Control': 'no-cache',
+            'ETag': 'etag',
+        },
+    }
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tempdir, 'apicache.db')
+        self.urlopener = MockUrlOpener(self.request_headers)
+        self.urlopener.CONTENT = b'foobar'
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _make_cache(self):
+        cache = APICache(urlopen=self.urlopener, db_path=self.db_path)
+        self.addCleanup(cache.close)
+
+        return cache
+
+    def _make_entry(self, url, response_body=b'{}'):
+        return CacheEntry(
+            url=url,
+            vary_headers={},
+            max_age=60,
+            etag=None,
+            local_date=datetime.datetime.now(),
+            last_modified=None,
+            mime_type='application/json',
+            item_mime_type=None,
+            response_body=response_body)
+
+    def _get_urls(self):
+        db = sqlite3.connect(self.db_path)
+
+        try:
+            return set(
+                row[0]
+                for row in db.execute('SELECT url FROM api_cache')
+            )
+        finally:
+            db.close()
+
+    def _count_entries(self):
+        db = sqlite3.connect(self.db_path)
+
+        try:
+            return db.execute('SELECT COUNT(*) FROM api_cache').fetchone()[0]
+        finally:
+            db.close()
+
+    def test_wal_mode(self):
+        """Testing APICache uses write-ahead logging"""
+        self._make_cache()
+        db = sqlite3.connect(self.db_path)
+
+        try:
+            self.assertEqual(
+                db.execute('PRAGMA journal_mode').fetchone()[0].lower(),
+                'wal')
+        finally:
+            db.close()
+
+    def test_writes_committed_on_close(self):
+        """Testing APICache commits buffered writes when closed"""
+        cache = self._make_cache()
+        request = Request('http://high_max_age', method='GET')
+
+        cache.make_request(request)
+        self.assertEqual(self._count_entries(), 0)
+
+        # The buffered entry is still used for lookups.
+        self.assertTrue(isinstance(cache.make_request(request),
+                                   CachedHTTPResponse))
+        self.assertEqual(self.urlopener.get_hit_count('http://high_max_age'),
+                         1)
+
+        cache.close()
+        self.assertEqual(self._count_entries(), 1)
+
+        cache = self._make_cache()
+        self.assertTrue(isinstance(cache.make_request(request),
+                                   CachedHTTPResponse))
+        self.assertEqual(self.urlopener.get_hit_count('http://high_max_age'),
+                         1)
+
+    def test_schema_check_without_write_lock(self):
+        """Testing APICache only takes the write lock to create the schema"""
+        transactions = []
+
+        class RecordingAPICache(APICache):
+            def _transaction(self):
+                transactions.append(self.db_path)
+
+                return super(RecordingAPICache, self)._transaction()
+
+        RecordingAPICache(urlopen=self.urlopener,
+                          db_path=self.db_path).close()
+        self.assertEqual(len(transactions), 1)
+
+        # Opening the cache while another process holds the write lock
+        # doesn't wait for it.
+        db = sqlite3.connect(self.db_path, isolation_level=None)
+        self.addCleanup(db.close)
+        db.execute('BEGIN IMMEDIATE')
+
+        try:
+            cache = RecordingAPICache(urlopen=self.urlopener,
+                                      db_path=self.db_path)
+        finally:
+            db.execute('ROLLBACK')
+
+        cache.close()
+        self.assertEqual(len(transactions), 1)
+
+    def test_concurrent_writers(self):
+        """Testing APICache with many caches writing to one database"""
+        errors = []
+        self._make_cache().close()
+
+        def write_entries(i):
+            try:
+                cache = APICache(urlopen=self.urlopener, db_path=self.db_path)
+
+                for j in range(20):
+                    cache._save_entry(self._make_entry(
+                        'http://example.com/%d/%d/' % (i, j)))
+
+                cache.close()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=write_entries, args=(i,))
+            for i in range(8)
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self._count_entries(), 160)
+
+    def test_memory_tier(self):
+        """Testing APICache serves repeated lookups from memory"""
+        cache = self._make_cache()
+        request = Request('http://high_max_age', method='GET')
+        cache.make_request(request)
+        cache.close()
+
+        cache = self._make_cache()
+        statements = []
+        cache.db.set_trace_callback(statements.append)
+
+        for i in range(3):
+            self.assertTrue(isinstance(cache.make_request(request),
+                                       CachedHTTPResponse))
+
+        self.assertEqual(
+            len([
+                statement
+                for statement in statements
+                if statement.startswith('SELECT')
+            ]),
+            1)
+        self.assertEqual(self.urlopener.get_hit_count('http://high_max_age'),
+                         1)
+
+    def test_memory_tier_vary(self):
+        """Testing APICache's memory tier with Vary headers"""
+        cache = self._make_cache()
+
+        for user in ('user1', 'user2'):
+            entry = self._make_entry('http://example.com/',
+                                     user.encode('utf-8'))
+            entry.vary_headers = {'Cookie': user}
+            cache._save_entry(entry)
+
+        cache.flush()
+
+        for user in ('user1', 'user2', 'user1'):
+            request = Request('http://example.com/', method='GET')
+            request.headers['Cookie'] = user
+            entry = cache._get_entry(request)
+
+            self.assertEqual(entry.response_body, user.encode('utf-8'))
+
+        request = Request('http://example.com/', method='GET')
+        self.assertEqual(cache._get_entry(request), None)
+
+    def test_vary_key_lookup(self):
+        """Testing APICache looks up entries with Vary headers in one query"""
+        cache = self._make_cache()
+
+        for user in ('user1', 'user2', 'user3'):
+            entry = self._make_entry('http://example.com/',
+                                     user.encode('utf-8'))
+            entry.vary_headers = {'Cookie': user, 'Accept': 'text/plain'}
+            cache._save_entry(entry)
+
+        cache.close()
+
+        cache = self._make_cache()
+        statements = []
+        cache.db.set_trace_callback(statements.append)
+
+        request = Request('http://example.com/', method='GET')
+        request.headers['Accept'] = 'text/plain'
+        request.headers['Cookie'] = 'user2'
+        entry = cache._get_entry(request)
+
+        self.assertEqual(entry.response_body, b'user2')
+        self.assertEqual(
+            len([
+                statement
+                for statement in statements
+                if statement.startswith('SELECT')
+            ]),
+            1)
+
+        request.headers['Cookie'] = 'user4'
+        self.assertEqual(cache._get_entry(request), None)
+
+    def test_stale_response_body_loaded_lazily(self):
+        """Testing APICache only loads the body of a stale entry when it's
+        used
+        """
+        cache = self._make_cache()
+        entry = self._make_entry('http://example.com/', b'foobar')
+        entry.local_date -= datetime.timedelta(seconds=120)
+        cache._save_entry(entry)
+        cache.close()
+
+        cache = self._make_cache()
+        statements = []
+        cache.db.set_trace_callback(statements.append)
+
+        entry = cache._get_entry(Request('http://example.com/',
+                                         method='GET'))
+        self.assertFalse(entry.up_to_date())
+        self.assertEqual(len(statements), 1)
+
+        self.assertEqual(entry.response_body, b'foobar')
+        self.assertEqual(len(statements), 2)
+
+    def test_memory_tier_limits(self):
+        """Testing APICache limits the number of entries kept in memory"""
+        cache = self._make_cache()
+        cache.MEMORY_MAX_ENTRIES = 2
+
+        for i in range(3):
+            cache._save_entry(self._make_entry('http://example.com/%d/' % i))
+
+        self.assertEqual(list(cache._memory.keys()),
+                         ['http://example.com/1/', 'http://example.com/2/'])
+
+        # The evicted entry is still available from the database.
+        cache.flush()
+        request = Request('http://example.com/0/', method='GET')
+        self.assertNotEqual(cache._get_entry(request), None)
+        self.assertEqual(list(cache._memory.keys()),
+                         ['http://example.com/2/', 'http://example.com/0/'])
+
+    def test_stale_while_revalidate(self):
+        """Testing APICache with stale_while_revalidate revalidates expired
+        entries in the background
+        """
+        cache = APICache(urlopen=self.urlopener, db_path=self.db_path,
+                         stale_while_revalidate=60)
+        self.addCleanup(cache.close)
+        request = Request('http://no_cache_etag', method='GET')
+
+        self.assertFalse(isinstance(cache.make_request(request),
+                                    CachedHTTPResponse))
+        self.assertEqual(
+            self.urlopener.get_hit_count('http://no_cache_etag'), 1)
+
+        response = cache.make_request(request)
+        self.assertTrue(isinstance(response, CachedHTTPResponse))
+        self.assertEqual(response.read(), b'foobar')
+        self.assertNotIn('If-none-match', request.headers)
+
+        cache.close()
+        self.assertEqual(
+            self.urlopener.get_hit_count('http://no_cache_etag'), 2)
+        self.assertEqual(cache._revalidations, {})
+
+    def test_stale_while_revalidate_too_old(self):
+        """Testing APICache with stale_while_revalidate revalidates entries
+        that expired too long ago right away
+        """
+        cache = APICache(urlopen=self.urlopener, db_path=self.db_path,
+                         stale_while_revalidate=60)
+        self.addCleanup(cache.close)
+        request = Request('http://no_cache_etag', method='GET')
+        cache.make_request(request)
+
+        entry = cache._get_entry(request)
+        entry.local_date -= datetime.timedelta(seconds=120)
+
+        self.assertTrue(isinstance(cache.make_request(request),
+                                   CachedHTTPResponse))
+        self.assertEqual(
+            self.urlopener.get_hit_count('http://no_cache_etag'), 2)
+        self.assertEqual(cache._revalidations, {})
+
+    def test_offline(self):
+        """Testing APICache in offline mode"""
+        cache = self._make_cache()
+        cache.make_request(Request('http://no_cache_etag', method='GET'))
+        cache.close()
+
+        cache = APICache(urlopen=self.urlopener, db_path=self.db_path,
+                         offline=True)
+        self.addCleanup(cache.close)
+
+        response = cache.make_request(Request('http://no_cache_etag',
+                                              method='GET'))
+        self.assertTrue(isinstance(response, CachedHTTPResponse))
+        self.assertEqual(response.read(), b'foobar')
+
+        self.assertRaises(URLError, cache.make_request,
+                          Request('http://high_max_age', method='GET'))
+        self.assertRaises(URLError, cache.make_request,
+                          Request('http://no_cache_etag', method='PUT'))
+        self.assertEqual(
+            self.urlopener.get_hit_count('http://no_cache_etag'), 1)
+        self.assertEqual(
+            self.urlopener.get_hit_count('http://high_max_age'), 0)
+
+    def _make_error_urlopen(self, status, error_code, headers={}):
+        """Return a URL opener failing requests with an API error."""
+        requests = []
+
+        def _urlopen(request):
+            requests.append(request.get_method())
+
+            if request.get_method() != 'GET':
+                return MockResponse(200, {}, b'{}')
+
+            body = json.dumps({
+                'stat': 'fail',
+                'err': {
+                    'code': error_code,
+                    'msg': 'Error',
+                },
+            }).encode('utf-8')
+
+            raise HTTPError(request.get_full_url(), status, 'Error',
+                            dict({'Content-Type': 'application/json'},
+                                 **headers),
+                            six.BytesIO(body))
+
+        return _urlopen, requests
+
+    def test_negative_cache(self):
+        """Testing APICache caches "does not exist" errors"""
+        urlopen, requests = self._make_error_urlopen(404, 100)
+        cache = APICache(urlopen=urlopen, db_path=self.db_path)
+        self.addCleanup(cache.close)
+
+        for i in range(2):
+            with self.assertRaises(HTTPError) as cm:
+                cache.make_request(Request('http://example.com/',
+                                           method='GET'))
+
+            self.assertEqual(cm.exception.code, 404)
+            self.assertEqual(
+                json.loads(cm.exception.read().decode('utf-8'))['err']['code'],
+                100)
+
+        self.assertEqual(requests, ['GET'])
+
+    def test_negative_cache_expired(self):
+        """Testing APICache requests errors again once they expire"""
+        urlopen, requests = self._make_error_urlopen(500, 210)
+        cache = APICache(urlopen=urlopen, db_path=self.db_path)
+        self.addCleanup(cache.close)
+        cache.NEGATIVE_TTL = 0
+
+        for i in range(2):
+            self.assertRaises(HTTPError, cache.make_request,
+                              Request('http://example.com/', method='GET'))
+
+        self.assertEqual(requests, ['GET', 'GET'])
+
+    def test_negative_cache_no_store(self):
+        """Testing APICache doesn't cache errors sent with no-store or
+        no-cache
+        """
+        for headers in ({'Cache-Control': 'no-store'},
+                        {'Cache-Control': 'no-cache'},
+                        {'Pragma': 'no-cache'}):
+            urlopen, requests = self._make_error_urlopen(404, 100, headers)
+            cache = APICache(urlopen=urlopen, db_path=self.db_path)
+            self.addCleanup(cache.close)
+
+            for i in range(2):
+                self.assertRaises(HTTPError, cache.make_request,
+                                  Request('http://example.com/',
+                                          method='GET'))
+
+            self.assertEqual(requests, ['GET', 'GET'])
+
+    def test_negative_cache_max_age(self):
+        """Testing APICache expires errors by a shorter max-age"""
+        urlopen, requests = self._make_error_urlopen(
+            404, 100, {'Cache-Control': 'max-age=5'})
+        cache = APICache(urlopen=urlopen, db_path=self.db_path)
+        self.addCleanup(cache.close)
+
+        self.assertRaises(HTTPError, cache.make_request,
+                          Request('http://example.com/', method='GET'))
+
+        entry = cache._get_entry(Request('http://example.com/',
+                                         method='GET'))
+        self.assertEqual(entry.max_age, 5)
+
+    def test_negative_cache_other_errors(self):
+        """Testing APICache doesn't cache other errors"""
+        urlopen, requests = self._make_error_urlopen(500, 225)
+        cache = APICache(urlopen=urlopen, db_path=self.db_path)
+        self.addCleanup(cache.close)
+
+        for i in range(2):
+            self.assertRaises(HTTPError, cache.make_request,
+                              Request('http://example.com/', method='GET'))
+
+        self.assertEqual(requests, ['GET', 'GET'])
+
+    def test_negative_cache_cleared_after_change(self):
+        """Testing APICache drops cached errors after a request changing
+        data
+        """
+        urlopen, requests = self._make_error_urlopen(404, 100)
+        cache = APICache(urlopen=urlopen, db_path=self.db_path)
+        self.addCleanup(cache.close)
+        request = Request('http://example.com/', method='GET')
+
+        self.assertRaises(HTTPError, cache.make_request, request)
+        cache.flush()
+
+        cache.make_request(Request('http://example.com/list/',
+                                   method='POST'))
+        self.assertRaises(HTTPError, cache.make_request, request)
+        self.assertEqual(requests, ['GET', 'POST', 'GET'])
+
+        # The cached error is deleted from the database, too.
+        cache.close()
+        cache = APICache(urlopen=urlopen, db_path=self.db_path)
+        self.addCleanup(cache.close)
+        cache.make_request(Request('http://example.com/list/',
+                                   method='POST'))
+        cache.close()
+        self.assertEqual(self._count_entries(), 0)
+
+    def test_invalidate_after_change(self):
+        """Testing APICache invalidates entries for a URL and its lists
+        after a request changing it
+        """
+        urlopen, requests = self._make_error_urlopen(404, 100)
+        cache = APICache(urlopen=urlopen, db_path=self.db_path)
+        self.addCleanup(cache.close)
+
+        invalidated_urls = [
+            'http://example.com/api/review-requests/',
+            'http://example.com/api/review-requests/?start=25',
+            'http://example.com/api/review-requests/1/',
+            'http://example.com/api/review-requests/1/draft/',
+        ]
+        kept_urls = [
+            'http://example.com/api/',
+            'http://example.com/api/review-requests/2/',
+            'http://example.com/api/users/',
+        ]
+
+        for url in invalidated_urls[:2] + kept_urls:
+            cache._save_entry(self._make_entry(url))
+
+        cache.flush()
+
+        for url in invalidated_urls[2:]:
+            cache._save_entry(self._make_entry(url))
+
+        cache.make_request(Request(
+            'http://example.com/api/review-requests/1/draft/?expand=x',
+            method='PUT'))
+
+        for url in invalidated_urls:
+            self.assertEqual(cache._get_entry(Request(url, method='GET')),
+                             None)
+
+        for url in kept_urls:
+            self.assertNotEqual(cache._get_entry(Request(url, method='GET')),
+                                None)
+
+        cache.close()
+        self.assertEqual(self._get_urls(), set(kept_urls))
+
+    def test_not_modified_updates_metadata(self):
+        """Testing APICache updates entries with the caching headers of a
+        304 Not Modified response
+        """
+        cache = self._make_cache()
+        request = Request('http://no_cache_etag', method='GET')
+        cache.make_request(request)
+
+        self.urlopener.endpoints['http://no_cache_etag']['headers'] = {
+            'Cache-Control': 'max-age=1000',
+            'ETag': 'etag',
+        }
+
+        for i in range(2):
+            self.assertTrue(isinstance(
+                cache.make_request(Request('http://no_cache_etag',
+                                           method='GET')),
+                CachedHTTPResponse))
+
+        self.assertEqual(
+            self.urlopener.get_hit_count('http://no_cache_etag'), 2)
+
+    def test_evict_least_recently_used(self):
+        """Testing APICache evicts the least recently used entries when
+        there are too many
+        """
+        cache = APICache(urlopen=self.urlopener, db_path=self.db_path,
+                         max_entries=10)
+        self.addCleanup(cache.close)
+        urls = ['http://example.com/%d/' % i for i in range(15)]
+
+        for url in urls[:10]:
+            cache._save_entry(self._make_entry(url))
+
+        cache.flush()
+
+        # Use the first five entries again.
+        time.sleep(0.01)
+
+        for url in urls[:5]:
+            self.assertNotEqual(
+                cache._get_entry(Request(url, method='GET')), None)
+
+        time.sleep(0.01)
+
+        for url in urls[10:]:
+            cache._save_entry(self._make_entry(url))
+
+        cache.flush()
+
+        remaining = self._get_urls()
+        self.assertEqual(len(remaining), 9)
+        self.assertTrue(remaining.issuperset(urls[10:]))
+        self.assertEqual(remaining & set(urls[5:10]), set())
+
+    def test_evict_by_size(self):
+        """Testing APICache evicts entries when the cache is too large"""
+        cache = APICache(urlopen=self.urlopener, db_path=self.db_path,
+                         max_size=100)
+        self.addCleanup(cache.close)
+
+        for i in range(5):
+            cache._save_entry(self._make_entry('http://example.com/%d/' % i,
+                                               b'x' * 30))
+
+        cache.flush()
+
+        self.assertEqual(self._count_entries(), 3)
+
+
+@unittest.skipIf(APICacheServer.address_family is None,
+                 'Unix sockets are not supported on this system')
+class APICacheServerTests(TestCase):
+    """Tests for sharing the API cache through an APICacheServer."""
+    request_headers = {
+        'http://high_max_age': {
+            'Cache-Control': 'max-age=10000',
+        },
+        'http://no_cache_etag': {
+            'Cache-Control': 'no-cache',
+            'ETag': 'etag',
+        },
+    }
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tempdir, 'apicache.sock')
+        self.urlopener = MockUrlOpener(self.request_headers)
+        self.urlopener.CONTENT = b'foobar'
+
+        self.server = APICacheServer(
+            self.socket_path,
+            cache=APICache(create_db_in_memory=True))
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.close()
+        shutil.rmtree(self.tempdir)
+
+    def _make_cache(self, urlopen=None):
+        cache = RemoteAPICache(self.socket_path,
+                               urlopen=urlopen or self.urlopener)
+        self.addCleanup(cache.close)
+
+        return cache
+
+    def test_socket_permissions(self):
+        """Testing APICacheServer creates its socket accessible only to its
+        user
+        """
+        modes = []
+
+        class RecordingAPICacheServer(APICacheServer):
+            def server_bind(self):
+                APICacheServer.server_bind(self)
+                mode = os.stat(self.server_address).st_mode
+                modes.append(stat.S_IMODE(mode))
+
+        socket_path = os.path.join(self.tempdir, 'other', 'apicache.sock')
+        old_umask = os.umask(0o022)
+
+        try:
+            server = RecordingAPICacheServer(
+                socket_path,
+                cache=APICache(create_db_in_memory=True))
+        finally:
+            self.assertEqual(os.umask(old_umask), 0o022)
+
+        server.close()
+
+        self.assertEqual(len(modes), 1)
+        self.assertEqual(modes[0] & 0o077, 0)
+        self.assertEqual(
+            stat.S_IMODE(os.stat(os.path.dirname(socket_path)).st_mode),
+            0o700)
+
+    def test_storage(self):
+        """Testing RemoteAPICache stores entries only through the server"""
+        cache = self._make_cache()
+        self.assertTrue(isinstance(cache, BaseAPICache))
+        self.assertFalse(isinstance(cache, APICache))
+        self.assertFalse(hasattr(cache, 'db'))
+
+        request = Request('http://high_max_age', method='GET')
+        response = cache.save_response(request, self.urlopener(request))
+        self.assertEqual(response.read(), b'foobar')
+        cache.flush()
+
+        entry = self._make_cache()._get_entry(request)
+        self.assertEqual(entry.max_age, 0)
+        self.assertEqual(entry.response_body, b'foobar')
+
+    def test_shared_entries(self):
+        """Testing RemoteAPICache shares entries between clients"""
+        request = Request('http://high_max_age', method='GET')
+
+        self.assertFalse(isinstance(self._make_cache().make_request(request),
+                                    CachedHTTPResponse))
+
+        response = self._make_cache().make_request(request)
+        self.assertTrue(isinstance(response, CachedHTTPResponse))
+        self.assertEqual(response.read(), b'foobar')
+        self.assertEqual(self.urlopener.get_hit_count('http://high_max_age'),
+                         1)
+
+    def test_shared_revalidation(self):
+        """Testing RemoteAPICache shares revalidated entries between
+        clients
+        """
+        self._make_cache().make_request(
+            Request('http://no_cache_etag', method='GET'))
+
+        for i in range(2):
+            response = self._make_cache().make_request(
+                Request('http://no_cache_etag', method='GET'))
+            self.assertTrue(isinstance(response, CachedHTTPResponse))
+
+        self.assertEqual(
+            self.urlopener.get_hit_count('http://no_cache_etag'), 3)
+        self.assertEqual(self.server._leases, {})
+
+    def test_coalesced_requests(self):
+        """Testing RemoteAPICache coalesces concurrent requests for a URL"""
+        def slow_urlopen(request):
+            time.sleep(0.2)
+
+            return self.urlopener(request)
+
+        caches = [self._make_cache(slow_urlopen) for i in range(4)]
+        responses = []
+
+        def make_request(cache):
+            responses.append(cache.make_request(
+                Request('http://high_max_age', method='GET')))
+
+        threads = [
+            threading.Thread(target=make_request, args=(cache,))
+            for cache in caches
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(responses), 4)
+        self.assertEqual(
+            len([
+                response
+                for response in responses
+                if isinstance(response, CachedHTTPResponse)
+            ]),
+            3)
+        self.assertEqual(self.urlopener.get_hit_count('http://high_max_age'),
+                         1)
+
+    def test_lease_released_on_disconnect(self):
+        """Testing APICacheServer releases a client's leases when it
+        disconnects
+        """
+        cache = self._make_cache()
+        cache._get_entry(Request('http://high_max_age', method='GET'))
+        self.assertEqual(list(self.server._leases.keys()),
+                         ['http://high_max_age'])
+
+        cache.close()
+        time.sleep(0.1)
+        self.assertEqual(self.server._leases, {})
+
+    def test_server_unavailable(self):
+        """Testing RemoteAPICache passes requests through when the server
+        goes away
+        """
+        cache = self._make_cache()
+        self.server.shutdown()
+        self.server.close()
+
+        request = Request('http://high_max_age', method='GET')
+
+        for i in range(2):
+            self.assertFalse(isinstance(cache.make_request(request),
+                                        CachedHTTPResponse))
+
+        self.assertEqual(self.urlopener.get_hit_count('http://high_max_age'),
+                         2)
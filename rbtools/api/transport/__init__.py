@@ -8,7 +8,16 @@ class Transport(object):
     unique interfaces which operate on the same underlying resource
     classes. Specifically, this allows for both a synchronous, and an
     asynchronous implementation of the transport.
+
+    ``is_async`` is True for transports whose request methods return
+    awaitables rather than resources.
+
+    ``projections`` maps the names of links and URI templates to the
+    :py:class:`rbtools.api.projection.Projection` used when fetching them.
     """
+    is_async = False
+    projections = {}
+
     def __init__(self, url, *args, **kwargs):
         self.url = url
 
@@ -46,10 +55,39 @@ class Transport(object):
         """
         raise NotImplementedError
 
+    def close(self):
+        """Release any resources held by the transport.
+
+        This should be called once the transport is no longer needed,
+        for instance to close persistent connections to the server.
+        """
+        pass
+
+    def execute_batch(self, requests, *args, **kwargs):
+        """Execute several HttpRequests and return the results.
+
+        The results are returned in the same order as the requests. Each
+        result is either the resource constructed from the response, or
+        the error raised while carrying out that request.
+        """
+        raise NotImplementedError
+
     def execute_request_method(self, method, *args, **kwargs):
         """Execute a method and carry out the returned HttpRequest."""
         return method(*args, **kwargs)
 
+    def stream_list(self, request):
+        """Carry out an HttpRequest for a page of a list resource.
+
+        This returns a :py:class:`rbtools.api.decode.JsonListStreamDecoder`
+        which yields the payload of each item as it's decoded from the
+        response, rather than constructing a resource from the whole page.
+
+        Transports which can't decode responses incrementally return None
+        without making the request.
+        """
+        return None
+
     def enable_cache(self):
         """Enable caching for all future HTTP requests."""
         return NotImplementedError
@@ -0,0 +1,169 @@
+from __future__ import unicode_literals
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from rbtools.api.request import HttpRequest
+from rbtools.api.transport.sync import SyncTransport
+
+
+class AsyncTransport(SyncTransport):
+    """An asyncio-based transport layer for the API client.
+
+    This accepts the same arguments as :py:class:`SyncTransport`, and
+    builds resources through the same ``decode_response`` and
+    ``create_resource`` pipeline. However, ``get_root``, ``get_path``,
+    ``get_url``, and every request method generated on the returned
+    resources (such as ``get_self``, ``update``, or ``get_<link>``)
+    return awaitables instead of resources. For example::
+
+        client = RBClient(url, transport_cls=AsyncTransport)
+        root = await client.get_root()
+        review_requests = await asyncio.gather(*[
+            root.get_review_request(review_request_id=review_request_id)
+            for review_request_id in review_request_ids
+        ])
+
+    Requests are carried out on a pool of worker threads, so up to
+    ``max_workers`` round-trips to the server can be in flight at the
+    same time. The optional loop parameter specifies the event loop the
+    awaitables belong to. If not provided, the running event loop is used.
+
+    The pagination helpers on list resources (``all_pages``, ``all_items``,
+    ``parallel_pages`` and ``parallel_items``) block on each page, so they
+    can't be used with this transport. Use :py:meth:`get_all_pages` and
+    :py:meth:`get_all_items` instead::
+
+        groups = await root.get_groups()
+        all_groups = await transport.get_all_items(groups)
+
+    This transport requires Python 3.
+    """
+    DEFAULT_MAX_WORKERS = 8
+
+    is_async = True
+
+    def __init__(self, url, *args, **kwargs):
+        self.loop = kwargs.pop('loop', None)
+        max_workers = kwargs.pop('max_workers', self.DEFAULT_MAX_WORKERS)
+
+        super(AsyncTransport, self).__init__(url, *args, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def execute_request_method(self, method, *args, **kwargs):
+        result = super(AsyncTransport, self).execute_request_method(
+            method, *args, **kwargs)
+
+        if asyncio.isfuture(result):
+            return result
+
+        # The method didn't generate a request. Hand its value back as an
+        # awaitable anyway, so that callers can always await request methods.
+        future = self._get_loop().create_future()
+        future.set_result(result)
+
+        return future
+
+    def execute_batch(self, requests, *args, **kwargs):
+        """Execute several HttpRequests concurrently.
+
+        This returns an awaitable for the list of results described in
+        :py:meth:`SyncTransport.execute_batch`.
+        """
+        return self._get_loop().run_in_executor(
+            self.executor,
+            partial(super(AsyncTransport, self).execute_batch,
+                    requests, *args, **kwargs))
+
+    def get_all_pages(self, list_resource, max_workers=None):
+        """Fetch all pages of a list resource.
+
+        This returns an awaitable for a list of all pages, starting with
+        list_resource itself. If max_workers is provided, the remaining
+        pages are fetched concurrently, as with
+        :py:meth:`rbtools.api.resource.ListResource.parallel_pages`.
+        Otherwise, the ``next`` link of each page is followed in turn.
+        """
+        return self._get_loop().run_in_executor(
+            self.executor,
+            partial(self._get_all_pages, list_resource, max_workers))
+
+    def get_all_items(self, list_resource, max_workers=None):
+        """Fetch all item resources in all pages of a list resource.
+
+        This returns an awaitable for a list of the items. See
+        :py:meth:`get_all_pages` for the meaning of max_workers.
+        """
+        def get_all_items():
+            return [
+                item
+                for page in self._get_all_pages(list_resource, max_workers)
+                for item in page
+            ]
+
+        return self._get_loop().run_in_executor(self.executor, get_all_items)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        super(AsyncTransport, self).close()
+
+    def stream_list(self, request):
+        """Carry out an HttpRequest for a page of a list resource.
+
+        Items are decoded incrementally as a list is iterated, which would
+        block the event loop, so this returns None without making the
+        request, like transports which can't decode responses
+        incrementally.
+        """
+        return None
+
+    def _execute_request(self, request, make_result=None):
+        """Execute an HTTPRequest on a worker thread.
+
+        This returns an awaitable for the result of make_result (by
+        default, the resource constructed from the response payload).
+        """
+        return self._get_loop().run_in_executor(
+            self.executor,
+            partial(super(AsyncTransport, self)._execute_request,
+                    request, make_result))
+
+    def _get_all_pages(self, list_resource, max_workers):
+        """Fetch all pages of a list resource on the current thread."""
+        pages = [list_resource]
+        page_urls = None
+
+        if max_workers:
+            page_urls = list_resource._get_page_urls()
+
+        if page_urls is not None:
+            results = SyncTransport.execute_batch(
+                self,
+                [HttpRequest(url) for url in page_urls],
+                max_workers=max_workers)
+
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+
+            pages += results
+        else:
+            page = list_resource
+
+            while 'next' in page._links:
+                page = SyncTransport._execute_request(
+                    self, HttpRequest(page._links['next']['href']))
+                pages.append(page)
+
+        return pages
+
+    def _get_loop(self):
+        if self.loop is not None:
+            return self.loop
+
+        # get_running_loop() was added in Python 3.7.
+        get_running_loop = getattr(asyncio, 'get_running_loop',
+                                   asyncio.get_event_loop)
+
+        return get_running_loop()
@@ -1,11 +1,103 @@
+import copy
+import hashlib
+import re
 import logging
+import time
+from multiprocessing.pool import ThreadPool
 
-from rbtools.api.decode import decode_response
+from io import BytesIO
+
+import six
+
+from rbtools.api.cache import (APICache, CachedHTTPResponse, HTTPResponse,
+                               ResourceCache)
+from rbtools.api.decode import decode_response, decode_response_stream
+from rbtools.api.errors import APIError, ServerInterfaceError
 from rbtools.api.factory import create_resource
-from rbtools.api.request import HttpRequest, ReviewBoardServer
+from rbtools.api.instrumentation import (RequestTiming, get_current_timing,
+                                         timing_context)
+from rbtools.api.projection import Projection
+from rbtools.api.request import (HttpRequest, RB_COOKIE_NAME,
+                                 ReviewBoardServer)
 from rbtools.api.transport import Transport
 
 
+_TEMPLATE_PARAM_RE = re.compile(r'\{(?P<key>[A-Za-z_0-9]*)\}')
+
+
+def _match_root_url(url, root):
+    """Return how a URL was built from a root resource payload.
+
+    This returns a ('template', name, values) tuple for a URL expanded from
+    one of the URI templates of root, or a ('link', name, rest) tuple for a
+    URL under one of its links, other than its 'self' link. None is
+    returned if the URL wasn't built from root.
+    """
+    path = url.partition('?')[0]
+    templates = sorted(six.iteritems(root.get('uri_templates', {})),
+                       key=lambda item: len(item[1]),
+                       reverse=True)
+
+    for name, template in templates:
+        pattern = ''.join(
+            '(?P<%s>[^/]+)' % part if i % 2 else re.escape(part)
+            for i, part in enumerate(_TEMPLATE_PARAM_RE.split(template)))
+
+        try:
+            m = re.match(pattern + '$', path)
+        except re.error:
+            # The template repeats a key.
+            continue
+
+        if m:
+            return 'template', name, m.groupdict()
+
+    links = sorted(six.iteritems(root.get('links', {})),
+                   key=lambda item: len(item[1].get('href', '')),
+                   reverse=True)
+
+    for name, link in links:
+        href = link.get('href')
+
+        if name != 'self' and href and path.startswith(href):
+            return 'link', name, path[len(href):]
+
+    return None
+
+
+def _rebuild_url(url, match, root):
+    """Rebuild a URL matched by _match_root_url from another root payload.
+
+    The URL is expanded from the URI template of the same name, or moved
+    under the link of the same name. None is returned if root has no such
+    template or link.
+    """
+    kind, name, data = match
+    query = url.partition('?')[2]
+
+    if kind == 'template':
+        template = root.get('uri_templates', {}).get(name)
+
+        if template is None:
+            return None
+
+        path = _TEMPLATE_PARAM_RE.sub(
+            lambda m: data.get(m.group('key'), m.group(0)),
+            template)
+    else:
+        link = root.get('links', {}).get(name)
+
+        if link is None:
+            return None
+
+        path = link['href'] + data
+
+    if query:
+        return '%s?%s' % (path, query)
+    else:
+        return path
+
+
 class SyncTransport(Transport):
     """A synchronous transport layer for the API client.
 
@@ -18,11 +110,48 @@ class SyncTransport(Transport):
 
     The optional session can be used to specify an 'rbsessionid'
     to use when authenticating with reviewboard.
+
+    If keep_alive is True, HTTP connections to the server are kept open
+    and reused for subsequent requests.
+
+    If compress_responses is True, compressed responses are requested from
+    the server and decoded transparently.
+
+    If compress_uploads is True, diffs are uploaded with gzip-compressed
+    request bodies.
+
+    The optional retry_policy parameter takes a
+    :py:class:`rbtools.api.request.RetryPolicy`, deciding which failed
+    requests are retried.
+
+    The cache_max_size, cache_max_entries, cache_stale_while_revalidate,
+    offline and cache_server parameters control the HTTP cache for the API,
+    and root_cache_ttl sets how long the root resource is kept without
+    contacting the server. See :ref:`python-api-overview`.
+
+    The optional instrumentation parameter takes an
+    :py:class:`rbtools.api.instrumentation.Instrumentation`, which is told
+    about every request made, along with its timings.
+
+    The optional projections parameter maps the names of links and URI
+    templates to :py:class:`rbtools.api.projection.Projection` instances,
+    limiting the fields and links requested when fetching those resources.
     """
+    DEFAULT_BATCH_WORKERS = 4
+
     def __init__(self, url, cookie_file=None, username=None, password=None,
                  api_token=None, agent=None, session=None, disable_proxy=False,
-                 auth_callback=None, otp_token_callback=None, *args, **kwargs):
+                 auth_callback=None, otp_token_callback=None,
+                 keep_alive=False, compress_responses=False,
+                 compress_uploads=False, retry_policy=None,
+                 cache_max_size=APICache.DEFAULT_MAX_SIZE,
+                 cache_max_entries=APICache.DEFAULT_MAX_ENTRIES,
+                 cache_stale_while_revalidate=0, offline=False,
+                 cache_server=None, root_cache_ttl=0, instrumentation=None,
+                 projections=None, *args, **kwargs):
         super(SyncTransport, self).__init__(url, *args, **kwargs)
+        self.instrumentation = instrumentation
+        self.projections = projections or {}
         self.server = ReviewBoardServer(self.url,
                                         cookie_file=cookie_file,
                                         username=username,
@@ -31,7 +160,65 @@ class SyncTransport(Transport):
                                         session=session,
                                         disable_proxy=disable_proxy,
                                         auth_callback=auth_callback,
-                                        otp_token_callback=otp_token_callback)
+                                        otp_token_callback=otp_token_callback,
+                                        keep_alive=keep_alive,
+                                        compress_responses=compress_responses,
+                                        compress_uploads=compress_uploads,
+                                        retry_policy=retry_policy,
+                                        cache_max_size=cache_max_size,
+                                        cache_max_entries=cache_max_entries,
+                                        cache_stale_while_revalidate=(
+                                            cache_stale_while_revalidate),
+                                        offline=offline,
+                                        cache_server=cache_server)
+
+        if root_cache_ttl:
+            identity = self._get_identity(username, api_token)
+        else:
+            identity = None
+
+        if identity is not None:
+            self.resource_cache = ResourceCache(self.server.url,
+                                                identity=identity,
+                                                ttl=root_cache_ttl)
+            self._resource_cache_urls = set([
+                self.server.url,
+                self.server.url + 'info/',
+            ])
+        else:
+            self.resource_cache = None
+            self._resource_cache_urls = set()
+
+        # The payloads from the resource cache that resources were
+        # constructed from, by URL.
+        self._used_cached_payloads = {}
+
+        # The cached and refetched payloads of the root resource, once the
+        # cached one turned out to be out of date. Requests built from the
+        # cached root resource are rebuilt from the refetched one.
+        self._refetched_root_payloads = None
+
+    def _get_identity(self, username, api_token):
+        """Return a string identifying the account used for requests.
+
+        The account is identified by the username, or a hash of the API
+        token or of the session cookie. None is returned if the account
+        isn't known.
+        """
+        if username:
+            return 'user:%s' % username
+        elif api_token:
+            secret = 'token:%s' % api_token
+        else:
+            for cookie in self.server.cookie_jar:
+                if (cookie.name == RB_COOKIE_NAME and
+                    cookie.domain.lstrip('.') == self.server.domain):
+                    secret = 'session:%s' % cookie.value
+                    break
+            else:
+                return None
+
+        return hashlib.sha256(secret.encode('utf-8')).hexdigest()
 
     def get_root(self):
         return self._execute_request(HttpRequest(self.server.url))
@@ -58,6 +245,9 @@ class SyncTransport(Transport):
     def logout(self):
         self.server.logout()
 
+    def close(self):
+        self.server.close()
+
     def execute_request_method(self, method, *args, **kwargs):
         request = method(*args, **kwargs)
 
@@ -66,12 +256,209 @@ class SyncTransport(Transport):
 
         return request
 
-    def _execute_request(self, request):
-        """Execute an HTTPRequest and construct a resource from the payload"""
+    def execute_batch(self, requests, max_workers=DEFAULT_BATCH_WORKERS):
+        """Execute several HttpRequests concurrently.
+
+        Up to max_workers requests are in flight at the same time. The
+        results are returned as a list in the same order as the requests.
+        Each result is the resource constructed from the response (or None
+        for a DELETE), or the APIError or ServerInterfaceError raised while
+        carrying out that request.
+
+        Requests go through the API cache when it's enabled, so responses
+        that are still fresh in the cache don't touch the network.
+        """
+        requests = list(requests)
+
+        if not requests:
+            return []
+
+        pool = ThreadPool(min(max_workers, len(requests)))
+
+        try:
+            return pool.map(self._execute_batch_request, requests)
+        finally:
+            pool.terminate()
+
+    def _execute_batch_request(self, request):
+        """Execute an HttpRequest from a batch, capturing any API errors.
+
+        This always carries out the request synchronously, even for
+        subclasses which override _execute_request.
+        """
+        try:
+            return SyncTransport._execute_request(self, request)
+        except (APIError, ServerInterfaceError) as e:
+            return e
+
+    def stream_list(self, request):
+        """Carry out an HttpRequest for a page of a list resource.
+
+        This returns a :py:class:`rbtools.api.decode.JsonListStreamDecoder`
+        which yields the payload of each item as it's decoded from the
+        response. With the standard library's json module, only the decoded
+        item in use is held in memory, rather than the whole decoded page.
+        Faster JSON backends decode the whole page at once.
+
+        Responses that go through the API cache are received in full before
+        they're decoded.
+        """
+        return self._execute_request(request, self._make_list_stream)
+
+    def _execute_request(self, request, make_result=None):
+        """Execute an HTTPRequest and construct a resource from the payload.
+
+        The result is constructed by make_result, which defaults to
+        _make_resource_or_cached.
+        """
         logging.debug('Making HTTP %s request to %s' % (request.method,
                                                         request.url))
 
+        if make_result is None:
+            make_result = self._make_resource_or_cached
+
+        if self.instrumentation is None:
+            return make_result(request)
+
+        timing = RequestTiming(request.method, request.url)
+        self.instrumentation.request_started(timing)
+        start = time.time()
+
+        try:
+            with timing_context(timing):
+                return make_result(request)
+        except Exception as e:
+            timing.error = e.__class__.__name__
+            raise
+        finally:
+            timing.total_time = time.time() - start
+            self.instrumentation.request_finished(timing)
+
+    def _make_resource_or_cached(self, request):
+        """Construct a resource from the resource cache or the server.
+
+        Resources which can be kept in the resource cache are constructed
+        from their cached payloads, if there are any. Otherwise, the request
+        is made with _make_resource.
+        """
+        use_resource_cache = (request.method == 'GET' and
+                              request.url in self._resource_cache_urls)
+
+        if use_resource_cache:
+            cached = self.resource_cache.get(request.url)
+
+            if cached is not None:
+                logging.debug('Using the cached payload for %s',
+                              request.url)
+
+                try:
+                    resource = create_resource(
+                        self, cached['payload'], request.url,
+                        mime_type=cached['mime_type'],
+                        item_mime_type=cached['item_mime_type'])
+                    self._used_cached_payloads[request.url] = \
+                        cached['payload']
+
+                    return resource
+                except (AttributeError, KeyError, TypeError,
+                        ValueError) as e:
+                    logging.debug('Could not use the cached payload for '
+                                  '%s: %s',
+                                  request.url, e)
+                    self.resource_cache.clear()
+
+        try:
+            return self._make_resource(request,
+                                       cache_payload=use_resource_cache)
+        except APIError as e:
+            if e.http_status != 404 or request.method != 'GET':
+                raise
+
+            retry_request = self._rebuild_request(request)
+
+            if retry_request is None:
+                raise
+
+        logging.debug('Retrying the request for %s as %s',
+                      request.url, retry_request.url)
+
+        return self._make_resource(retry_request)
+
+    def _refetch_cached_payloads(self):
+        """Discard the payloads in the resource cache and fetch them again.
+
+        This is called when a request built from the cached root resource
+        gets an HTTP 404, since the cached payloads may be out of date. The
+        cached and refetched root payloads are kept for rebuilding requests.
+        """
+        logging.debug('Discarding the cached payloads for %s, which may be '
+                      'out of date',
+                      self.server.url)
+        cached_payloads = self._used_cached_payloads
+        self._used_cached_payloads = {}
+        self.resource_cache.clear()
+
+        for url, payload in six.iteritems(cached_payloads):
+            try:
+                resource = self._make_resource(HttpRequest(url),
+                                               cache_payload=True)
+            except (APIError, ServerInterfaceError) as e:
+                logging.debug('Could not fetch %s again: %s', url, e)
+                continue
+
+            if url == self.server.url:
+                self._refetched_root_payloads = (payload, resource.rsp)
+
+    def _rebuild_request(self, request):
+        """Rebuild a request made from an out of date root resource.
+
+        If the URL of the request was built from a URI template or link of
+        the cached root resource, the cached payloads are fetched again,
+        and the URL is rebuilt from the refetched root resource. This
+        returns the rebuilt request, or None if the request wasn't built
+        from the cached root resource or its URL wouldn't change.
+        """
+        cached_root = self._used_cached_payloads.get(self.server.url)
+
+        if cached_root is not None:
+            if _match_root_url(request.url, cached_root) is None:
+                return None
+
+            self._refetch_cached_payloads()
+
+        if self._refetched_root_payloads is None:
+            return None
+
+        old_root, new_root = self._refetched_root_payloads
+        match = _match_root_url(request.url, old_root)
+
+        if match is None:
+            return None
+
+        url = _rebuild_url(request.url, match, new_root)
+
+        if url is None or url == request.url:
+            return None
+
+        retry_request = copy.copy(request)
+        retry_request.url = url
+
+        return retry_request
+
+    def _make_resource(self, request, cache_payload=False):
+        """Make the HTTP request and construct a resource from the payload.
+
+        If the request is being timed, this records the timings of each
+        phase. If cache_payload is True, the payload is saved in the
+        resource cache.
+        """
+        timing = get_current_timing()
+        start = time.time()
         rsp = self.server.make_request(request)
+
+        if timing is not None:
+            timing.request_time = time.time() - start
+
         info = rsp.info()
         mime_type = info['Content-Type']
         item_content_type = info.get('Item-Content-Type', None)
@@ -80,12 +467,56 @@ class SyncTransport(Transport):
             # DELETE calls don't return any data. Everything else should.
             return None
         else:
+            start = time.time()
             payload = rsp.read()
             payload = decode_response(payload, mime_type)
 
-            return create_resource(self, payload, request.url,
-                                   mime_type=mime_type,
-                                   item_mime_type=item_content_type)
+            if timing is not None:
+                timing.decode_time = time.time() - start
+                start = time.time()
+
+            if cache_payload:
+                self.resource_cache.set(request.url, payload, mime_type,
+                                        item_content_type)
+
+            resource = create_resource(
+                self, payload, request.url,
+                mime_type=mime_type,
+                item_mime_type=item_content_type,
+                projection=Projection.from_url(request.url))
+
+            if timing is not None:
+                timing.construct_time = time.time() - start
+
+            return resource
+
+    def _make_list_stream(self, request):
+        """Make the HTTP request and return a decoder for the list payload.
+
+        ValueError is raised if the payload can't be decoded incrementally.
+        """
+        timing = get_current_timing()
+        start = time.time()
+        rsp = self.server.make_request(request)
+
+        if timing is not None:
+            timing.request_time = time.time() - start
+
+        mime_type = rsp.info()['Content-Type']
+
+        if isinstance(rsp, (CachedHTTPResponse, HTTPResponse)):
+            # Responses from the API cache have been read already, and
+            # don't support reading in chunks.
+            rsp = BytesIO(rsp.read())
+
+        decoder = decode_response_stream(rsp, mime_type)
+
+        if decoder is None:
+            raise ValueError('List payloads of type %s cannot be decoded '
+                             'incrementally'
+                             % mime_type)
+
+        return decoder
 
     def enable_cache(self):
         """Enable caching for all future HTTP requests."""
@@ -876,6 +876,10 @@ class SVNRepositoryInfo(RepositoryInfo):
     A representation of a SVN source code repository. This version knows how to
     find a matching repository on the server even if the URLs differ.
     """
+    # The number of repositories whose info is fetched at once when
+    # looking for a repository by UUID.
+    REPOSITORY_INFO_BATCH_SIZE = 4
+
     def __init__(self, path, base_path, uuid, supports_parent_diffs=False):
         RepositoryInfo.__init__(self, path, base_path,
                                 supports_parent_diffs=supports_parent_diffs)
@@ -893,7 +897,7 @@ class SVNRepositoryInfo(RepositoryInfo):
         # Reduce list of repositories to only SVN ones.
         repositories = [
             repository
-            for repository in server.get_repositories().all_items
+            for repository in server.get_repositories().parallel_items()
             if repository['tool'] == 'Subversion'
         ]
 
@@ -907,17 +911,36 @@ class SVNRepositoryInfo(RepositoryInfo):
                 return self
 
         # We didn't find our locally matched repository, so scan based on UUID.
-        for repository in repositories:
-            info = repository.get_info()
-
-            if not info or self.uuid != info['uuid']:
-                continue
-
-            repos_base_path = info['url'][len(info['root_url']):]
-            relpath = self._get_relative_path(self.base_path, repos_base_path)
-
-            if relpath:
-                return SVNRepositoryInfo(info['url'], relpath, self.uuid)
+        # Fetching the info makes the server contact each repository, so
+        # it's done a few repositories at a time, stopping at the first
+        # match.
+        batch_size = self.REPOSITORY_INFO_BATCH_SIZE
+
+        for i in range(0, len(repositories), batch_size):
+            infos = server.execute_batch(
+                [
+                    repository.get_info(internal=True)
+                    for repository in repositories[i:i + batch_size]
+                ],
+                max_workers=batch_size)
+
+            for info in infos:
+                if isinstance(info, APIError) and info.error_code == 210:
+                    # The server couldn't fetch the repository info. Ignore
+                    # those, but raise more serious errors.
+                    continue
+                elif isinstance(info, Exception):
+                    raise info
+
+                if not info or self.uuid != info['uuid']:
+                    continue
+
+                repos_base_path = info['url'][len(info['root_url']):]
+                relpath = self._get_relative_path(self.base_path,
+                                                  repos_base_path)
+
+                if relpath:
+                    return SVNRepositoryInfo(info['url'], relpath, self.uuid)
 
         # We didn't find a matching repository on the server. We'll just return
         # self and hope for the best. In reality, we'll likely fail, but we
@@ -960,7 +983,7 @@ class SVNRepositoryInfo(RepositoryInfo):
     def _split_on_slash(self, path):
         # Split on slashes, but ignore multiple slashes and throw away any
         # trailing slashes.
-        split = re.split('/*', path)
+        split = re.split('/+', path)
         if split[-1] == '':
             split = split[0:-1]
         return split
@@ -13,6 +13,7 @@ from nose import SkipTest
 from six.moves import cStringIO as StringIO
 
 from rbtools.api.capabilities import Capabilities
+from rbtools.api.errors import APIError
 from rbtools.clients import RepositoryInfo
 from rbtools.clients.bazaar import BazaarClient
 from rbtools.clients.errors import (InvalidRevisionSpecError,
@@ -21,6 +22,7 @@ from rbtools.clients.git import GitClient
 from rbtools.clients.mercurial import MercurialClient
 from rbtools.clients.perforce import PerforceClient, P4Wrapper
 from rbtools.clients.svn import SVNRepositoryInfo, SVNClient
+from rbtools.testing import TestCase
 from rbtools.tests import OptionsStub
 from rbtools.utils.checks import is_valid_version
 from rbtools.utils.filesystem import load_config, make_tempfile
@@ -1585,6 +1587,123 @@ class SVNClientTests(SCMClientTests):
                          'd41d8cd98f00b204e9800998ecf8427e')
 
 
+class SVNRepositoryStub(dict):
+    """A repository resource returning a stubbed repository info."""
+    def __init__(self, path, info):
+        super(SVNRepositoryStub, self).__init__(tool='Subversion', path=path)
+        self.info = info
+
+    def get_info(self, internal=False):
+        return self.info
+
+
+class SVNServerStub(object):
+    """A root resource for looking up repositories by UUID.
+
+    The sizes of the batches passed to execute_batch are recorded.
+    """
+    def __init__(self, repositories):
+        self.repositories = repositories
+        self.batch_sizes = []
+
+    def get_repositories(self):
+        return self
+
+    def parallel_items(self):
+        return iter(self.repositories)
+
+    def execute_batch(self, requests, max_workers=None):
+        self.batch_sizes.append(len(requests))
+
+        return requests
+
+
+class SVNRepositoryInfoTests(TestCase):
+    """Tests for SVNRepositoryInfo.find_server_repository_info."""
+    UUID = '2a8b8318-6fe8-4a3f-a9b8-9b1f2c8f3b61'
+
+    def _make_info(self, uuid, url):
+        return {
+            'uuid': uuid,
+            'url': url,
+            'root_url': 'http://svn.example.com',
+        }
+
+    def _make_repositories(self, count, **infos):
+        return [
+            SVNRepositoryStub(
+                'file:///svn/repo%d' % i,
+                infos.get('repo%d' % i,
+                          self._make_info('other-%d' % i,
+                                          'http://svn.example.com/repo%d'
+                                          % i)))
+            for i in range(count)
+        ]
+
+    def test_uuid_match_in_later_batch(self):
+        """Testing SVNRepositoryInfo.find_server_repository_info with the
+        matching UUID in a later batch
+        """
+        server = SVNServerStub(self._make_repositories(
+            7,
+            repo5=self._make_info(self.UUID,
+                                  'http://svn.example.com/repo5')))
+        info = SVNRepositoryInfo('http://svn.example.com/repo5/trunk',
+                                 '/repo5/trunk', self.UUID)
+
+        result = info.find_server_repository_info(server)
+
+        self.assertIsNot(result, info)
+        self.assertEqual(result.path, 'http://svn.example.com/repo5')
+        self.assertEqual(result.base_path, '/trunk')
+        self.assertEqual(server.batch_sizes, [4, 3])
+
+    def test_repository_info_error_skipped(self):
+        """Testing SVNRepositoryInfo.find_server_repository_info skips
+        repositories whose info can't be fetched
+        """
+        server = SVNServerStub(self._make_repositories(
+            3,
+            repo0=APIError(500, 210),
+            repo2=self._make_info(self.UUID,
+                                  'http://svn.example.com/repo2')))
+        info = SVNRepositoryInfo('http://svn.example.com/repo2/trunk',
+                                 '/repo2/trunk', self.UUID)
+
+        result = info.find_server_repository_info(server)
+
+        self.assertEqual(result.path, 'http://svn.example.com/repo2')
+        self.assertEqual(server.batch_sizes, [3])
+
+    def test_repository_info_other_error(self):
+        """Testing SVNRepositoryInfo.find_server_repository_info raises
+        other API errors
+        """
+        server = SVNServerStub(self._make_repositories(
+            2,
+            repo0=APIError(403, 101),
+            repo1=self._make_info(self.UUID,
+                                  'http://svn.example.com/repo1')))
+        info = SVNRepositoryInfo('http://svn.example.com/repo1/trunk',
+                                 '/repo1/trunk', self.UUID)
+
+        with self.assertRaises(APIError) as cm:
+            info.find_server_repository_info(server)
+
+        self.assertEqual(cm.exception.error_code, 101)
+
+    def test_no_match(self):
+        """Testing SVNRepositoryInfo.find_server_repository_info without a
+        matching repository
+        """
+        server = SVNServerStub(self._make_repositories(5))
+        info = SVNRepositoryInfo('http://svn.example.com/repo9/trunk',
+                                 '/repo9/trunk', self.UUID)
+
+        self.assertIs(info.find_server_repository_info(server), info)
+        self.assertEqual(server.batch_sizes, [4, 1])
+
+
 class P4WrapperTests(RBTestBase):
     def is_supported(self):
         return True
@@ -12,9 +12,12 @@ from six.moves import input
 from six.moves.urllib.parse import urlparse
 
 from rbtools import get_version_string
+from rbtools.api.cache import APICache
 from rbtools.api.capabilities import Capabilities
 from rbtools.api.client import RBClient
 from rbtools.api.errors import APIError, ServerInterfaceError
+from rbtools.api.instrumentation import HTTPProfiler
+from rbtools.api.request import RetryPolicy
 from rbtools.clients import scan_usable_client
 from rbtools.clients.errors import OptionsCheckError
 from rbtools.utils.filesystem import (cleanup_tempfiles, get_home_path,
@@ -159,12 +162,19 @@ class Command(object):
 
     ``option_list`` is a list of command line options for the command.
     Each list entry should be an Option or OptionGroup instance.
+
+    ``api_projections`` maps the names of API links and URI templates to
+    :py:class:`rbtools.api.projection.Projection` instances, declaring the
+    fields and links the command uses from those resources. Only those are
+    requested from the server, unless ``only_fields`` or ``only_links`` are
+    passed explicitly.
     """
     name = ''
     author = ''
     description = ''
     args = ''
     option_list = []
+    api_projections = {}
     _global_options = [
         Option('-d', '--debug',
                action='store_true',
@@ -174,6 +184,21 @@ class Command(object):
                help='Displays debug output.',
                extended_help='This information can be valuable when debugging '
                              'problems running the command.'),
+        Option('--profile-http',
+               action='store_true',
+               dest='profile_http',
+               default=False,
+               help='Prints the timings of all HTTP requests made to the '
+                    'Review Board server when the command exits.',
+               added_in='0.8'),
+        Option('--profile-http-format',
+               dest='profile_http_format',
+               metavar='FORMAT',
+               choices=('table', 'json'),
+               default='table',
+               help='The format used for --profile-http. This can be '
+                    '"table" (the default) or "json".',
+               added_in='0.8'),
     ]
 
     server_options = OptionGroup(
@@ -194,6 +219,120 @@ class Command(object):
                    default=True,
                    help='Prevents requests from going through a proxy '
                         'server.'),
+            Option('--keep-alive',
+                   action='store_true',
+                   dest='enable_keep_alive',
+                   config_key='ENABLE_KEEP_ALIVE',
+                   default=False,
+                   help='Reuses persistent connections to the Review Board '
+                        'server for subsequent requests, instead of opening '
+                        'a new connection for every request.',
+                   added_in='0.8'),
+            Option('--compress-responses',
+                   action='store_true',
+                   dest='compress_responses',
+                   config_key='COMPRESS_RESPONSES',
+                   default=False,
+                   help='Asks the Review Board server, or a proxy in front '
+                        'of it, for gzip- or deflate-compressed responses. '
+                        'This can greatly reduce the amount of data '
+                        'downloaded for large diffs.',
+                   added_in='0.8'),
+            Option('--compress-uploads',
+                   action='store_true',
+                   dest='compress_uploads',
+                   config_key='COMPRESS_UPLOADS',
+                   default=False,
+                   help='Sends diffs to the Review Board server '
+                        'gzip-compressed, which speeds up posting over slow '
+                        'links. If the server does not accept compressed '
+                        'uploads, they are sent uncompressed instead.',
+                   added_in='0.8'),
+            Option('--http-retries',
+                   dest='http_retries',
+                   metavar='COUNT',
+                   type=int,
+                   config_key='HTTP_RETRIES',
+                   default=3,
+                   help='The number of times to retry GET requests that '
+                        'fail because the Review Board server could not be '
+                        'reached or was temporarily unavailable (HTTP 429, '
+                        '502, 503 or 504). Retries are made with an '
+                        'exponential backoff.',
+                   added_in='0.8'),
+            Option('--http-retry-max-wait',
+                   dest='http_retry_max_wait',
+                   metavar='SECONDS',
+                   type=int,
+                   config_key='HTTP_RETRY_MAX_WAIT',
+                   default=30,
+                   help='The maximum total number of seconds to wait '
+                        'between retries of a request.',
+                   added_in='0.8'),
+            Option('--cache-max-size',
+                   dest='cache_max_size',
+                   metavar='MEGABYTES',
+                   type=int,
+                   config_key='CACHE_MAX_SIZE',
+                   default=APICache.DEFAULT_MAX_SIZE // (1024 * 1024),
+                   help='The maximum size of the HTTP cache for the API. '
+                        'The least recently used responses are removed '
+                        'from the cache when it grows larger than this.',
+                   added_in='0.8'),
+            Option('--cache-max-entries',
+                   dest='cache_max_entries',
+                   metavar='COUNT',
+                   type=int,
+                   config_key='CACHE_MAX_ENTRIES',
+                   default=APICache.DEFAULT_MAX_ENTRIES,
+                   help='The maximum number of responses kept in the HTTP '
+                        'cache for the API.',
+                   added_in='0.8'),
+            Option('--cache-stale-while-revalidate',
+                   dest='cache_stale_while_revalidate',
+                   metavar='SECONDS',
+                   type=int,
+                   config_key='CACHE_STALE_WHILE_REVALIDATE',
+                   default=0,
+                   help='Uses responses in the HTTP cache for the API that '
+                        'expired less than this many seconds ago right '
+                        'away, and checks them with the Review Board '
+                        'server in the background. Results may be out of '
+                        'date by up to this long.',
+                   added_in='0.8'),
+            Option('--cache-server',
+                   dest='cache_server',
+                   metavar='SOCKET',
+                   config_key='CACHE_SERVER',
+                   default=None,
+                   help='Shares the HTTP cache for the API with other RBTools '
+                        'commands through the server started by '
+                        '"rbt cache-server", listening on the given socket '
+                        'path. If the server cannot be reached, the local '
+                        'cache is used.',
+                   added_in='0.8'),
+            Option('--cache-root-ttl',
+                   dest='cache_root_ttl',
+                   metavar='SECONDS',
+                   type=int,
+                   config_key='CACHE_ROOT_TTL',
+                   default=0,
+                   help='Keeps the root resource and server information '
+                        'of the Review Board server for this many seconds, '
+                        'so that commands run within that time do not have '
+                        'to fetch them first. Changes to the server (such '
+                        'as upgrades) may not be noticed until they expire.',
+                   added_in='0.8'),
+            Option('--offline',
+                   action='store_true',
+                   dest='offline',
+                   default=False,
+                   help='Answers all requests to the Review Board server '
+                        'from the HTTP cache for the API, without '
+                        'contacting the server. Commands that need data '
+                        'which is not in the cache, or that change data on '
+                        'the server, will fail.',
+                   added_in='0.8'),
             Option('--username',
                    dest='username',
                    metavar='USERNAME',
@@ -443,6 +582,8 @@ class Command(object):
 
     def __init__(self):
         self.log = logging.getLogger('rb.%s' % self.name)
+        self._api_clients = []
+        self._http_profiler = None
 
     def create_parser(self, config, argv=[]):
         """Create and return the argument parser for this command."""
@@ -551,6 +692,9 @@ class Command(object):
 
         self.init_logging()
 
+        if self.options.profile_http:
+            self._http_profiler = HTTPProfiler()
+
         try:
             exit_code = self.main(*args) or 0
         except CommandError as e:
@@ -574,6 +718,15 @@ class Command(object):
             logging.critical(e)
             exit_code = 1
 
+        for api_client in self._api_clients:
+            api_client.close()
+
+        if self._http_profiler is not None:
+            if self.options.profile_http_format == 'json':
+                sys.stderr.write(self._http_profiler.to_json() + '\n')
+            else:
+                sys.stderr.write(self._http_profiler.to_table() + '\n')
+
         cleanup_tempfiles()
         sys.exit(exit_code)
 
@@ -683,7 +836,23 @@ class Command(object):
                         api_token=self.options.api_token,
                         auth_callback=self.credentials_prompt,
                         otp_token_callback=self.otp_token_prompt,
-                        disable_proxy=not self.options.enable_proxy)
+                        disable_proxy=not self.options.enable_proxy,
+                        keep_alive=self.options.enable_keep_alive,
+                        compress_responses=self.options.compress_responses,
+                        compress_uploads=self.options.compress_uploads,
+                        retry_policy=RetryPolicy(
+                            max_retries=self.options.http_retries,
+                            max_total_wait=self.options.http_retry_max_wait),
+                        cache_max_size=(self.options.cache_max_size *
+                                        1024 * 1024),
+                        cache_max_entries=self.options.cache_max_entries,
+                        cache_stale_while_revalidate=(
+                            self.options.cache_stale_while_revalidate),
+                        offline=self.options.offline,
+                        cache_server=self.options.cache_server,
+                        root_cache_ttl=self.options.cache_root_ttl,
+                        instrumentation=self._http_profiler,
+                        projections=self.api_projections)
 
     def get_api(self, server_url):
         """Returns an RBClient instance and the associated root resource.
@@ -695,6 +864,7 @@ class Command(object):
             server_url = '%s%s' % ('http://', server_url)
 
         api_client = self._make_api_client(server_url)
+        self._api_clients.append(api_client)
 
         try:
             api_root = api_client.get_root()
@@ -34,8 +34,7 @@ class Attach(Command):
         request = get_review_request(request_id, api_root)
 
         try:
-            with open(path_to_file, 'rb') as f:
-                content = f.read()
+            f = open(path_to_file, 'rb')
         except IOError:
             raise CommandError('%s is not a valid file.' % path_to_file)
 
@@ -43,9 +42,12 @@ class Attach(Command):
         # use the original filename.
         filename = self.options.filename or os.path.basename(path_to_file)
 
+        # The file is streamed from disk as it's uploaded, rather than being
+        # read into memory first.
         try:
-            request.get_file_attachments().upload_attachment(
-                filename, content, self.options.caption)
+            with f:
+                request.get_file_attachments().upload_attachment(
+                    filename, f, self.options.caption)
         except APIError as e:
             raise CommandError('Error uploading file: %s' % e)
 
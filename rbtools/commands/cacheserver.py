@@ -0,0 +1,45 @@
+from __future__ import unicode_literals
+
+import logging
+
+from rbtools.api.cache_server import APICacheServer
+from rbtools.commands import Command, CommandError, Option
+
+
+class CacheServer(Command):
+    """Run a server that shares the HTTP cache for the API.
+
+    Other RBTools commands use the server's cache when they're run with
+    --cache-server (or CACHE_SERVER in .reviewboardrc) set to its socket
+    path. The server runs until it's interrupted.
+    """
+    name = 'cache-server'
+    author = 'The Review Board Project'
+    description = ('Run a server that shares the HTTP cache for the API '
+                   'between RBTools commands.')
+    option_list = [
+        Option('--socket',
+               dest='socket_path',
+               metavar='PATH',
+               default=APICacheServer.SOCKET_PATH,
+               help='The path of the Unix socket to listen on.',
+               added_in='0.8'),
+    ]
+
+    def main(self):
+        """Run the server."""
+        try:
+            server = APICacheServer(self.options.socket_path)
+        except (IOError, OSError) as e:
+            raise CommandError('Could not start the API cache server: %s'
+                               % e)
+
+        logging.info('Sharing the HTTP cache for the API on %s',
+                     server.socket_path)
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
@@ -440,6 +440,8 @@ class Post(Command):
                         u'The generated diff file was empty. This '
                         u'usually means no files were\n'
                         u'modified in this change.\n')
+                elif e.error_code == 207:
+                    error_msg.append(u'%s: %s\n' % (e.rsp['file'], e))
                 else:
                     error_msg.append(str(e).decode('utf-8') + u'\n')
 
@@ -567,6 +569,58 @@ class Post(Command):
 
         return confirm(question)
 
+    def validate_diff(self, api_root, repository, diff, parent_diff,
+                      base_dir, base_commit_id):
+        """Validate the diff with the server before posting it.
+
+        This ensures that the diffs can be parsed and that all referenced
+        files can be found.
+        """
+        # Review Board 2.0.14+ (with the diffs.validation.base_commit_ids
+        # capability) is required to successfully validate against hosting
+        # services that need a base_commit_id. This is basically due to
+        # the limitations of a couple Git-specific hosting services
+        # (Beanstalk, Bitbucket, and Unfuddle).
+        #
+        # In order to validate, we need to either not be dealing with a
+        # base commit ID (--diff-filename), or be on a new enough version
+        # of Review Board, or be using a non-Git repository.
+        can_validate_base_commit_ids = \
+            self.tool.capabilities.has_capability('diffs', 'validation',
+                                                  'base_commit_ids')
+
+        if (not base_commit_id or
+            can_validate_base_commit_ids or
+            self.tool.name != 'Git'):
+            # We can safely validate this diff before posting it, but we
+            # need to ensure we only pass base_commit_id if the capability
+            # is set.
+            validate_kwargs = {}
+
+            if can_validate_base_commit_ids:
+                validate_kwargs['base_commit_id'] = base_commit_id
+
+            try:
+                diff_validator = api_root.get_diff_validation()
+                diff_validator.validate_diff(
+                    repository,
+                    diff,
+                    parent_diff=parent_diff,
+                    base_dir=base_dir,
+                    **validate_kwargs)
+            except APIError as e:
+                msg_prefix = ''
+
+                if e.error_code == 207:
+                    msg_prefix = '%s: ' % e.rsp['file']
+
+                raise CommandError('Error validating diff\n\n%s%s' %
+                                   (msg_prefix, e))
+            except AttributeError:
+                # The server doesn't have a diff validation resource. Post as
+                # normal.
+                pass
+
     def main(self, *args):
         """Create and update review requests."""
         # The 'args' tuple must be made into a list for some of the
@@ -647,54 +701,6 @@ class Post(Command):
         if len(diff) == 0:
             raise CommandError("There don't seem to be any diffs!")
 
-        # Validate the diffs to ensure that they can be parsed and that
-        # all referenced files can be found.
-        #
-        # Review Board 2.0.14+ (with the diffs.validation.base_commit_ids
-        # capability) is required to successfully validate against hosting
-        # services that need a base_commit_id. This is basically due to
-        # the limitations of a couple Git-specific hosting services
-        # (Beanstalk, Bitbucket, and Unfuddle).
-        #
-        # In order to validate, we need to either not be dealing with a
-        # base commit ID (--diff-filename), or be on a new enough version
-        # of Review Board, or be using a non-Git repository.
-        can_validate_base_commit_ids = \
-            self.tool.capabilities.has_capability('diffs', 'validation',
-                                                  'base_commit_ids')
-
-        if (not base_commit_id or
-            can_validate_base_commit_ids or
-            self.tool.name != 'Git'):
-            # We can safely validate this diff before posting it, but we
-            # need to ensure we only pass base_commit_id if the capability
-            # is set.
-            validate_kwargs = {}
-
-            if can_validate_base_commit_ids:
-                validate_kwargs['base_commit_id'] = base_commit_id
-
-            try:
-                diff_validator = api_root.get_diff_validation()
-                diff_validator.validate_diff(
-                    repository,
-                    diff,
-                    parent_diff=parent_diff,
-                    base_dir=base_dir,
-                    **validate_kwargs)
-            except APIError as e:
-                msg_prefix = ''
-
-                if e.error_code == 207:
-                    msg_prefix = '%s: ' % e.rsp['file']
-
-                raise CommandError('Error validating diff\n\n%s%s' %
-                                   (msg_prefix, e))
-            except AttributeError:
-                # The server doesn't have a diff validation resource. Post as
-                # normal.
-                pass
-
         if repository_info.supports_changesets and 'changenum' in diff_info:
             changenum = diff_info['changenum']
             commit_id = changenum
@@ -724,6 +730,14 @@ class Post(Command):
         if self.options.include_files:
             commit_id = None
 
+        if not self.options.rid:
+            # Validate the diff before creating a new review request, so that
+            # a bad diff doesn't leave behind a review request without one.
+            # When updating an existing review request, uploading the diff
+            # reports the same errors, so it isn't sent to the server twice.
+            self.validate_diff(api_root, repository, diff, parent_diff,
+                               base_dir, base_commit_id)
+
         request_id, review_url = self.post_request(
             repository_info,
             repository,
@@ -2,6 +2,7 @@ from __future__ import print_function, unicode_literals
 
 import logging
 
+from rbtools.api.projection import Projection
 from rbtools.commands import Command, Option
 from rbtools.utils.repository import get_repository_id
 from rbtools.utils.users import get_username
@@ -25,6 +26,10 @@ class Status(Command):
         Command.perforce_options,
         Command.tfs_options,
     ]
+    api_projections = {
+        'review_requests': Projection(fields=['id', 'summary', 'draft'],
+                                      links=['draft']),
+    }
 
     def output_request(self, request):
         print('   r/%s - %s' % (request.id, request.summary))
@@ -65,7 +70,7 @@ class Status(Command):
 
         requests = api_root.get_review_requests(**query_args)
 
-        for request in requests.all_items:
+        for request in requests.parallel_items():
             if request.draft:
                 self.output_draft(request, request.draft[0])
             else:
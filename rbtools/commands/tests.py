@@ -0,0 +1,201 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+
+import six
+
+from rbtools.api.errors import APIError
+from rbtools.commands import CommandError
+from rbtools.commands.post import Post
+from rbtools.testing import TestCase
+
+
+class CapabilitiesStub(object):
+    def has_capability(self, *args):
+        return False
+
+
+class ToolStub(object):
+    name = 'Git'
+    capabilities = CapabilitiesStub()
+    supports_diff_exclude_patterns = True
+
+
+class RepositoryInfoStub(object):
+    base_path = '/'
+    supports_changesets = False
+
+    def find_server_repository_info(self, api_root):
+        return self
+
+
+class DiffValidatorStub(object):
+    def __init__(self, error=None):
+        self.error = error
+        self.validated = []
+
+    def validate_diff(self, repository, diff, **kwargs):
+        self.validated.append((repository, diff))
+
+        if self.error is not None:
+            raise self.error
+
+
+class DiffListStub(object):
+    def __init__(self, error=None):
+        self.error = error
+
+    def upload_diff(self, diff, **kwargs):
+        if self.error is not None:
+            raise self.error
+
+
+class ReviewRequestStub(object):
+    absolute_url = 'http://reviews.example.com/r/1/'
+    status = 'pending'
+
+    def __init__(self, diffs):
+        self.diffs = diffs
+
+    def get_diffs(self, **kwargs):
+        return self.diffs
+
+
+class RootStub(object):
+    def __init__(self, diff_validator=None, review_request=None):
+        self.diff_validator = diff_validator or DiffValidatorStub()
+        self.review_request = review_request
+
+    def get_diff_validation(self):
+        return self.diff_validator
+
+    def get_review_request(self, **kwargs):
+        return self.review_request
+
+
+class PostStub(Post):
+    """A post command which talks to stubs instead of a repository and a
+    server.
+    """
+    def __init__(self, api_root):
+        super(PostStub, self).__init__()
+        self.api_root = api_root
+        self.posted = []
+
+    def initialize_scm_tool(self, client_name=None):
+        return RepositoryInfoStub(), ToolStub()
+
+    def get_server_url(self, repository_info, tool):
+        return 'http://reviews.example.com/'
+
+    def get_api(self, server_url):
+        return None, self.api_root
+
+    def setup_tool(self, tool, api_root=None):
+        pass
+
+    def post_request(self, repository_info, repository, server_url,
+                     api_root, review_request_id=None, **kwargs):
+        self.posted.append(review_request_id)
+
+        return review_request_id or 1, 'http://reviews.example.com/r/1/'
+
+
+class PostCommandTests(TestCase):
+    """Tests for rbt post."""
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.diff_filename = os.path.join(self.tempdir, 'diff')
+
+        with open(self.diff_filename, 'wb') as fp:
+            fp.write(b'--- foo.c\n+++ foo.c\n')
+
+        # The command prints the URL of the posted review request.
+        self._old_stdout = sys.stdout
+        sys.stdout = six.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self._old_stdout
+        shutil.rmtree(self.tempdir)
+
+    def _make_command(self, api_root, args=[]):
+        command = PostStub(api_root)
+        command.options = command.create_parser({}).parse_args(
+            ['--diff-filename', self.diff_filename,
+             '--repository', 'repo'] + args)
+        command.tool = ToolStub()
+
+        return command
+
+    def _make_file_error(self):
+        return APIError(400, 207, {
+            'file': 'foo.c',
+            'err': {
+                'code': 207,
+                'msg': 'The file was not found in the repository',
+            },
+        })
+
+    def test_new_review_request_validates_diff(self):
+        """Testing rbt post validates the diff for a new review request"""
+        api_root = RootStub()
+        command = self._make_command(api_root)
+        command.main()
+
+        self.assertEqual(api_root.diff_validator.validated,
+                         [('repo', b'--- foo.c\n+++ foo.c\n')])
+        self.assertEqual(command.posted, [None])
+
+    def test_update_skips_diff_validation(self):
+        """Testing rbt post -r does not validate the diff before uploading
+        it
+        """
+        api_root = RootStub()
+        command = self._make_command(api_root, ['-r', '42'])
+        command.main()
+
+        self.assertEqual(api_root.diff_validator.validated, [])
+        self.assertEqual(command.posted, ['42'])
+
+    def test_validation_file_not_found(self):
+        """Testing rbt post reports the file when validation fails with
+        error 207
+        """
+        api_root = RootStub(DiffValidatorStub(self._make_file_error()))
+        command = self._make_command(api_root)
+
+        with self.assertRaises(CommandError) as cm:
+            command.main()
+
+        self.assertEqual(
+            six.text_type(cm.exception),
+            'Error validating diff\n\n'
+            'foo.c: The file was not found in the repository '
+            '(HTTP 400, API Error 207)')
+        self.assertEqual(command.posted, [])
+
+    def test_upload_file_not_found(self):
+        """Testing rbt post -r reports the file when uploading the diff
+        fails with error 207
+        """
+        review_request = ReviewRequestStub(
+            DiffListStub(self._make_file_error()))
+        api_root = RootStub(review_request=review_request)
+        command = self._make_command(api_root, ['-r', '1'])
+
+        with self.assertRaises(CommandError) as cm:
+            Post.post_request(command, RepositoryInfoStub(), 'repo',
+                              'http://reviews.example.com/', api_root,
+                              review_request_id=1,
+                              diff_content=b'--- foo.c\n+++ foo.c\n')
+
+        message = six.text_type(cm.exception)
+        self.assertIn('foo.c: The file was not found in the repository '
+                      '(HTTP 400, API Error 207)\n',
+                      message)
+        self.assertIn('Your review request still exists, but the diff is '
+                      'not attached.\n',
+                      message)
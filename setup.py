@@ -71,6 +71,7 @@ elif sys.hexversion < 0x02070000:
 rb_commands = [
     'api-get = rbtools.commands.api_get:APIGet',
     'attach = rbtools.commands.attach:Attach',
+    'cache-server = rbtools.commands.cacheserver:CacheServer',
     'clear-cache = rbtools.commands.clearcache:ClearCache',
     'close = rbtools.commands.close:Close',
     'diff = rbtools.commands.diff:Diff',